@@ -0,0 +1,175 @@
+"""
+Archive of past meetings.
+
+``manage.py archivemeetings`` moves meetings, and series, which ended before a
+cutoff from `Meeting` to `ArchivedMeeting` together with their participants,
+so the hot tables and their indexes only grow with recent and upcoming
+meetings. `TenantArchive` records the cutoff of each tenant; reads whose
+window reaches back before it read both tables, merged by `ArchiveUnion`.
+Archived meetings are moved back by `restore` before they are changed.
+"""
+
+import heapq
+from itertools import chain
+from django.db import router, transaction
+from django.db.models import Q
+from api.caching import quiet_changes
+from api.models import ArchivedMeeting, Meeting, TenantArchive
+
+ARCHIVED_FIELDS = [
+    "id",
+    "owner_id",
+    "event_name",
+    "meeting_agenda",
+    "start",
+    "end",
+    "location_id",
+    "recurrence",
+    "recurrence_end",
+    "tenant_id",
+]
+
+
+def archivable(cutoff):
+    """Meetings, or series, which ended before `cutoff`."""
+    single = Q(recurrence="", end__lt=cutoff)
+    series = ~Q(recurrence="") & Q(recurrence_end__lt=cutoff)
+    # The bound on `start` keeps the scan on the tenant's start index.
+    return Q(start__lt=cutoff) & (single | series)
+
+
+def archive_cutoff(tenant_id, using=None):
+    """Return the tenant's cutoff, `None` if nothing was archived."""
+    archive = (
+        TenantArchive.objects.db_manager(using).filter(tenant_id=tenant_id).first()
+    )
+    return archive.cutoff if archive is not None else None
+
+
+def reaches_archive(tenant_id, window_start, using=None):
+    """Whether meetings ending after `window_start` (`None`: any) may be archived."""
+    cutoff = archive_cutoff(tenant_id, using)
+    return cutoff is not None and (window_start is None or window_start < cutoff)
+
+
+def meeting_models(tenant_id, window_start):
+    """Models holding the tenant's meetings which end after `window_start`."""
+    if reaches_archive(tenant_id, window_start):
+        return [Meeting, ArchivedMeeting]
+    return [Meeting]
+
+
+def raise_cutoff(tenant_id, cutoff):
+    """Make lists reaching back before `cutoff` read the archive."""
+    archive, created = TenantArchive.objects.get_or_create(
+        tenant_id=tenant_id, defaults={"cutoff": cutoff}
+    )
+    if not created and archive.cutoff < cutoff:
+        TenantArchive.objects.filter(tenant_id=tenant_id).update(cutoff=cutoff)
+
+
+def archive_batch(tenant_id, cutoff, size):
+    """Move up to `size` of the tenant's meetings ended before `cutoff`; return how many."""
+    with transaction.atomic(using=router.db_for_write(Meeting)):
+        meetings = list(
+            Meeting.objects.filter(archivable(cutoff), tenant_id=tenant_id)
+            .order_by("start", "id")
+            .values(*ARCHIVED_FIELDS)[:size]
+        )
+        ids = [meeting["id"] for meeting in meetings]
+        through = Meeting.participant_list.through
+        archived_through = ArchivedMeeting.participant_list.through
+        participations = through.objects.filter(meeting_id__in=ids)
+
+        ArchivedMeeting.objects.bulk_create(
+            ArchivedMeeting(**meeting) for meeting in meetings
+        )
+        archived_through.objects.bulk_create(
+            archived_through(archivedmeeting_id=meeting_id, apiuser_id=apiuser_id)
+            for meeting_id, apiuser_id in participations.values_list(
+                "meeting_id", "apiuser_id"
+            )
+        )
+        participations.delete()
+        # The caller records one change per tenant.
+        with quiet_changes():
+            Meeting.objects.filter(id__in=ids).delete()
+    return len(ids)
+
+
+def restore(meeting_id):
+    """Move an archived meeting back to `Meeting`, so it can be changed."""
+    with transaction.atomic(using=router.db_for_write(Meeting)):
+        meeting = ArchivedMeeting.objects.values(*ARCHIVED_FIELDS).get(id=meeting_id)
+        participations = ArchivedMeeting.participant_list.through.objects.filter(
+            archivedmeeting_id=meeting_id
+        )
+        Meeting.objects.bulk_create([Meeting(**meeting)])
+        through = Meeting.participant_list.through
+        through.objects.bulk_create(
+            through(meeting_id=meeting_id, apiuser_id=apiuser_id)
+            for apiuser_id in participations.values_list("apiuser_id", flat=True)
+        )
+        participations.delete()
+        ArchivedMeeting.objects.filter(id=meeting_id).delete()
+
+
+class ArchiveUnion:
+    """
+    Rows of a hot and an archived queryset, read as one queryset.
+
+    Supports what event lists, exports, `KeysetPagination` and `keyset_chunks`
+    need: `filter`, `order_by` (all ascending or all descending), slicing and
+    iteration, of `values()` rows or model instances. Ordered rows are
+    merged from both querysets, each read only up to the end of the slice.
+    """
+
+    def __init__(self, hot, archived, ordering=()):
+        self.hot = hot
+        self.archived = archived
+        self.ordering = ordering
+
+    @property
+    def model(self):
+        return self.hot.model
+
+    @property
+    def db(self):
+        return self.hot.db
+
+    def filter(self, *args, **kwargs):
+        return ArchiveUnion(
+            self.hot.filter(*args, **kwargs),
+            self.archived.filter(*args, **kwargs),
+            self.ordering,
+        )
+
+    def order_by(self, *ordering):
+        return ArchiveUnion(
+            self.hot.order_by(*ordering), self.archived.order_by(*ordering), ordering
+        )
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            raise TypeError("Archive unions can only be sliced.")
+        return list(self.merge(self.hot[: key.stop], self.archived[: key.stop]))[key]
+
+    def __iter__(self):
+        return iter(self.merge(self.hot, self.archived))
+
+    def merge(self, hot, archived):
+        if not self.ordering:
+            return chain(hot, archived)
+        names = [name.lstrip("-") for name in self.ordering]
+
+        def key(row):
+            if isinstance(row, dict):
+                return [row[name] for name in names]
+            return [getattr(row, name) for name in names]
+
+        return heapq.merge(
+            hot,
+            archived,
+            key=key,
+            reverse=self.ordering[0].startswith("-"),
+        )
@@ -0,0 +1,119 @@
+"""
+Coroutine views of the events and rooms endpoints, for ASGI servers.
+
+Django runs synchronous views under ASGI one at a time in a single shared
+thread, so a slow request holds up every other one. These views wrap the
+same viewsets, but do their database work and rendering in one hop to the
+thread pool, leaving the event loop free to serve other clients meanwhile.
+
+`ASGIHandler` serves streamed bodies, whose generators query the database,
+without running them in the event loop.
+"""
+
+from functools import wraps
+import django
+from asgiref.sync import sync_to_async
+from django.core.handlers import asgi
+from django.db import close_old_connections
+from django.http import HttpResponse
+
+
+def in_thread_pool(function):
+    """
+    Return a coroutine function running `function` in the default thread pool.
+
+    Pool threads hold their own database connections, so they are recycled
+    around each call as Django does around each request.
+    """
+
+    @wraps(function)
+    def call(*args, **kwargs):
+        close_old_connections()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(call, thread_sensitive=False)
+
+
+def plain_response(response):
+    """Copy a rendered response, so Django has nothing left to render in its thread."""
+    plain = HttpResponse(response.content, status=response.status_code)
+    for header, value in response.items():
+        plain[header] = value
+    plain.cookies = response.cookies
+    return plain
+
+
+def async_view(viewset, actions):
+    """Coroutine view of `viewset` serving `actions`, as in `ViewSet.as_view`."""
+    view = viewset.as_view(actions)
+
+    @in_thread_pool
+    def respond(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if hasattr(response, "render"):
+            response = plain_response(response.render())
+        return response
+
+    async def coroutine_view(request, *args, **kwargs):
+        return await respond(request, *args, **kwargs)
+
+    # Same as DRF views: CSRF is enforced by session authentication instead.
+    coroutine_view.csrf_exempt = True
+    # Read by `api.instrumentation.view_name`.
+    coroutine_view.cls = viewset
+    coroutine_view.actions = actions
+    return coroutine_view
+
+
+# Returned by `next` once a streamed body is exhausted.
+END = object()
+
+
+class ASGIHandler(asgi.ASGIHandler):
+    """
+    ASGI handler generating each chunk of streamed bodies in the thread which
+    ran the synchronous view, with its database connection.
+
+    Django 3.1 iterates them in the event loop, where the queries of export
+    and calendar feed generators raise `SynchronousOnlyOperation`.
+    """
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+        headers = [
+            (header.encode("ascii"), value.encode("latin1"))
+            for header, value in response.items()
+        ]
+        headers.extend(
+            (b"Set-Cookie", cookie.output(header="").encode("ascii").strip())
+            for cookie in response.cookies.values()
+        )
+        await send(
+            {
+                "type": "http.response.start",
+                "status": response.status_code,
+                "headers": headers,
+            }
+        )
+        parts = iter(response)
+        next_part = sync_to_async(next, thread_sensitive=True)
+        while True:
+            part = await next_part(parts, END)
+            if part is END:
+                break
+            for chunk, _last in self.chunk_bytes(part):
+                await send(
+                    {"type": "http.response.body", "body": chunk, "more_body": True}
+                )
+        await send({"type": "http.response.body"})
+        await sync_to_async(response.close, thread_sensitive=True)()
+
+
+def get_asgi_application():
+    """Like `django.core.asgi.get_asgi_application`, serving with `ASGIHandler`."""
+    django.setup(set_prefix=False)
+    return ASGIHandler()
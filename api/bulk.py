@@ -0,0 +1,196 @@
+"""Batched creation and replacement of events."""
+
+from collections import defaultdict
+from django.db import router, transaction
+from rest_framework import serializers
+from api.archive import meeting_models, reaches_archive, restore
+from api.caching import EVENTS, tenant_changed
+from api.intervals import IntervalIndex
+from api.models import APIUser, ArchivedMeeting, Location, Meeting
+from api.recurrence import conflict_window, expand, occurrences, series_end
+from api.scheduling import SERIES_COLUMNS
+from api.serializers import LOCATION_BOOKED, BulkEventSerializer
+from api.validators import MAX_MEETING_LENGTH
+
+MAX_BATCH_SIZE = 1000
+
+MEETING_FIELDS = [
+    "event_name",
+    "meeting_agenda",
+    "start",
+    "end",
+    "location",
+    "owner",
+    "recurrence",
+    "recurrence_end",
+]
+
+
+def save_events(request, data):
+    """
+    Create events, or replace the ones given by `id`, from a list of items.
+
+    Items are applied in order and each one succeeds or fails on its own; the
+    result list holds the saved `id` or the `errors` of every item. Relations
+    are resolved and conflicts checked with a fixed number of queries per batch.
+    """
+    batch = serializers.ListField(
+        child=serializers.DictField(), allow_empty=False, max_length=MAX_BATCH_SIZE
+    )
+    items = batch.run_validation(data)
+
+    results = [None] * len(items)
+    valid = {}
+    item_serializer = BulkEventSerializer(context={"request": request})
+    for index, item in enumerate(items):
+        try:
+            valid[index] = item_serializer.run_validation(item)
+        except serializers.ValidationError as exc:
+            results[index] = error(serializers.as_serializer_error(exc))
+
+    resolved = resolve(request.user, valid, results)
+    with transaction.atomic(using=router.db_for_write(Meeting)):
+        write(request.user, resolved, results)
+    return results
+
+
+def error(errors):
+    return {"status": 400, "errors": errors}
+
+
+def resolve(user, valid, results):
+    """Replace emails, location and meeting ids by objects, one query each."""
+    tenant_id = user.company_id
+    emails = {email for item in valid.values() for email in item["participant_list"]}
+    users = {
+        participant.email: participant
+        for participant in APIUser.objects.filter(
+            company_id=tenant_id, email__in=emails
+        )
+    }
+    locations = Location.objects.filter(tenant_id=tenant_id).in_bulk(
+        {item["location"] for item in valid.values()} - {None}
+    )
+    ids = {item["id"] for item in valid.values() if "id" in item}
+    if ids and reaches_archive(tenant_id, None):
+        # Archived events are moved back before they are replaced.
+        for meeting_id in (
+            ArchivedMeeting.objects.visible_to(user)
+            .filter(id__in=ids)
+            .values_list("id", flat=True)
+        ):
+            restore(meeting_id)
+    meetings = Meeting.objects.visible_to(user).in_bulk(ids)
+
+    resolved, replaced = {}, set()
+    for index, item in valid.items():
+        errors = {}
+        missing = [email for email in item["participant_list"] if email not in users]
+        if missing:
+            errors["participant_list"] = [
+                f"Object with email={email} does not exist." for email in missing
+            ]
+        location = locations.get(item["location"])
+        if item["location"] is not None and location is None:
+            errors["location"] = [
+                f'Invalid pk "{item["location"]}" - object does not exist.'
+            ]
+        meeting = meetings.get(item.get("id"))
+        if "id" in item and meeting is None:
+            errors["id"] = ["Not found."]
+        elif meeting is not None and meeting.pk in replaced:
+            errors["id"] = ["Event is already replaced by an earlier item."]
+        if errors:
+            results[index] = error(errors)
+            continue
+
+        if meeting is not None:
+            replaced.add(meeting.pk)
+        participants = [
+            users[email] for email in dict.fromkeys(item["participant_list"])
+        ]
+        resolved[index] = (item, location, meeting, participants)
+    return resolved
+
+
+def booking_occurrences(item, timezone_name):
+    """Return the conflict window of an item and its occurrences within it."""
+    start, end, recurrence = item["start"], item["end"], item.get("recurrence", "")
+    window = conflict_window(
+        start, end, recurrence, series_end(start, end, recurrence, timezone_name)
+    )
+    return window, list(occurrences(start, end, recurrence, timezone_name, *window))
+
+
+def write(user, resolved, results):
+    """Check location conflicts in one sweep and write the accepted items."""
+    # Occurrences of every booking within its conflict window.
+    booked = {
+        index: booking_occurrences(item, user.timezone)
+        for index, (item, location, _, _) in resolved.items()
+        if location
+    }
+    bookings = defaultdict(lambda: IntervalIndex(MAX_MEETING_LENGTH))
+    if booked:
+        location_ids = {resolved[index][0]["location"] for index in booked}
+        Location.objects.filter(pk__in=location_ids).lock()
+        window_start = min(window[0] for window, _ in booked.values())
+        window_end = max(window[1] for window, _ in booked.values())
+        for model in meeting_models(user.company_id, window_start):
+            existing = (
+                model.objects.filter(location__in=location_ids)
+                .overlapping(window_start, window_end)
+                .values_list(*SERIES_COLUMNS, "id", "location_id")
+            )
+            for start, end, meeting_id, location_id in expand(
+                existing, window_start, window_end
+            ):
+                bookings[location_id].add(meeting_id, start, end)
+
+    created, updated, participations = [], [], []
+    for index, (item, location, meeting, participants) in resolved.items():
+        replaced = []
+        if meeting is not None:
+            # The replaced booking no longer blocks its old slots.
+            replaced = bookings[meeting.location_id].discard(meeting.pk)
+        if location is not None:
+            if any(
+                bookings[location.pk].overlaps(start, end)
+                for start, end in booked[index][1]
+            ):
+                for start, end in replaced:
+                    bookings[meeting.location_id].add(meeting.pk, start, end)
+                results[index] = error({"location": [LOCATION_BOOKED]})
+                continue
+
+        if meeting is None:
+            meeting = Meeting(tenant_id=user.company_id)
+            created.append(meeting)
+            results[index] = {"status": 201, "id": str(meeting.pk)}
+        else:
+            updated.append(meeting)
+            results[index] = {"status": 200, "id": str(meeting.pk)}
+        for name in ["event_name", "meeting_agenda", "start", "end"]:
+            setattr(meeting, name, item[name])
+        meeting.recurrence = item.get("recurrence", "")
+        meeting.location = location
+        meeting.owner = user
+        meeting.update_recurrence_end()
+        if location is not None:
+            for start, end in booked[index][1]:
+                bookings[location.pk].add(meeting.pk, start, end)
+        participations.extend(
+            (meeting.pk, participant.pk) for participant in participants
+        )
+
+    Meeting.objects.bulk_create(created)
+    Meeting.objects.bulk_update(updated, MEETING_FIELDS)
+    through = Meeting.participant_list.through
+    through.objects.filter(meeting__in=[meeting.pk for meeting in updated]).delete()
+    through.objects.bulk_create(
+        through(meeting_id=meeting_id, apiuser_id=apiuser_id)
+        for meeting_id, apiuser_id in participations
+    )
+    if created or updated:
+        # Bulk writes send no model signals.
+        tenant_changed(user.company_id, [EVENTS])
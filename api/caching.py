@@ -0,0 +1,215 @@
+"""Validators and server-side caching of list endpoints."""
+
+import hashlib
+import time
+from contextlib import contextmanager
+from asgiref.local import Local
+from django.conf import settings
+from django.core.cache import caches
+from django.db import router, transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import urlencode
+from django.utils.timezone import get_current_timezone_name
+from rest_framework.response import Response
+from api.models import TenantVersion
+from tango_calendar.routers import current_replica, pinned
+
+EVENTS = "events"
+ROOMS = "rooms"
+
+# Set within `quiet_changes()`.
+state = Local()
+
+
+def get_cache():
+    """Return the list cache, `None` when it is disabled."""
+    alias = getattr(settings, "API_LIST_CACHE", None)
+    return caches[alias] if alias is not None else None
+
+
+@contextmanager
+def quiet_changes():
+    """
+    Skip invalidation on writes within the block, e.g. of rows changed in
+    bulk, whose caller records the change once with `tenant_changed`.
+    """
+    previous = getattr(state, "quiet", False)
+    state.quiet = True
+    try:
+        yield
+    finally:
+        state.quiet = previous
+
+
+def tenant_changed(tenant_id, scopes=(EVENTS, ROOMS)):
+    """Invalidate validators and cached lists after a write within the tenant."""
+    if getattr(state, "quiet", False):
+        return
+    TenantVersion.objects.bump(tenant_id)
+    bump_generations(tenant_id, scopes)
+    # Readers racing the transaction may have cached the old rows meanwhile.
+    transaction.on_commit(
+        lambda: bump_generations(tenant_id, scopes),
+        using=router.db_for_write(TenantVersion),
+    )
+
+
+def generation_key(scope, tenant_id):
+    return f"api:list:generation:{scope}:{tenant_id}"
+
+
+def written_key(tenant_id):
+    return f"api:list:written:{tenant_id}"
+
+
+def bump_generations(tenant_id, scopes):
+    cache = get_cache()
+    if cache is None:
+        return
+    # Replicas may lag behind the write until clients stop being pinned.
+    cache.set(
+        written_key(tenant_id),
+        True,
+        getattr(settings, "DATABASE_REPLICA_STICKINESS", 5),
+    )
+    for scope in scopes:
+        key = generation_key(scope, tenant_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Restart from the clock so an evicted counter never repeats a value.
+            cache.set(key, time.time_ns(), None)
+
+
+def get_generation(scope, tenant_id):
+    cache = get_cache()
+    key = generation_key(scope, tenant_id)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, time.time_ns(), None)
+        generation = cache.get(key)
+    return generation
+
+
+def record(outcome, scope):
+    cache = get_cache()
+    if cache is None:
+        return
+    key = f"api:list:{outcome}:{scope}"
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass
+
+
+def cache_stats():
+    """Return hit and miss counts of the list cache per scope."""
+    cache = get_cache()
+    return {
+        scope: {
+            outcome: cache.get(f"api:list:{outcome}:{scope}", 0) if cache else 0
+            for outcome in ["hits", "misses"]
+        }
+        for scope in [EVENTS, ROOMS]
+    }
+
+
+class TenantETagMixin:
+    """
+    Answer list requests with a strong ETag built from the tenant version.
+
+    Every write within a tenant bumps its version, so a matching
+    ``If-None-Match`` is answered with 304 before the queryset is built.
+    """
+
+    # Set when the listed objects depend on who is asking, not only the tenant.
+    visibility_per_user = False
+
+    def get_list_etag(self, request):
+        version = TenantVersion.objects.current(request.user.company_id)
+        parts = [
+            str(version.tenant_id),
+            str(version.version),
+            str(request.user.pk) if self.visibility_per_user else "",
+            get_current_timezone_name(),
+            request.accepted_media_type,
+            request.get_full_path(),
+        ]
+        return f'"{hashlib.sha256("|".join(parts).encode()).hexdigest()[:32]}"'
+
+    def list(self, request, *args, **kwargs):
+        etag = self.get_list_etag(request)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = super().list(request, *args, **kwargs)
+        response["ETag"] = etag
+        return response
+
+
+class ListCacheMixin:
+    """
+    Serve repeated list requests with rendered responses from the Django cache.
+
+    Keys include a per-tenant generation of ``cache_scope`` which writes bump
+    (see ``tenant_changed``), so stale entries are never read again and simply
+    expire. The generations live in the cache too, so it is only used when
+    ``API_LIST_CACHE`` names one shared by every worker.
+    """
+
+    cache_scope = None
+    visibility_per_user = False
+
+    def get_list_cache_key(self, request):
+        tenant_id = request.user.company_id
+        params = sorted(request.query_params.lists())
+        parts = [
+            str(get_generation(self.cache_scope, tenant_id)),
+            str(tenant_id),
+            str(request.user.pk) if self.visibility_per_user else "",
+            get_current_timezone_name(),
+            request.accepted_media_type,
+            request.get_host(),
+            urlencode(params, doseq=True),
+        ]
+        digest = hashlib.sha256("|".join(parts).encode()).hexdigest()
+        return f"api:list:{self.cache_scope}:{digest}"
+
+    def list(self, request, *args, **kwargs):
+        if get_cache() is None:
+            return super().list(request, *args, **kwargs)
+        key = self.get_list_cache_key(request)
+        # Clients which just wrote skip entries possibly rendered from a lagging
+        # replica, and replace them with ones read from the primary.
+        cached = None if pinned(request) else get_cache().get(key)
+        if cached is not None:
+            record("hits", self.cache_scope)
+            content, content_type = cached
+            response = HttpResponse(content, content_type=content_type)
+            response["X-Cache"] = "HIT"
+            return response
+
+        record("misses", self.cache_scope)
+        self.list_cache_key = key
+        response = super().list(request, *args, **kwargs)
+        response["X-Cache"] = "MISS"
+        return response
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        key = getattr(self, "list_cache_key", None)
+        if key is not None and isinstance(response, Response):
+            # A replica may not have the tenant's latest write yet.
+            lagging = current_replica() is not None and get_cache().get(
+                written_key(request.user.company_id)
+            )
+            if response.status_code == 200 and not lagging:
+                # Rendered here, once, so hits skip serialization and rendering.
+                response.render()
+                get_cache().set(
+                    key,
+                    (response.content, response["Content-Type"]),
+                    getattr(settings, "API_LIST_CACHE_TIMEOUT", 300),
+                )
+        return response
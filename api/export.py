@@ -0,0 +1,77 @@
+"""Streaming exports of events."""
+
+import csv
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
+from api.pagination import keyset_chunks
+from api.serializers import EventSerializer
+
+CHUNK_SIZE = 500
+
+CSV_COLUMNS = [
+    "id",
+    "owner",
+    "event_name",
+    "meeting_agenda",
+    "start",
+    "end",
+    "participant_list",
+    "location",
+    "location_name",
+    "recurrence",
+]
+
+
+def export_rows(queryset, context):
+    """Return serialized events chunk by chunk, prefetching each chunk separately."""
+    # Chunks are rendered after the view returned, when the user timezone set up by
+    # the middleware is no longer active.
+    return _export_rows(queryset, context, timezone.get_current_timezone())
+
+
+def _export_rows(queryset, context, tz):
+    for chunk in keyset_chunks(queryset, ("start", "id"), CHUNK_SIZE):
+        with timezone.override(tz):
+            yield EventSerializer(chunk, many=True, context=context).data
+
+
+def ndjson_lines(chunks):
+    encoder = JSONEncoder(ensure_ascii=False)
+    for rows in chunks:
+        yield "".join(f"{encoder.encode(row)}\n" for row in rows)
+
+
+class Echo:
+    """File-like object returning what is written, for `csv.writer`."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(chunks):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for rows in chunks:
+        yield "".join(writer.writerow(csv_row(row)) for row in rows)
+
+
+def csv_row(row):
+    location = row["location"] or {}
+    return [
+        row["id"],
+        row["owner"],
+        row["event_name"],
+        row["meeting_agenda"],
+        row["start"],
+        row["end"],
+        " ".join(row["participant_list"]),
+        location.get("id", ""),
+        location.get("name", ""),
+        row["recurrence"],
+    ]
+
+
+EXPORT_FORMATS = {
+    "ndjson": ("application/x-ndjson", ndjson_lines),
+    "csv": ("text/csv", csv_lines),
+}
@@ -0,0 +1,188 @@
+"""iCalendar (RFC 5545) feeds of events."""
+
+from bisect import bisect_right
+from datetime import datetime
+import pytz
+from django.core import signing
+from django.db.models import Min
+from django.utils import timezone
+from api.archive import ArchiveUnion
+from api.pagination import keyset_chunks
+from api.sharding import find_user
+
+CHUNK_SIZE = 500
+
+PRODUCT_ID = "-//Tango Calendar//EN"
+
+FEED_SALT = "api.ical.feed"
+
+
+def feed_token(user):
+    """Return the secret token of the user's feed URL."""
+    return signing.dumps([str(user.pk), user.feed_secret], salt=FEED_SALT)
+
+
+def feed_user(token):
+    """Return the active user of a feed token, `None` if forged or revoked."""
+    try:
+        user_id, secret = signing.loads(token, salt=FEED_SALT)
+    except (signing.BadSignature, TypeError, ValueError):
+        return None
+    return find_user(pk=user_id, is_active=True, feed_secret=secret)
+
+
+def escape(text):
+    return (
+        text.replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\r\n", "\\n")
+        .replace("\n", "\\n")
+    )
+
+
+def fold(line):
+    """Split a content line into lines of at most 75 octets."""
+    encoded = line.encode()
+    if len(encoded) <= 75:
+        return f"{line}\r\n"
+    parts, start = [], 0
+    while start < len(encoded):
+        end = min(start + (75 if not parts else 74), len(encoded))
+        # Never split a multi-byte character.
+        while end < len(encoded) and encoded[end] & 0xC0 == 0x80:
+            end -= 1
+        parts.append(encoded[start:end].decode())
+        start = end
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def format_datetime(value):
+    return value.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def format_local_datetime(value, timezone_name):
+    local = value.astimezone(pytz.timezone(timezone_name))
+    return f"TZID={timezone_name}:{local.strftime('%Y%m%dT%H%M%S')}"
+
+
+def format_naive(value):
+    # `strftime` doesn't pad years before 1000.
+    return (
+        f"{value.year:04}{value.month:02}{value.day:02}"
+        f"T{value.hour:02}{value.minute:02}{value.second:02}"
+    )
+
+
+def format_offset(offset):
+    seconds = int(offset.total_seconds())
+    sign = "-" if seconds < 0 else "+"
+    hours, rest = divmod(abs(seconds), 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{sign}{hours:02}{minutes:02}" + (f"{seconds:02}" if seconds else "")
+
+
+def timezone_lines(timezone_name, since):
+    """Yield the VTIMEZONE of `timezone_name` with its offset changes from `since` on."""
+    tz = pytz.timezone(timezone_name)
+    yield "BEGIN:VTIMEZONE"
+    yield f"TZID:{timezone_name}"
+    # pytz has no public API for the transitions, listed until 2037.
+    times = getattr(tz, "_utc_transition_times", None)
+    if not times:
+        # A fixed offset, e.g. UTC.
+        moment = datetime(2000, 1, 1)
+        offset, name = tz.utcoffset(moment), tz.tzname(moment)
+        observances = [("STANDARD", "19700101T000000", offset, offset, name)]
+    else:
+        infos = tz._transition_info
+        first = max(bisect_right(times, since.replace(tzinfo=None)) - 1, 0)
+        observances = []
+        for index in range(first, len(times)):
+            offset, dst, name = infos[index]
+            offset_from = infos[max(index - 1, 0)][0]
+            observances.append(
+                (
+                    "DAYLIGHT" if dst else "STANDARD",
+                    # In the local time before the change.
+                    (
+                        format_naive(times[index] + offset_from)
+                        if index
+                        else "16010101T000000"
+                    ),
+                    offset_from,
+                    offset,
+                    name,
+                )
+            )
+    for kind, start, offset_from, offset_to, name in observances:
+        yield f"BEGIN:{kind}"
+        yield f"DTSTART:{start}"
+        yield f"TZOFFSETFROM:{format_offset(offset_from)}"
+        yield f"TZOFFSETTO:{format_offset(offset_to)}"
+        yield f"TZNAME:{escape(name)}"
+        yield f"END:{kind}"
+    yield "END:VTIMEZONE"
+
+
+def event_lines(meeting, stamp):
+    yield "BEGIN:VEVENT"
+    yield f"UID:{meeting.id}@tango-calendar"
+    yield f"DTSTAMP:{stamp}"
+    if meeting.recurrence:
+        # Series repeat at the owner's wall-clock time, see `api.recurrence`.
+        timezone_name = meeting.owner.timezone
+        yield f"DTSTART;{format_local_datetime(meeting.start, timezone_name)}"
+        yield f"DTEND;{format_local_datetime(meeting.end, timezone_name)}"
+        yield from meeting.recurrence.strip().splitlines()
+    else:
+        yield f"DTSTART:{format_datetime(meeting.start)}"
+        yield f"DTEND:{format_datetime(meeting.end)}"
+    yield f"SUMMARY:{escape(meeting.event_name)}"
+    yield f"DESCRIPTION:{escape(meeting.meeting_agenda)}"
+    if meeting.location is not None:
+        yield f"LOCATION:{escape(f'{meeting.location.name}, {meeting.location.address}')}"
+    yield f"ORGANIZER:mailto:{meeting.owner.email}"
+    for participant in meeting.participant_list.all():
+        yield f"ATTENDEE:mailto:{participant.email}"
+    yield "END:VEVENT"
+
+
+def calendar_lines(queryset, name, archived=None):
+    """
+    Yield the calendar of `queryset` events, and of `archived` ones, reading
+    them in keyset chunks.
+    """
+    stamp = format_datetime(timezone.now())
+    header = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        f"PRODID:{PRODUCT_ID}",
+        f"X-WR-CALNAME:{escape(name)}",
+    ]
+    yield "".join(fold(line) for line in header)
+    querysets = [
+        queryset.select_related("owner", "location").prefetch_related(
+            "participant_list"
+        )
+        for queryset in [queryset, archived]
+        if queryset is not None
+    ]
+    # Series are written in their owners' timezones, each needs a VTIMEZONE.
+    zones = {}
+    for queryset in querysets:
+        for timezone_name, since in (
+            queryset.exclude(recurrence="")
+            .order_by()
+            .values_list("owner__timezone")
+            .annotate(since=Min("start"))
+        ):
+            zones[timezone_name] = min(since, zones.get(timezone_name, since))
+    for timezone_name, since in sorted(zones.items()):
+        yield "".join(fold(line) for line in timezone_lines(timezone_name, since))
+    events = ArchiveUnion(*querysets) if len(querysets) > 1 else querysets[0]
+    for chunk in keyset_chunks(events, ("start", "id"), CHUNK_SIZE):
+        yield "".join(
+            fold(line) for meeting in chunk for line in event_lines(meeting, stamp)
+        )
+    yield fold("END:VCALENDAR")
@@ -0,0 +1,291 @@
+"""
+Per-request timings and in-process metrics.
+
+`InstrumentationMiddleware` times each request and collects the count and
+duration of its queries, with the ``serialize`` and ``render`` phases timed by
+`TimedDataMixin` and `RenderTimingMixin`. Every request reports them in a
+``Server-Timing`` header and adds them to histograms per view, which
+``/metrics`` exposes in the Prometheus text format. Streamed bodies are timed
+while they are sent, after the header, and observed once complete. Histograms
+live in the process: each worker reports its own.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from asgiref.local import Local
+from rest_framework import serializers
+from rest_framework.response import Response
+
+# Upper bounds, in seconds, of the duration buckets.
+DURATION_BUCKETS = [
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+]
+QUERY_BUCKETS = [0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500]
+PHASES = ["db", "serialize", "render"]
+
+# Timings of the current request.
+state = Local()
+
+
+class Timings:
+    """Durations, in seconds, collected while serving one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.total = None
+        self.queries = 0
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.active = set()
+
+    def add(self, phase, seconds):
+        self.phases[phase] += seconds
+
+    def finish(self):
+        self.total = time.perf_counter() - self.started
+
+    def server_timing(self):
+        entries = [
+            f'db;dur={self.phases["db"] * 1000:.2f};desc="{self.queries} queries"'
+        ]
+        entries.extend(
+            f"{phase};dur={self.phases[phase] * 1000:.2f}"
+            for phase in PHASES[1:]
+            if self.phases[phase]
+        )
+        entries.append(f"total;dur={self.total * 1000:.2f}")
+        return ", ".join(entries)
+
+
+def current_timings():
+    return getattr(state, "timings", None)
+
+
+@contextmanager
+def phase(name):
+    """Add the time spent in the block to the request's `name` phase."""
+    timings = current_timings()
+    # Nested blocks, e.g. of nested serializers, are timed by the outermost.
+    if timings is None or name in timings.active:
+        yield
+        return
+    timings.active.add(name)
+    started = time.perf_counter()
+    db_started = timings.phases["db"]
+    try:
+        yield
+    finally:
+        timings.active.discard(name)
+        # Queries run within the block are part of the ``db`` phase only.
+        queried = timings.phases["db"] - db_started
+        timings.add(name, time.perf_counter() - started - queried)
+
+
+def timed(name):
+    """Decorator adding the time spent in the function to the `name` phase."""
+
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def time_query(execute, sql, params, many, context):
+    """Database execute wrapper adding each query to the request's timings."""
+    timings = current_timings()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.queries += 1
+        timings.add("db", time.perf_counter() - started)
+
+
+def install_query_timer(connection):
+    # First, so `execute_wrapper()` blocks, which pop the last wrapper, keep it.
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, time_query)
+
+
+def view_name(request):
+    """Label of the view serving the request, e.g. ``EventsView.list``."""
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unresolved"
+    view = match.func
+    cls = getattr(view, "cls", None)
+    if cls is None:
+        return f"{view.__module__}.{view.__qualname__}"
+    method = request.method.lower()
+    actions = getattr(view, "actions", None) or {}
+    return f"{cls.__name__}.{actions.get(method) or method}"
+
+
+class Histogram:
+    """Counts of observed values per bucket, made cumulative when exposed."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        """Yield `(le, cumulative count)` of every bucket, ending with ``+Inf``."""
+        cumulative = 0
+        for bound, count in zip(self.buckets + ["+Inf"], self.counts):
+            cumulative += count
+            yield bound, cumulative
+
+
+class Metrics:
+    """Histograms of request durations, phases and query counts per view."""
+
+    families = {
+        "api_request_duration_seconds": (
+            "Time spent serving requests.",
+            DURATION_BUCKETS,
+        ),
+        "api_request_phase_duration_seconds": (
+            "Time spent in database queries, serialization and rendering.",
+            DURATION_BUCKETS,
+        ),
+        "api_request_queries": ("Database queries per request.", QUERY_BUCKETS),
+    }
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {name: {} for name in self.families}
+
+    def histogram(self, name, labels):
+        histograms = self.histograms[name]
+        histogram = histograms.get(labels)
+        if histogram is None:
+            histogram = histograms[labels] = Histogram(self.families[name][1])
+        return histogram
+
+    def observe(self, view, timings):
+        with self.lock:
+            view_label = (("view", view),)
+            self.histogram("api_request_duration_seconds", view_label).observe(
+                timings.total
+            )
+            self.histogram("api_request_queries", view_label).observe(timings.queries)
+            for name, seconds in timings.phases.items():
+                self.histogram(
+                    "api_request_phase_duration_seconds",
+                    view_label + (("phase", name),),
+                ).observe(seconds)
+
+    def total(self, name):
+        """Sum of the values observed by the `name` histograms of every view."""
+        with self.lock:
+            return sum(histogram.sum for histogram in self.histograms[name].values())
+
+    def exposition(self):
+        """Return the metrics in the Prometheus text format."""
+        lines = []
+        with self.lock:
+            for name, (help_text, _buckets) in self.families.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} histogram")
+                for labels, histogram in sorted(self.histograms[name].items()):
+                    for bound, count in histogram.samples():
+                        bucket_labels = format_labels(labels + (("le", bound),))
+                        lines.append(f"{name}_bucket{bucket_labels} {count}")
+                    lines.append(f"{name}_sum{format_labels(labels)} {histogram.sum}")
+                    lines.append(
+                        f"{name}_count{format_labels(labels)} {histogram.count}"
+                    )
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {name: {} for name in self.families}
+
+
+def format_labels(labels):
+    def escape(value):
+        return str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in labels) + "}"
+
+
+metrics = Metrics()
+
+
+def timed_stream(content, timings, view):
+    """
+    Yield the chunks of a streamed body, adding the queries and phases run to
+    generate them to `timings`, which are observed once the body was sent.
+    """
+    content = iter(content)
+    try:
+        while True:
+            state.timings = timings
+            try:
+                chunk = next(content)
+            except StopIteration:
+                return
+            finally:
+                state.timings = None
+            yield chunk
+    finally:
+        timings.finish()
+        metrics.observe(view, timings)
+
+
+class TimedDataMixin:
+    """Serializer mixin timing `data` as the request's ``serialize`` phase."""
+
+    @property
+    def data(self):
+        with phase("serialize"):
+            return super().data
+
+
+class TimedListSerializer(TimedDataMixin, serializers.ListSerializer):
+    pass
+
+
+class RenderTimingMixin:
+    """
+    View mixin rendering responses in `finalize_response`, timed as the
+    request's ``render`` phase.
+
+    Django would render them right after the view returns anyway; goes after
+    mixins which render or cache the response themselves.
+    """
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if isinstance(response, Response):
+            with phase("render"):
+                response.render()
+        return response
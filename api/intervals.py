@@ -0,0 +1,76 @@
+"""Helpers operating on half-open `(start, end)` intervals."""
+
+from bisect import bisect_left, bisect_right, insort
+
+
+def merge(intervals):
+    """Merge intervals into sorted, disjoint intervals."""
+    merged = []
+    # Timsort is linear on the already sorted output of range queries.
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def gaps(busy, start, end, min_length):
+    """Free intervals of at least `min_length` in `[start, end)` around `busy`."""
+    free = []
+    cursor = start
+    for busy_start, busy_end in merge(busy):
+        if busy_end <= cursor:
+            continue
+        if busy_start >= end:
+            break
+        if busy_start - cursor >= min_length:
+            free.append((cursor, busy_start))
+        cursor = max(cursor, busy_end)
+    if end - cursor >= min_length:
+        free.append((cursor, end))
+    return free
+
+
+def intersects(merged, start, end):
+    """Whether `[start, end)` overlaps any of the sorted, disjoint `merged` intervals."""
+    # Only the last interval starting before `end` can reach past `start`.
+    index = bisect_left(merged, (end,))
+    return index > 0 and merged[index - 1][1] > start
+
+
+def clip(intervals, start, end):
+    """Cut sorted intervals to `[start, end)`."""
+    return [
+        (max(interval_start, start), min(interval_end, end))
+        for interval_start, interval_end in intervals
+        if interval_start < end and interval_end > start
+    ]
+
+
+class IntervalIndex:
+    """Keyed intervals no longer than `max_length`, indexed for overlap checks."""
+
+    def __init__(self, max_length):
+        self.max_length = max_length
+        self.entries = []
+        self.by_key = {}
+
+    def add(self, key, start, end):
+        entry = (start, end, key)
+        insort(self.entries, entry)
+        self.by_key.setdefault(key, []).append(entry)
+
+    def discard(self, key):
+        """Remove every interval of `key`, returning their `(start, end)`."""
+        entries = self.by_key.pop(key, [])
+        for entry in entries:
+            del self.entries[bisect_left(self.entries, entry)]
+        return [(start, end) for start, end, _key in entries]
+
+    def overlaps(self, start, end):
+        # Only intervals starting within `max_length` before `start` can reach it.
+        first = bisect_right(self.entries, (start - self.max_length,))
+        last = bisect_left(self.entries, (end,))
+        return any(entry[1] > start for entry in self.entries[first:last])
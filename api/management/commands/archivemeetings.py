@@ -0,0 +1,71 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from api.archive import archivable, archive_batch, raise_cutoff
+from api.caching import EVENTS, tenant_changed
+from api.models import Meeting
+from api.sharding import get_shards, use_shard
+
+
+def moment(value):
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(f"Invalid datetime: {value}")
+    return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed)
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves meetings which ended before a cutoff to the archive tables, in "
+        "batches. Interrupted runs are resumed by running the command again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--before",
+            type=moment,
+            help="Cutoff datetime, by default MEETING_ARCHIVE_DAYS days ago.",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, before, batch_size, **options):
+        cutoff = before or timezone.now() - timedelta(
+            days=settings.MEETING_ARCHIVE_DAYS
+        )
+        started = time.perf_counter()
+        total = 0
+        for alias in get_shards():
+            with use_shard(alias):
+                for tenant_id in self.tenants(cutoff):
+                    total += self.archive_tenant(tenant_id, cutoff, batch_size)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"Archived {total} meetings ended before {cutoff:%Y-%m-%d %H:%M} "
+            f"in {elapsed:.1f}s."
+        )
+
+    def tenants(self, cutoff):
+        return list(
+            Meeting.objects.filter(archivable(cutoff))
+            .order_by()
+            .values_list("tenant_id", flat=True)
+            .distinct()
+        )
+
+    def archive_tenant(self, tenant_id, cutoff, batch_size):
+        # Lists read the archive before the first meeting is moved into it.
+        raise_cutoff(tenant_id, cutoff)
+        moved = 0
+        while True:
+            batch = archive_batch(tenant_id, cutoff, batch_size)
+            moved += batch
+            if batch < batch_size:
+                break
+        if moved:
+            # Responses don't change, but cached ones aren't relied on to match.
+            tenant_changed(tenant_id, [EVENTS])
+            self.stdout.write(f"Tenant {tenant_id}: {moved} meetings archived.")
+        return moved
@@ -0,0 +1,115 @@
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+import pytz
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from api.models import APIUser, Location, Meeting
+
+
+class Rollback(Exception):
+    """Raised to discard the benchmark data."""
+
+
+def legacy_visible_to(user):
+    """Visibility query used before EXISTS subqueries (OR-ed joins + DISTINCT)."""
+    tenant_meetings = Meeting.objects.filter(owner__company_id=user.company_id)
+    participate_in = tenant_meetings.filter(participant_list__in=[user])
+    is_location_manager = tenant_meetings.filter(location__manager=user)
+    return (participate_in | is_location_manager).distinct()
+
+
+class Command(BaseCommand):
+    help = "Benchmarks the events visibility query on generated data."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--meetings", type=int, default=1_000_000)
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--locations", type=int, default=100)
+        parser.add_argument("--max-participants", type=int, default=5)
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        random.seed(options["seed"])
+        try:
+            with transaction.atomic():
+                user = self.generate(options)
+                self.compare(user, options["repeat"])
+                raise Rollback
+        except Rollback:
+            self.stdout.write("Benchmark data discarded.")
+
+    def generate(self, options):
+        """Bulk insert one tenant and return the user whose view is measured."""
+        started = time.perf_counter()
+        company_id = uuid.uuid4()
+        users = APIUser.objects.bulk_create(
+            APIUser(
+                username=f"benchmark-{company_id}-{index}",
+                email=f"user{index}@{company_id}.example.org",
+                company_id=company_id,
+            )
+            for index in range(options["users"])
+        )
+        user = users[0]
+        locations = Location.objects.bulk_create(
+            Location(
+                manager=random.choice(users),
+                name=f"Room {index}",
+                address="Street",
+                tenant_id=company_id,
+            )
+            for index in range(options["locations"])
+        )
+
+        first_day = datetime(2020, 1, 1, 8, tzinfo=pytz.utc)
+        through = Meeting.participant_list.through
+        batch_size = 10_000
+        for offset in range(0, options["meetings"], batch_size):
+            count = min(batch_size, options["meetings"] - offset)
+            meetings = []
+            for _ in range(count):
+                start = first_day + timedelta(minutes=15 * random.randrange(200_000))
+                meetings.append(
+                    Meeting(
+                        owner=random.choice(users),
+                        event_name="Benchmark",
+                        meeting_agenda="Benchmark agenda",
+                        start=start,
+                        end=start + timedelta(hours=1),
+                        location=random.choice(locations + [None]),
+                        tenant_id=company_id,
+                    )
+                )
+            Meeting.objects.bulk_create(meetings)
+            through.objects.bulk_create(
+                through(meeting_id=meeting.id, apiuser_id=participant.id)
+                for meeting in meetings
+                for participant in random.sample(
+                    users, random.randint(0, options["max_participants"])
+                )
+            )
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"Generated {options['meetings']} meetings in {elapsed:.1f}s."
+        )
+        return user
+
+    def compare(self, user, repeat):
+        for name, queryset in [
+            ("OR-join + DISTINCT", legacy_visible_to(user)),
+            ("EXISTS subqueries", Meeting.objects.visible_to(user)),
+        ]:
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(queryset.explain())
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                rows = len(queryset.values_list("id", "start", "event_name"))
+                timings.append(time.perf_counter() - started)
+            self.stdout.write(
+                f"{rows} rows, best of {repeat}: {min(timings) * 1000:.1f} ms\n"
+            )
@@ -0,0 +1,311 @@
+import json
+import math
+import statistics
+import time
+import tracemalloc
+import uuid
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Max, Min
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+from api.caching import EVENTS, ROOMS, bump_generations
+from api.ical import feed_token
+from api.instrumentation import metrics
+from api.models import APIUser, Location, Meeting
+from api.sharding import get_shards, shard_for, use_shard
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures latency, query count and peak memory of every endpoint and "
+        "filter combination for the busiest user of a company, optionally "
+        "comparing them with a stored baseline. Run `generatedata` first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--tenant", type=uuid.UUID, help="By default the largest company."
+        )
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--only", help="Run cases whose name contains this.")
+        parser.add_argument("--baseline", help="JSON results to compare with.")
+        parser.add_argument("--save", help="Write the results to this JSON file.")
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.25,
+            help="Relative slowdown or memory growth reported as a regression.",
+        )
+
+    def handle(self, *args, **options):
+        tenant_id = options["tenant"] or self.largest_tenant()
+        alias = shard_for(tenant_id)
+        # The client's host is accepted whatever DEBUG and ALLOWED_HOSTS are.
+        with use_shard(alias), override_settings(ALLOWED_HOSTS=["*"]):
+            user, cases, shape = self.prepare(tenant_id)
+            client = APIClient()
+            client.force_login(user)
+            self.stdout.write(
+                f"Company {tenant_id}: "
+                + ", ".join(f"{count} {name}" for name, count in shape.items())
+            )
+            results = {}
+            for name, method, path, data in cases:
+                if options["only"] and options["only"] not in name:
+                    continue
+                results[name] = self.measure(
+                    client, method, path, data, tenant_id, alias, options["repeat"]
+                )
+
+        baseline = None
+        if options["baseline"]:
+            with open(options["baseline"]) as baseline_file:
+                baseline = json.load(baseline_file)
+            if baseline["data"] != shape:
+                self.stdout.write(
+                    self.style.WARNING("The baseline was measured on other data.")
+                )
+        self.report(results, baseline and baseline["cases"])
+        if options["save"]:
+            with open(options["save"], "w") as results_file:
+                json.dump({"data": shape, "cases": results}, results_file, indent=2)
+            self.stdout.write(f"Results saved to {options['save']}.")
+        if baseline is not None:
+            regressions = self.regressions(
+                results, baseline["cases"], options["tolerance"]
+            )
+            if regressions:
+                raise CommandError("Regressions:\n" + "\n".join(regressions))
+
+    def largest_tenant(self):
+        sizes = []
+        for alias in get_shards():
+            sizes.extend(
+                Meeting.objects.using(alias)
+                .values("tenant_id")
+                .annotate(meetings=Count("id"))
+                .values_list("meetings", "tenant_id")
+            )
+        if not sizes:
+            raise CommandError("There are no meetings, run generatedata first.")
+        return max(sizes)[1]
+
+    def prepare(self, tenant_id):
+        """Return the measured user, the cases and the company's data shape."""
+        users = list(
+            APIUser.objects.filter(company_id=tenant_id)
+            .annotate(participations=Count("participate"))
+            .order_by("-participations")[:5]
+        )
+        if not users:
+            raise CommandError(f"Company {tenant_id} has no users.")
+        user = users[0]
+        meetings = Meeting.objects.filter(tenant_id=tenant_id)
+        span = meetings.aggregate(first=Min("start"), last=Max("start"))
+        if span["first"] is None:
+            raise CommandError(f"Company {tenant_id} has no meetings.")
+        # A week in the middle of the data, starting on Monday.
+        middle = span["first"] + (span["last"] - span["first"]) / 2
+        monday = (middle - timedelta(days=middle.weekday())).replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
+        week = {"from": monday.isoformat(), "to": (monday + timedelta(7)).isoformat()}
+        visible = Meeting.objects.visible_to(user).order_by("start", "id")
+        meeting = visible.filter(start__gte=monday).first() or visible.last()
+        if meeting is None:
+            raise CommandError(f"User {user.email} sees no meetings.")
+        room = Location.objects.filter(tenant_id=tenant_id).order_by("id").first()
+        if room is None:
+            raise CommandError(f"Company {tenant_id} has no rooms.")
+        emails = [participant.email for participant in users]
+        new_start = monday + timedelta(days=2, hours=12)
+
+        events, rooms = "/api/events/", "/api/rooms/"
+        event_data = {
+            "event_name": meeting.event_name,
+            "meeting_agenda": meeting.meeting_agenda,
+            "start": meeting.start.isoformat(),
+            "end": meeting.end.isoformat(),
+            "participant_list": [
+                participant.email for participant in meeting.participant_list.all()
+            ],
+            "location": meeting.location_id and str(meeting.location_id),
+            "recurrence": meeting.recurrence,
+        }
+        new_events = [
+            {
+                "event_name": f"Benchmark {day}",
+                "meeting_agenda": "Benchmark agenda",
+                "start": (new_start + timedelta(days=day)).isoformat(),
+                "end": (new_start + timedelta(days=day, hours=1)).isoformat(),
+                "participant_list": emails[:3],
+                "location": None,
+            }
+            for day in range(20)
+        ]
+        room_data = {
+            "manager": room.manager.email,
+            "name": f"{room.name} (benchmark)",
+            "address": room.address,
+        }
+        cases = [
+            ("events", "get", events, {}),
+            ("events page", "get", events, {"page_size": 100}),
+            ("events week", "get", events, week),
+            ("events week page", "get", events, {**week, "page_size": 100}),
+            ("events from", "get", events, {"from": week["from"]}),
+            ("events to", "get", events, {"to": week["to"]}),
+            ("events day", "get", events, {"day": monday.date().isoformat()}),
+            ("events room", "get", events, {"location_id": room.id}),
+            ("events room week", "get", events, {**week, "location_id": room.id}),
+            ("events query", "get", events, {"query": "budget review"}),
+            ("events query page", "get", events, {"query": "budget", "page_size": 100}),
+            ("events query week", "get", events, {**week, "query": "planning"}),
+            ("event", "get", f"{events}{meeting.id}/", {}),
+            ("event update", "put", f"{events}{meeting.id}/", event_data),
+            ("event patch", "patch", f"{events}{meeting.id}/", {"event_name": "Patch"}),
+            ("event delete", "delete", f"{events}{meeting.id}/", {}),
+            ("events occurrences week", "get", f"{events}occurrences/", week),
+            (
+                "events freebusy week",
+                "get",
+                f"{events}freebusy/",
+                {**week, "user": emails},
+            ),
+            (
+                "events schedule week",
+                "post",
+                f"{events}schedule/",
+                {**week, "participant_list": emails[:3], "duration": "01:00:00"},
+            ),
+            ("events export ndjson", "get", f"{events}export/", week),
+            ("events export csv", "get", f"{events}export/", {**week, "output": "csv"}),
+            (
+                "events create",
+                "post",
+                events,
+                {
+                    "event_name": "Benchmark",
+                    "meeting_agenda": "Benchmark agenda",
+                    "start": new_start.isoformat(),
+                    "end": (new_start + timedelta(hours=1)).isoformat(),
+                    "participant_list": emails[:3],
+                    "location": None,
+                },
+            ),
+            ("events bulk", "post", f"{events}bulk/", new_events),
+            ("events feed", "get", f"/api/feeds/{feed_token(user)}.ics", {}),
+            ("events async", "get", "/api/async/events/", {}),
+            ("events async week", "get", "/api/async/events/", week),
+            ("event async", "get", f"/api/async/events/{meeting.id}/", {}),
+            ("rooms", "get", rooms, {}),
+            ("rooms page", "get", rooms, {"page_size": 100}),
+            ("room", "get", f"{rooms}{room.id}/", {}),
+            ("room create", "post", rooms, room_data),
+            ("room update", "put", f"{rooms}{room.id}/", room_data),
+            ("rooms async", "get", "/api/async/rooms/", {}),
+            ("room async", "get", f"/api/async/rooms/{room.id}/", {}),
+            (
+                "rooms availability week",
+                "get",
+                f"{rooms}availability/",
+                {**week, "duration": "01:00:00"},
+            ),
+        ]
+        shape = {
+            "users": APIUser.objects.filter(company_id=tenant_id).count(),
+            "rooms": Location.objects.filter(tenant_id=tenant_id).count(),
+            "meetings": meetings.count(),
+            "participations": Meeting.participant_list.through.objects.filter(
+                meeting__tenant_id=tenant_id
+            ).count(),
+        }
+        return user, cases, shape
+
+    def measure(self, client, method, path, data, tenant_id, alias, repeat):
+        def request():
+            # Every request misses the response cache.
+            bump_generations(tenant_id, [EVENTS, ROOMS])
+            if method == "get":
+                return self.consume(client.get(path, data))
+            # Writes are rolled back, so every run sees the same data.
+            with transaction.atomic(using=alias):
+                response = self.consume(
+                    getattr(client, method)(path, data, format="json")
+                )
+                transaction.set_rollback(True, using=alias)
+            return response
+
+        response, content = request()
+        if response.status_code >= 400 or response.status_code == 207:
+            raise CommandError(f"{path}: {response.status_code} {content[:300]}")
+
+        # Counted by the instrumentation, on every connection the request used,
+        # including those of thread pool workers serving the async views.
+        queries = metrics.total("api_request_queries")
+        tracemalloc.start()
+        request()
+        _current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        queries = metrics.total("api_request_queries") - queries
+
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            request()
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        return {
+            "median_ms": round(statistics.median(timings) * 1000, 2),
+            "p95_ms": round(timings[math.ceil(0.95 * len(timings)) - 1] * 1000, 2),
+            "queries": queries,
+            "peak_kib": round(peak / 1024),
+            "bytes": len(content),
+        }
+
+    def consume(self, response):
+        if response.streaming:
+            return response, b"".join(response.streaming_content)
+        return response, response.content
+
+    def report(self, results, baseline):
+        self.stdout.write(
+            f"{'case':<26}{'median ms':>11}{'p95 ms':>10}{'queries':>9}"
+            f"{'peak KiB':>10}{'bytes':>11}"
+        )
+        for name, result in results.items():
+            line = (
+                f"{name:<26}{result['median_ms']:>11.1f}{result['p95_ms']:>10.1f}"
+                f"{result['queries']:>9}{result['peak_kib']:>10}{result['bytes']:>11}"
+            )
+            before = (baseline or {}).get(name)
+            if before is not None:
+                line += "  " + " ".join(
+                    f"{metric} {self.change(before[metric], result[metric])}"
+                    for metric in ["median_ms", "queries", "peak_kib"]
+                )
+            self.stdout.write(line)
+
+    def change(self, before, after):
+        if not before:
+            return f"{before} -> {after}"
+        return f"{(after - before) / before:+.0%}"
+
+    def regressions(self, results, baseline, tolerance):
+        found = []
+        for name, result in results.items():
+            before = baseline.get(name)
+            if before is None:
+                continue
+            if result["queries"] > before["queries"]:
+                found.append(
+                    f"{name}: {before['queries']} -> {result['queries']} queries"
+                )
+            for metric in ["median_ms", "peak_kib"]:
+                if result[metric] > before[metric] * (1 + tolerance):
+                    found.append(
+                        f"{name}: {metric} {before[metric]} -> {result[metric]}"
+                    )
+        return found
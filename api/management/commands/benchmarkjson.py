@@ -0,0 +1,74 @@
+import io
+import time
+import uuid
+from datetime import datetime, timedelta
+import pytz
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from api.parsers import FastJSONParser
+from api.renderers import FastJSONRenderer
+from api.serializers import datetime_formatter
+
+
+class Command(BaseCommand):
+    help = "Compares the stdlib and orjson based JSON renderers and parsers."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--events", type=int, default=10_000)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--timezone", default="Europe/Warsaw")
+
+    def handle(self, *args, **options):
+        with timezone.override(options["timezone"]):
+            to_representation = datetime_formatter()
+            start = datetime(2020, 1, 1, 8, tzinfo=pytz.utc)
+            # Raw values, as in the free/busy style responses, and serialized ones.
+            raw = [
+                self.event(index, start, lambda value: value)
+                for index in range(options["events"])
+            ]
+            serialized = [
+                self.event(index, start, to_representation)
+                for index in range(options["events"])
+            ]
+
+            for name, data in [("raw values", raw), ("serialized", serialized)]:
+                self.stdout.write(self.style.MIGRATE_HEADING(name))
+                expected = JSONRenderer().render(data)
+                for renderer in [JSONRenderer(), FastJSONRenderer()]:
+                    rendered, elapsed = self.measure(
+                        lambda: renderer.render(data), options["repeat"]
+                    )
+                    same = "identical" if rendered == expected else "DIFFERENT"
+                    self.report(type(renderer).__name__, elapsed, same)
+                for parser in [JSONParser(), FastJSONParser()]:
+                    _, elapsed = self.measure(
+                        lambda: parser.parse(io.BytesIO(expected)), options["repeat"]
+                    )
+                    self.report(type(parser).__name__, elapsed)
+
+    def event(self, index, start, to_representation):
+        event_start = start + timedelta(minutes=30 * index)
+        return {
+            "id": uuid.UUID(int=index),
+            "owner": f"user{index % 100}@example.org",
+            "event_name": f"Event {index}",
+            "meeting_agenda": "Agenda",
+            "start": to_representation(event_start),
+            "end": to_representation(event_start + timedelta(hours=1)),
+            "participant_list": [f"user{n}@example.org" for n in range(3)],
+            "location": None,
+        }
+
+    def measure(self, function, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = function()
+            timings.append(time.perf_counter() - started)
+        return result, min(timings)
+
+    def report(self, name, elapsed, note=""):
+        self.stdout.write(f"{name:>18}: {elapsed * 1000:8.1f} ms {note}")
@@ -0,0 +1,89 @@
+import asyncio
+import time
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.utils.functional import SimpleLazyObject
+from django.utils.timezone import (
+    activate,
+    deactivate,
+    get_current_timezone,
+    get_current_timezone_name,
+)
+from api.models import APIUser
+from tango_calendar.middleware import TimezoneAwareMiddleware
+
+
+class LegacyTimezoneAwareMiddleware:
+    """Middleware as it was before timezones were resolved lazily."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        tz = getattr(request.user, "timezone", get_current_timezone_name())
+        activate(tz)
+        response = self.get_response(request)
+        deactivate()
+        return response
+
+
+class Command(BaseCommand):
+    help = "Measures the per-request cost of the timezone middleware."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=100_000)
+        parser.add_argument("--timezone", default="Europe/Warsaw")
+
+    def handle(self, *args, **options):
+        factory = RequestFactory()
+        user = APIUser(email="user@example.org", timezone=options["timezone"])
+
+        def request():
+            request = factory.get("/api/events/")
+            request.user = SimpleLazyObject(lambda: user)
+            return request
+
+        def untouched(request):
+            return HttpResponse()
+
+        def converted(request):
+            get_current_timezone().utcoffset(None)
+            get_current_timezone_name()
+            return HttpResponse()
+
+        async def untouched_async(request):
+            return HttpResponse()
+
+        count = options["requests"]
+        requests = [request() for _ in range(count)]
+        self.report("no middleware", self.measure(untouched, requests))
+        for name, view in [
+            ("timezone unused", untouched),
+            ("timezone used", converted),
+        ]:
+            requests = [request() for _ in range(count)]
+            legacy = self.measure(LegacyTimezoneAwareMiddleware(view), requests)
+            requests = [request() for _ in range(count)]
+            lazy = self.measure(TimezoneAwareMiddleware(view), requests)
+            self.report(f"legacy, {name}", legacy)
+            self.report(f"lazy, {name}", lazy)
+
+        requests = [request() for _ in range(count)]
+        middleware = TimezoneAwareMiddleware(untouched_async)
+        self.report("lazy async", asyncio.run(self.measure_async(middleware, requests)))
+
+    def measure(self, handler, requests):
+        started = time.perf_counter()
+        for request in requests:
+            handler(request)
+        return (time.perf_counter() - started) / len(requests)
+
+    async def measure_async(self, handler, requests):
+        started = time.perf_counter()
+        for request in requests:
+            await handler(request)
+        return (time.perf_counter() - started) / len(requests)
+
+    def report(self, name, elapsed):
+        self.stdout.write(f"{name:>24}: {elapsed * 1_000_000:8.2f} µs/request")
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from api.caching import cache_stats
+
+
+class Command(BaseCommand):
+    help = "Prints hit and miss counts of the list response cache."
+
+    def handle(self, *args, **options):
+        for scope, counts in cache_stats().items():
+            lookups = counts["hits"] + counts["misses"]
+            ratio = counts["hits"] / lookups if lookups else 0
+            self.stdout.write(
+                f"{scope}: {counts['hits']} hits, {counts['misses']} misses "
+                f"({ratio:.0%} hit ratio)"
+            )
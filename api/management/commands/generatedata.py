@@ -0,0 +1,234 @@
+import random
+import time
+import uuid
+from bisect import bisect
+from datetime import datetime, timedelta
+from itertools import accumulate
+import pytz
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from api.models import APIUser, Location, Meeting, TenantVersion
+from api.recurrence import series_end
+from api.sharding import shard_for
+
+TIMEZONES = [
+    "Europe/Warsaw",
+    "Europe/London",
+    "America/New_York",
+    "America/Los_Angeles",
+    "Asia/Tokyo",
+    "Australia/Sydney",
+]
+TOPICS = [
+    "Budget",
+    "Roadmap",
+    "Hiring",
+    "Design",
+    "Release",
+    "Security",
+    "Onboarding",
+    "Marketing",
+    "Infrastructure",
+    "Customer",
+]
+KINDS = ["review", "sync", "planning", "standup", "retrospective", "workshop", "1:1"]
+WORDS = (
+    "discuss agree status risks goals metrics blockers demo feedback decisions "
+    "priorities timeline owners budget scope launch incident follow-up notes"
+).split()
+# Meeting lengths in minutes and how common they are.
+DURATIONS = [15, 30, 45, 60, 90, 120, 240]
+DURATION_WEIGHTS = [10, 35, 10, 30, 8, 5, 2]
+
+
+class Skewed:
+    """Random choice from `items`, a few of them far more often than the rest."""
+
+    def __init__(self, rng, items, alpha=1.2):
+        self.rng = rng
+        self.items = items
+        self.cum_weights = list(accumulate(rng.paretovariate(alpha) for _item in items))
+
+    def choice(self):
+        position = self.rng.random() * self.cum_weights[-1]
+        return self.items[bisect(self.cum_weights, position)]
+
+    def sample(self, count):
+        """Return up to `count` distinct items."""
+        count = min(count, len(self.items))
+        chosen = {}
+        for _attempt in range(count * 3):
+            item = self.choice()
+            chosen[item.pk] = item
+            if len(chosen) == count:
+                break
+        return list(chosen.values())
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk inserts synthetic companies with users, rooms and meetings. "
+        "Company sizes, participant counts, room and user popularity are skewed "
+        "(Pareto distributed); meetings fall on working hours of their owners."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tenants", type=int, default=10)
+        parser.add_argument("--users", type=int, default=2000, help="In total.")
+        parser.add_argument("--rooms", type=int, default=200, help="In total.")
+        parser.add_argument("--meetings", type=int, default=1_000_000, help="In total.")
+        parser.add_argument("--days", type=int, default=365)
+        parser.add_argument(
+            "--start",
+            type=lambda value: datetime.strptime(value, "%Y-%m-%d"),
+            help="First day of meetings, by default half of --days ago.",
+        )
+        parser.add_argument("--max-participants", type=int, default=50)
+        parser.add_argument(
+            "--series", type=float, default=0.05, help="Share of weekly series."
+        )
+        parser.add_argument("--batch-size", type=int, default=10_000)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        started = time.perf_counter()
+        first_day = options["start"] or (
+            timezone.now().replace(tzinfo=None) - timedelta(days=options["days"] // 2)
+        )
+        options["first_day"] = first_day.replace(hour=0, minute=0, second=0)
+        # Users can't log in with it; the API is exercised with forced logins.
+        options["password"] = make_password(None)
+
+        sizes = [rng.paretovariate(1.2) for _tenant in range(options["tenants"])]
+        total_size = sum(sizes)
+        rows = {"users": 0, "rooms": 0, "meetings": 0, "participants": 0}
+        for size in sizes:
+            share = size / total_size
+            counts = {
+                name: max(1, round(options[name] * share))
+                for name in ["users", "rooms", "meetings"]
+            }
+            for name, count in self.generate_tenant(rng, counts, options).items():
+                rows[name] += count
+
+        elapsed = time.perf_counter() - started
+        summary = ", ".join(f"{count} {name}" for name, count in rows.items())
+        self.stdout.write(
+            f"Generated {options['tenants']} companies: {summary} "
+            f"in {elapsed:.1f}s."
+        )
+
+    def generate_tenant(self, rng, counts, options):
+        tenant_id = uuid.UUID(int=rng.getrandbits(128), version=4)
+        alias = shard_for(tenant_id)
+        home_timezone = rng.choice(TIMEZONES)
+        with transaction.atomic(using=alias):
+            users = APIUser.objects.using(alias).bulk_create(
+                (
+                    APIUser(
+                        username=f"gen-{tenant_id.hex[:12]}-{index}",
+                        email=f"user{index}@{tenant_id.hex[:12]}.example.com",
+                        password=options["password"],
+                        company_id=tenant_id,
+                        # Most people work in the company's timezone.
+                        timezone=(
+                            home_timezone
+                            if rng.random() < 0.9
+                            else rng.choice(TIMEZONES)
+                        ),
+                    )
+                    for index in range(counts["users"])
+                ),
+                batch_size=options["batch_size"],
+            )
+            rooms = Location.objects.using(alias).bulk_create(
+                (
+                    Location(
+                        manager=rng.choice(users),
+                        name=f"{rng.choice(TOPICS)} room {index}",
+                        address=f"Floor {index % 10}",
+                        tenant_id=tenant_id,
+                    )
+                    for index in range(counts["rooms"])
+                ),
+                batch_size=options["batch_size"],
+            )
+            TenantVersion.objects.using(alias).create(tenant_id=tenant_id, version=1)
+
+            owners = Skewed(rng, users)
+            attendees = Skewed(rng, users)
+            venues = Skewed(rng, rooms)
+            participants = 0
+            remaining = counts["meetings"]
+            while remaining:
+                batch = min(remaining, options["batch_size"])
+                participants += self.generate_meetings(
+                    rng, batch, tenant_id, alias, owners, attendees, venues, options
+                )
+                remaining -= batch
+        return {
+            "users": len(users),
+            "rooms": len(rooms),
+            "meetings": counts["meetings"],
+            "participants": participants,
+        }
+
+    def generate_meetings(
+        self, rng, count, tenant_id, alias, owners, attendees, venues, options
+    ):
+        meetings, participations = [], []
+        for _meeting in range(count):
+            owner = owners.choice()
+            start, end = self.working_hours(rng, owner, options)
+            recurrence = ""
+            if rng.random() < options["series"]:
+                recurrence = "RRULE:FREQ=WEEKLY" + (
+                    f";COUNT={rng.randint(4, 52)}" if rng.random() < 0.75 else ""
+                )
+            # Most meetings book a room, popular rooms far more often.
+            room = venues.choice() if rng.random() < 0.6 else None
+            # Ids rather than instances skip the related field descriptors.
+            meeting = Meeting(
+                owner_id=owner.id,
+                event_name=f"{rng.choice(TOPICS)} {rng.choice(KINDS)}",
+                meeting_agenda=" ".join(rng.choices(WORDS, k=rng.randint(3, 30))),
+                start=start,
+                end=end,
+                location_id=room and room.id,
+                recurrence=recurrence,
+                recurrence_end=(
+                    series_end(start, end, recurrence, owner.timezone)
+                    if recurrence
+                    else None
+                ),
+                tenant_id=tenant_id,
+            )
+            meetings.append(meeting)
+            # Mostly a few participants, now and then a large audience.
+            size = min(int(rng.paretovariate(1.3)), options["max_participants"])
+            participations.extend(
+                (meeting.id, user.id) for user in attendees.sample(size)
+            )
+
+        Meeting.objects.using(alias).bulk_create(meetings)
+        through = Meeting.participant_list.through
+        through.objects.using(alias).bulk_create(
+            through(meeting_id=meeting_id, apiuser_id=apiuser_id)
+            for meeting_id, apiuser_id in participations
+        )
+        return len(participations)
+
+    def working_hours(self, rng, owner, options):
+        """Return a start and end within the owner's working hours."""
+        day = options["first_day"] + timedelta(days=rng.randrange(options["days"]))
+        if day.weekday() >= 5 and rng.random() < 0.9:
+            day -= timedelta(days=day.weekday() - 4)
+        local_start = day + timedelta(minutes=8 * 60 + 15 * rng.randrange(36))
+        start = pytz.timezone(owner.timezone).localize(local_start)
+        duration = rng.choices(DURATIONS, DURATION_WEIGHTS)[0]
+        return start.astimezone(pytz.utc), (
+            start + timedelta(minutes=duration)
+        ).astimezone(pytz.utc)
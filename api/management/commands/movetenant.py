@@ -0,0 +1,163 @@
+import time
+import uuid
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+from api.caching import quiet_changes
+from api.models import (
+    APIUser,
+    ArchivedMeeting,
+    Location,
+    Meeting,
+    TenantArchive,
+    TenantShard,
+    TenantVersion,
+)
+from api.pagination import keyset_chunks
+from api.sharding import get_shards, shard_for, use_shard
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves a company's calendar data to another shard. Reads are served "
+        "throughout; writes are refused only while the final changes are copied."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("tenant_id", type=uuid.UUID)
+        parser.add_argument("target", help="Database alias of the new shard.")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--grace",
+            type=float,
+            default=settings.SHARD_MOVE_GRACE,
+            help="Seconds to wait for requests in flight before switching.",
+        )
+
+    def handle(self, *args, tenant_id, target, batch_size, grace, **options):
+        if target not in get_shards():
+            raise CommandError(f"{target} is not listed in DATABASE_SHARDS.")
+        source = shard_for(tenant_id)
+        if source == target:
+            # Records the placement, e.g. before the list of shards changes.
+            TenantShard.objects.update_or_create(
+                tenant_id=tenant_id, defaults={"alias": target, "frozen": False}
+            )
+            self.stdout.write(f"Tenant {tenant_id} is on {target}.")
+            return
+
+        self.check_isolated(tenant_id, source)
+        version = self.version(tenant_id, source)
+        self.copy(tenant_id, source, target, batch_size)
+        self.place(tenant_id, source, frozen=True)
+        try:
+            # Writes that started before the freeze commit meanwhile.
+            time.sleep(grace)
+            if self.version(tenant_id, source) != version:
+                self.stdout.write("Tenant changed while copying, copying again.")
+                self.copy(tenant_id, source, target, batch_size)
+        except BaseException:
+            self.place(tenant_id, source, frozen=False)
+            raise
+        self.place(tenant_id, target, frozen=False)
+        # Reads that started before the switch finish on the source.
+        time.sleep(grace)
+        self.delete(tenant_id, source, batch_size)
+        self.stdout.write(f"Moved tenant {tenant_id} from {source} to {target}.")
+
+    def version(self, tenant_id, alias):
+        return TenantVersion.objects.db_manager(alias).current(tenant_id).version
+
+    def check_isolated(self, tenant_id, alias):
+        """
+        Refuse to move a tenant whose meetings involve another company's users
+        or rooms, as those rows can't be on both shards.
+        """
+        shared = []
+        for model, name in [(Meeting, "meeting"), (ArchivedMeeting, "archivedmeeting")]:
+            own, member = Q(tenant_id=tenant_id), Q(location__tenant_id=tenant_id)
+            shared.append(
+                model.objects.using(alias)
+                .exclude(location=None)
+                .filter(own | member)
+                .exclude(own & member)
+            )
+            through = model.participant_list.through
+            own = Q(**{f"{name}__tenant_id": tenant_id})
+            member = Q(apiuser__company_id=tenant_id)
+            shared.append(
+                through.objects.using(alias).filter(own | member).exclude(own & member)
+            )
+        counts = [(qs.model._meta.db_table, qs.count()) for qs in shared]
+        if any(count for _table, count in counts):
+            raise CommandError(
+                f"Tenant {tenant_id} shares rows with other companies: "
+                + ", ".join(f"{count} in {table}" for table, count in counts if count)
+                + "."
+            )
+
+    def place(self, tenant_id, alias, frozen):
+        TenantShard.objects.update_or_create(
+            tenant_id=tenant_id, defaults={"alias": alias, "frozen": frozen}
+        )
+
+    def querysets(self, tenant_id, alias):
+        """Tenant rows of every sharded table, referenced tables first."""
+        through = Meeting.participant_list.through
+        archived_through = ArchivedMeeting.participant_list.through
+        return [
+            (APIUser.objects.using(alias).filter(company_id=tenant_id), ("id",)),
+            (Location.objects.using(alias).filter(tenant_id=tenant_id), ("id",)),
+            (Meeting.objects.using(alias).filter(tenant_id=tenant_id), ("id",)),
+            (
+                through.objects.using(alias).filter(meeting__tenant_id=tenant_id),
+                ("id",),
+            ),
+            (
+                ArchivedMeeting.objects.using(alias).filter(tenant_id=tenant_id),
+                ("id",),
+            ),
+            (
+                archived_through.objects.using(alias).filter(
+                    archivedmeeting__tenant_id=tenant_id
+                ),
+                ("id",),
+            ),
+            (
+                TenantArchive.objects.using(alias).filter(tenant_id=tenant_id),
+                ("tenant_id",),
+            ),
+            (
+                TenantVersion.objects.using(alias).filter(tenant_id=tenant_id),
+                ("tenant_id",),
+            ),
+        ]
+
+    def copy(self, tenant_id, source, target, batch_size):
+        """Replace the tenant's rows on `target` with those on `source`."""
+        started = time.perf_counter()
+        self.delete(tenant_id, target, batch_size)
+        with use_shard(target), transaction.atomic(using=target):
+            for queryset, ordering in self.querysets(tenant_id, source):
+                copied = 0
+                for chunk in keyset_chunks(queryset, ordering, batch_size):
+                    queryset.model.objects.using(target).bulk_create(chunk)
+                    copied += len(chunk)
+                self.stdout.write(
+                    f"Copied {copied} {queryset.model._meta.db_table} rows."
+                )
+        self.stdout.write(f"Copied in {time.perf_counter() - started:.1f}s.")
+
+    def delete(self, tenant_id, alias, batch_size):
+        """Delete the tenant's rows on `alias`, referencing tables first."""
+        # Requests see the same data before and after the move.
+        with use_shard(alias), transaction.atomic(using=alias), quiet_changes():
+            for queryset, ordering in reversed(self.querysets(tenant_id, alias)):
+                # In batches, as deleting loads every row to send its signals.
+                for chunk in keyset_chunks(
+                    queryset.only(*ordering), ordering, batch_size
+                ):
+                    queryset.model.objects.using(alias).filter(
+                        pk__in=[row.pk for row in chunk]
+                    ).delete()
@@ -0,0 +1,60 @@
+from django.db import migrations, models
+import uuid
+
+
+def backfill_tenant_id(apps, schema_editor):
+    APIUser = apps.get_model("api", "APIUser")
+    Location = apps.get_model("api", "Location")
+    Meeting = apps.get_model("api", "Meeting")
+    for company_id in APIUser.objects.values_list("company_id", flat=True).distinct():
+        users = APIUser.objects.filter(company_id=company_id)
+        Location.objects.filter(manager__in=users).update(tenant_id=company_id)
+        Meeting.objects.filter(owner__in=users).update(tenant_id=company_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0002_location_meeting"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="apiuser",
+            name="company_id",
+            field=models.UUIDField(db_index=True, default=uuid.uuid4),
+        ),
+        migrations.AddField(
+            model_name="location",
+            name="tenant_id",
+            field=models.UUIDField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="meeting",
+            name="tenant_id",
+            field=models.UUIDField(editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_tenant_id, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="location",
+            name="tenant_id",
+            field=models.UUIDField(editable=False),
+        ),
+        migrations.AlterField(
+            model_name="meeting",
+            name="tenant_id",
+            field=models.UUIDField(editable=False),
+        ),
+        migrations.AddIndex(
+            model_name="location",
+            index=models.Index(
+                fields=["tenant_id", "name", "id"], name="location_tenant_name_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="meeting",
+            index=models.Index(
+                fields=["tenant_id", "start", "id"], name="meeting_tenant_start_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0005_meeting_location_window_idx"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TenantVersion",
+            fields=[
+                ("tenant_id", models.UUIDField(primary_key=True, serialize=False)),
+                ("version", models.PositiveBigIntegerField(default=0)),
+                (
+                    "changed_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations
+
+
+def install_search(apps, schema_editor):
+    from api import search
+
+    search.install(schema_editor)
+
+
+def uninstall_search(apps, schema_editor):
+    from api import search
+
+    search.uninstall(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0006_tenantversion"),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search, uninstall_search),
+    ]
@@ -0,0 +1,47 @@
+from django.db import migrations, models
+
+
+def install_search(apps, schema_editor):
+    from api import search
+
+    # Adding or removing columns rebuilds `api_meeting` on SQLite, dropping
+    # the triggers.
+    search.install(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0007_meeting_search"),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, install_search),
+        migrations.AddField(
+            model_name="meeting",
+            name="recurrence",
+            field=models.TextField(blank=True, default=""),
+        ),
+        migrations.AddField(
+            model_name="meeting",
+            name="recurrence_end",
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="meeting",
+            index=models.Index(
+                condition=models.Q(_negated=True, recurrence=""),
+                fields=["tenant_id", "recurrence_end"],
+                name="meeting_tenant_series_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="meeting",
+            index=models.Index(
+                condition=models.Q(_negated=True, recurrence=""),
+                fields=["location", "recurrence_end"],
+                name="meeting_location_series_idx",
+            ),
+        ),
+        migrations.RunPython(install_search, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0008_meeting_recurrence"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TenantShard",
+            fields=[
+                ("tenant_id", models.UUIDField(primary_key=True, serialize=False)),
+                ("alias", models.TextField()),
+                ("frozen", models.BooleanField(default=False)),
+            ],
+        ),
+    ]
@@ -0,0 +1,75 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0009_tenantshard"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedMeeting",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(editable=False, primary_key=True, serialize=False),
+                ),
+                ("event_name", models.TextField()),
+                ("meeting_agenda", models.TextField()),
+                ("start", models.DateTimeField()),
+                ("end", models.DateTimeField()),
+                ("recurrence", models.TextField(blank=True, default="")),
+                ("recurrence_end", models.DateTimeField(null=True)),
+                ("tenant_id", models.UUIDField()),
+                (
+                    "location",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="archived_meetings",
+                        to="api.location",
+                    ),
+                ),
+                (
+                    "owner",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="archived_meetings",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "participant_list",
+                    models.ManyToManyField(
+                        related_name="archived_participations",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="TenantArchive",
+            fields=[
+                ("tenant_id", models.UUIDField(primary_key=True, serialize=False)),
+                ("cutoff", models.DateTimeField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="archivedmeeting",
+            index=models.Index(
+                fields=["tenant_id", "start", "id"], name="archived_tenant_start_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="archivedmeeting",
+            index=models.Index(
+                condition=models.Q(_negated=True, recurrence=""),
+                fields=["tenant_id", "recurrence_end"],
+                name="archived_tenant_series_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,28 @@
+from django.db import migrations, models
+import api.models
+
+
+def assign_feed_secrets(apps, schema_editor):
+    # The field default was evaluated once for every existing user.
+    APIUser = apps.get_model("api", "APIUser")
+    users = APIUser.objects.using(schema_editor.connection.alias)
+    for user_id in users.values_list("id", flat=True):
+        users.filter(id=user_id).update(feed_secret=api.models.new_feed_secret())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0010_archive"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="apiuser",
+            name="feed_secret",
+            field=models.CharField(
+                default=api.models.new_feed_secret, editable=False, max_length=32
+            ),
+        ),
+        migrations.RunPython(assign_feed_secrets, migrations.RunPython.noop),
+    ]
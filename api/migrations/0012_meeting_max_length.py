@@ -0,0 +1,52 @@
+from datetime import timedelta
+from django.db import migrations, models
+
+
+def install_search(apps, schema_editor):
+    from api import search
+
+    # Adding or removing constraints rebuilds `api_meeting` on SQLite, dropping
+    # the triggers.
+    search.install(schema_editor)
+
+
+def check_lengths(apps, schema_editor):
+    # Adding the constraints would fail on any longer meeting anyway.
+    for name in ["Meeting", "ArchivedMeeting"]:
+        model = apps.get_model("api", name)
+        too_long = (
+            model.objects.using(schema_editor.connection.alias)
+            .filter(end__gt=models.F("start") + timedelta(hours=8))
+            .count()
+        )
+        if too_long:
+            raise RuntimeError(
+                f"{too_long} rows of {model._meta.db_table} are longer than 8 hours;"
+                " shorten them before migrating."
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0011_apiuser_feed_secret"),
+    ]
+
+    operations = [
+        migrations.RunPython(check_lengths, install_search),
+        migrations.AddConstraint(
+            model_name="meeting",
+            constraint=models.CheckConstraint(
+                check=models.Q(end__lte=models.F("start") + timedelta(hours=8)),
+                name="meeting_max_length",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="archivedmeeting",
+            constraint=models.CheckConstraint(
+                check=models.Q(end__lte=models.F("start") + timedelta(hours=8)),
+                name="archived_max_length",
+            ),
+        ),
+        migrations.RunPython(install_search, migrations.RunPython.noop),
+    ]
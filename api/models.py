@@ -1,9 +1,20 @@
+import secrets
 import uuid
+from datetime import datetime
 from pytz import all_timezones
 from django.conf import settings
-from django.db import models
+from django.db import IntegrityError, connections, models, router, transaction
 from django.contrib.auth.models import AbstractUser
+from django.core.exceptions import ValidationError
+from django.db.models.functions import Cast
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
+from api.recurrence import FOREVER, occurrences, series_end
+from api.validators import MAX_MEETING_LENGTH
+
+
+def new_feed_secret():
+    return secrets.token_urlsafe(24)
 
 
 class APIUser(AbstractUser):
@@ -13,8 +24,67 @@ class APIUser(AbstractUser):
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     email = models.EmailField(_("email address"))
-    company_id = models.UUIDField(default=uuid.uuid4)
+    company_id = models.UUIDField(default=uuid.uuid4, db_index=True)
     timezone = models.TextField(choices=ALL_TIMEZONES, default=settings.TIME_ZONE)
+    # Part of the calendar feed URL; replacing it revokes the previous URL.
+    feed_secret = models.CharField(
+        max_length=32, default=new_feed_secret, editable=False
+    )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        user = super().from_db(db, field_names, values)
+        # Lets saves tell which company a user leaves.
+        user._loaded_company_id = dict(zip(field_names, values)).get("company_id")
+        return user
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        self._loaded_company_id = self.company_id
+        update_fields = kwargs.get("update_fields")
+        if not adding and (update_fields is None or "company_id" in update_fields):
+            # Keep the denormalized tenant of owned meetings and managed rooms in sync.
+            Meeting.objects.filter(owner=self).exclude(
+                tenant_id=self.company_id
+            ).update(tenant_id=self.company_id)
+            Location.objects.filter(manager=self).exclude(
+                tenant_id=self.company_id
+            ).update(tenant_id=self.company_id)
+        if not adding and (update_fields is None or "timezone" in update_fields):
+            self.update_series_ends()
+
+    def rotate_feed_secret(self):
+        self.feed_secret = new_feed_secret()
+        self.save(update_fields=["feed_secret"])
+
+    def update_series_ends(self):
+        """Recompute the ends of owned series, expanded in the owner's timezone."""
+        # Only the last occurrence of a counted series depends on the timezone.
+        for model in [Meeting, ArchivedMeeting]:
+            changed = []
+            for meeting in model.objects.filter(
+                owner=self, recurrence__contains="COUNT="
+            ):
+                end = series_end(
+                    meeting.start, meeting.end, meeting.recurrence, self.timezone
+                )
+                if end != meeting.recurrence_end:
+                    meeting.recurrence_end = end
+                    changed.append(meeting)
+            model.objects.bulk_update(changed, ["recurrence_end"])
+
+
+class LocationQuerySet(models.QuerySet):
+    def lock(self):
+        """Serialize bookings of these locations until the transaction ends."""
+        # Locks are taken in primary key order so concurrent batches can't deadlock.
+        queryset = self.order_by("pk")
+        if connections[queryset.db].features.has_select_for_update:
+            list(queryset.select_for_update().values_list("pk"))
+        else:
+            # No row locks (SQLite): a no-op write takes the write lock instead.
+            queryset.update(name=models.F("name"))
 
 
 class Location(models.Model):
@@ -22,10 +92,151 @@ class Location(models.Model):
     manager = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT)
     name = models.TextField()
     address = models.TextField()
+    tenant_id = models.UUIDField(editable=False)
+
+    objects = LocationQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["tenant_id", "name", "id"], name="location_tenant_name_idx"
+            )
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.manager})"
 
+    def save(self, *args, **kwargs):
+        """Denormalize tenant from manager."""
+        self.tenant_id = self.manager.company_id
+        super().save(*args, **kwargs)
+
+    def lock(self):
+        """Serialize bookings of this location until the transaction ends."""
+        Location.objects.filter(pk=self.pk).lock()
+
+
+# Checked by the database on every write, see `first_overlaps`.
+WITHIN_MAX_LENGTH = models.Q(end__lte=models.F("start") + MAX_MEETING_LENGTH)
+
+
+def first_overlaps(start, end):
+    # Meetings are never longer than MAX_MEETING_LENGTH, which bounds the
+    # range scan on `start` from below.
+    condition = models.Q(start__gt=start - MAX_MEETING_LENGTH, end__gt=start)
+    return condition & models.Q(start__lt=end) if end is not None else condition
+
+
+def series_overlap(start, end):
+    condition = ~models.Q(recurrence="") & models.Q(recurrence_end__gt=start)
+    return condition & models.Q(start__lt=end) if end is not None else condition
+
+
+class MeetingQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        """Restrict to tenant meetings the user participates in or hosts."""
+        # Correlated EXISTS subqueries instead of OR-ed joins, so no DISTINCT is needed.
+        participant_list = self.model.participant_list
+        participates = participant_list.through.objects.filter(
+            **{participant_list.field.m2m_field_name(): models.OuterRef("pk")},
+            apiuser=user,
+        )
+        manages_location = Location.objects.filter(
+            pk=models.OuterRef("location"), manager=user
+        )
+        return self.filter(tenant_id=user.company_id).filter(
+            models.Exists(participates) | models.Exists(manages_location)
+        )
+
+    def ends_after(self, moment):
+        """Meetings, or series, still running at or starting after `moment`."""
+        return self.overlapping(moment, None)
+
+    def starts_before(self, moment):
+        return self.filter(start__lt=moment)
+
+    def overlapping(self, start, end):
+        """
+        Meetings overlapping the half-open window `[start, end)`, unbounded if
+        `end` is `None`.
+
+        Series are included when their first and last occurrences surround the
+        window; expand them with `api.recurrence.expand` to get the occurrences.
+        """
+        # Both sides of the OR carry their own bounds, so each one is read
+        # from its own index.
+        return self.filter(first_overlaps(start, end) | series_overlap(start, end))
+
+    def first_overlapping(self, start, end):
+        """
+        Meetings, and series, whose first occurrence overlaps `[start, end)`;
+        read from the window indexes alone.
+        """
+        return self.filter(first_overlaps(start, end))
+
+    def series_overlapping(self, start, end):
+        """Series whose first and last occurrences surround `[start, end)`."""
+        return self.filter(series_overlap(start, end))
+
+    def location_intervals(self):
+        """
+        Yield `(location_id, start, end)` of the meetings, not expanding series.
+
+        Django's SQLite backend parses every datetime with a regular expression
+        and builds every UUID on its own, which dominates reading thousands of
+        rows; there they are read as text, parsed with `fromisoformat` and each
+        location id converted once.
+        """
+        if connections[self.db].vendor != "sqlite":
+            yield from self.values_list("location_id", "start", "end")
+            return
+        location_ids = {}
+        parse = datetime.fromisoformat
+        for location_id, start, end in self.values_list(
+            *[Cast(name, models.TextField()) for name in ["location", "start", "end"]]
+        ):
+            if location_id not in location_ids:
+                location_ids[location_id] = uuid.UUID(location_id)
+            # Stored in UTC, as `USE_TZ` is set.
+            yield (
+                location_ids[location_id],
+                parse(start + "+00:00"),
+                parse(end + "+00:00"),
+            )
+
+    def occurring(self, start, end, starting=False):
+        """
+        Meetings and series with an occurrence overlapping `[start, end)`, or
+        only starting in it if `starting`; `end` may be `None`.
+
+        Series prefiltered in SQL are expanded in Python, which costs one more
+        query.
+        """
+        if starting:
+            candidates = self.filter(
+                models.Q(recurrence="", start__gte=start, start__lt=end)
+                | ~models.Q(recurrence="")
+                & models.Q(start__lt=end, recurrence_end__gt=start)
+            )
+        else:
+            candidates = self.overlapping(start, end)
+        series = (
+            candidates.exclude(recurrence="")
+            .prefetch_related(None)
+            .values_list("start", "end", "recurrence", "owner__timezone", "id")
+        )
+        ids = []
+        for *columns, meeting_id in series:
+            # Stops at the first match, so endless series aren't expanded forever.
+            if any(
+                not starting or occurrence_start >= start
+                for occurrence_start, _end in occurrences(
+                    *columns, start, end or FOREVER
+                )
+            ):
+                ids.append(meeting_id)
+        return candidates.filter(models.Q(recurrence="") | models.Q(pk__in=ids))
+
 
 class Meeting(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -45,6 +256,163 @@ class Meeting(models.Model):
     location = models.ForeignKey(
         Location, on_delete=models.SET_NULL, null=True, blank=True
     )
+    # RRULE and EXDATE lines of a series, see `api.recurrence`.
+    recurrence = models.TextField(blank=True, default="")
+    # End of the last occurrence of a series, `FOREVER` when it never ends.
+    recurrence_end = models.DateTimeField(null=True, editable=False)
+
+    tenant_id = models.UUIDField(editable=False)
+
+    objects = MeetingQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["tenant_id", "start", "id"], name="meeting_tenant_start_idx"
+            ),
+            models.Index(
+                fields=["tenant_id", "start", "end"], name="meeting_tenant_window_idx"
+            ),
+            models.Index(
+                fields=["location", "start", "end"], name="meeting_location_window_idx"
+            ),
+            models.Index(
+                fields=["tenant_id", "recurrence_end"],
+                name="meeting_tenant_series_idx",
+                condition=~models.Q(recurrence=""),
+            ),
+            models.Index(
+                fields=["location", "recurrence_end"],
+                name="meeting_location_series_idx",
+                condition=~models.Q(recurrence=""),
+            ),
+        ]
+        constraints = [
+            models.CheckConstraint(check=WITHIN_MAX_LENGTH, name="meeting_max_length")
+        ]
 
     def __str__(self):
         return f"{self.event_name} ({self.owner})"
+
+    def clean(self):
+        if self.start and self.end and self.end - self.start > MAX_MEETING_LENGTH:
+            raise ValidationError(
+                {"end": _("Meetings shouldn’t be longer than 8 hours.")}
+            )
+
+    def save(self, *args, **kwargs):
+        """Denormalize tenant from owner."""
+        self.tenant_id = self.owner.company_id
+        self.update_recurrence_end()
+        super().save(*args, **kwargs)
+
+    def update_recurrence_end(self):
+        """Store the end of the series, expanded in the owner's timezone."""
+        self.recurrence_end = (
+            series_end(self.start, self.end, self.recurrence, self.owner.timezone)
+            if self.recurrence
+            else None
+        )
+
+
+class ArchivedMeeting(models.Model):
+    """Meeting which ended before its tenant's archive cutoff, see `api.archive`."""
+
+    id = models.UUIDField(primary_key=True, editable=False)
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.PROTECT,
+        related_name="archived_meetings",
+    )
+    event_name = models.TextField()
+    meeting_agenda = models.TextField()
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+    participant_list = models.ManyToManyField(
+        settings.AUTH_USER_MODEL, related_name="archived_participations"
+    )
+    location = models.ForeignKey(
+        Location,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="archived_meetings",
+    )
+    recurrence = models.TextField(blank=True, default="")
+    recurrence_end = models.DateTimeField(null=True)
+
+    tenant_id = models.UUIDField()
+
+    objects = MeetingQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["tenant_id", "start", "id"], name="archived_tenant_start_idx"
+            ),
+            models.Index(
+                fields=["tenant_id", "recurrence_end"],
+                name="archived_tenant_series_idx",
+                condition=~models.Q(recurrence=""),
+            ),
+        ]
+        constraints = [
+            models.CheckConstraint(check=WITHIN_MAX_LENGTH, name="archived_max_length")
+        ]
+
+    def __str__(self):
+        return f"{self.event_name} ({self.owner})"
+
+
+class TenantArchive(models.Model):
+    """Meetings of the tenant ending before `cutoff` may be archived."""
+
+    tenant_id = models.UUIDField(primary_key=True)
+    cutoff = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.tenant_id} before {self.cutoff}"
+
+
+class TenantVersionManager(models.Manager):
+    def current(self, tenant_id):
+        """Return the tenant version, version 0 if nothing was written yet."""
+        version = self.filter(tenant_id=tenant_id).first()
+        return version or TenantVersion(tenant_id=tenant_id)
+
+    def bump(self, tenant_id):
+        """Record a change of any data visible within the tenant."""
+        changes = {"version": models.F("version") + 1, "changed_at": timezone.now()}
+        if self.filter(tenant_id=tenant_id).update(**changes):
+            return
+        try:
+            with transaction.atomic(using=router.db_for_write(self.model)):
+                self.create(tenant_id=tenant_id, version=1)
+        except IntegrityError:
+            # Created concurrently since the update above.
+            self.filter(tenant_id=tenant_id).update(**changes)
+
+
+class TenantVersion(models.Model):
+    """Change counter of a tenant's calendar data, used for HTTP validators."""
+
+    tenant_id = models.UUIDField(primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    objects = TenantVersionManager()
+
+    def __str__(self):
+        return f"{self.tenant_id} v{self.version}"
+
+
+class TenantShard(models.Model):
+    """Database alias holding a tenant's rows, kept on ``default``."""
+
+    tenant_id = models.UUIDField(primary_key=True)
+    alias = models.TextField()
+    # Writes are refused while the tenant is being moved between shards.
+    frozen = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f"{self.tenant_id} on {self.alias}"
@@ -0,0 +1,138 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import namedtuple
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.utils.urls import replace_query_param
+
+Cursor = namedtuple("Cursor", ["position", "reverse"])
+
+
+def keyset_boundary(ordering, position, reverse=False):
+    """Return a filter selecting rows strictly after (or before) position."""
+    lookup = "lt" if reverse else "gt"
+    pairs = list(zip(ordering, position))
+    name, value = pairs[-1]
+    condition = Q(**{f"{name}__{lookup}": value})
+    for name, value in reversed(pairs[:-1]):
+        condition = Q(**{f"{name}__{lookup}": value}) | (Q(**{name: value}) & condition)
+    # Redundant bound on the leading column keeps the filter index friendly.
+    first_name, first_value = pairs[0]
+    return Q(**{f"{first_name}__{lookup}e": first_value}) & condition
+
+
+def keyset_chunks(queryset, ordering, size):
+    """Yield the queryset in lists of `size` rows, one keyset query per list."""
+    queryset = queryset.order_by(*ordering)
+    chunk = list(queryset[:size])
+    while chunk:
+        yield chunk
+        if len(chunk) < size:
+            break
+        position = [getattr(chunk[-1], name) for name in ordering]
+        chunk = list(queryset.filter(keyset_boundary(ordering, position))[:size])
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination over a unique, composite ``ordering``.
+
+    Pages are selected with a ``(a, b) > (x, y)`` row comparison, so no OFFSET
+    scan and no COUNT query is needed and page 10,000 is as cheap as page 1.
+    Cursors carry the boundary row values, so they stay stable when rows are
+    inserted concurrently. Pagination is opt-in: responses stay plain lists
+    unless ``cursor`` or ``page_size`` is given.
+    """
+
+    ordering = ("id",)
+    page_size = 100
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+
+    def is_requested(self, request):
+        """Paginate only when the client asked for it."""
+        params = request.query_params
+        return self.cursor_query_param in params or self.page_size_query_param in params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_requested(request):
+            return None
+
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.model = queryset.model
+        self.fields = [self.model._meta.get_field(name) for name in self.ordering]
+        self.cursor = self.decode_cursor(request)
+
+        reverse = self.cursor is not None and self.cursor.reverse
+        if reverse:
+            queryset = queryset.order_by(*[f"-{name}" for name in self.ordering])
+        else:
+            queryset = queryset.order_by(*self.ordering)
+        if self.cursor is not None:
+            queryset = queryset.filter(self.get_boundary(self.cursor.position, reverse))
+
+        results = list(queryset[: self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[: self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.cursor is not None
+        return self.page
+
+    def get_boundary(self, position, reverse):
+        return keyset_boundary(self.ordering, position, reverse)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(Cursor(self.get_position(self.page[-1]), False))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(Cursor(self.get_position(self.page[0]), True))
+
+    def get_position(self, instance):
+        if isinstance(instance, dict):
+            # Rows of a `values()` queryset.
+            instance = self.model(
+                **{field.attname: instance[field.attname] for field in self.fields}
+            )
+        return [field.value_to_string(instance) for field in self.fields]
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            tokens = json.loads(urlsafe_b64decode(encoded.encode("ascii")))
+            values = tokens["p"]
+            if len(values) != len(self.fields):
+                raise ValueError("Cursor does not match ordering")
+            position = [
+                field.to_python(value) for field, value in zip(self.fields, values)
+            ]
+            return Cursor(position, bool(tokens.get("r")))
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, cursor):
+        tokens = {"p": cursor.position}
+        if cursor.reverse:
+            tokens["r"] = 1
+        encoded = urlsafe_b64encode(json.dumps(tokens).encode("ascii")).decode("ascii")
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+
+class MeetingPagination(KeysetPagination):
+    ordering = ("start", "id")
+
+
+class LocationPagination(KeysetPagination):
+    ordering = ("name", "id")
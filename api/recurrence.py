@@ -0,0 +1,221 @@
+"""
+Recurring meetings: a subset of iCalendar (RFC 5545) recurrence rules.
+
+A series is stored once, as its first occurrence and the ``recurrence`` text
+holding one ``RRULE`` line and any ``EXDATE`` lines, e.g.::
+
+    RRULE:FREQ=WEEKLY;BYDAY=MO,WE;COUNT=10
+    EXDATE:20201130T090000Z
+
+Supported rule parts are ``FREQ`` (``DAILY``, ``WEEKLY``, ``MONTHLY`` or
+``YEARLY``), ``INTERVAL``, ``COUNT``, ``UNTIL`` (UTC) and, for weekly rules,
+``BYDAY`` weekdays. Occurrences keep the wall-clock time of the first one in
+the owner's timezone and are generated lazily, only within a given window.
+"""
+
+from datetime import MAXYEAR, datetime, timedelta
+import pytz
+
+DAILY, WEEKLY, MONTHLY, YEARLY = "DAILY", "WEEKLY", "MONTHLY", "YEARLY"
+
+WEEKDAYS = ["MO", "TU", "WE", "TH", "FR", "SA", "SU"]
+
+# Series are never longer than this many occurrences.
+MAX_COUNT = 10_000
+
+# Bookings of a location are checked for conflicts with occurrences up to this
+# far ahead of the booking's first occurrence.
+CONFLICT_HORIZON = timedelta(days=366)
+
+UTC_FORMAT = "%Y%m%dT%H%M%SZ"
+
+# End of series which never end.
+FOREVER = datetime(9999, 1, 1, tzinfo=pytz.utc)
+
+
+class RecurrenceRule:
+    """Parsed ``recurrence`` text, see the module documentation."""
+
+    def __init__(self, freq, interval=1, count=None, until=None, byday=(), exdates=()):
+        self.freq = freq
+        self.interval = interval
+        self.count = count
+        self.until = until
+        self.byday = sorted(set(byday))
+        self.exdates = frozenset(exdates)
+
+    @classmethod
+    def parse(cls, text):
+        """Return the rule of `text`, raise `ValueError` if it is not supported."""
+        rule, exdates = None, []
+        for line in text.strip().splitlines():
+            name, _, value = line.strip().partition(":")
+            if name == "RRULE" and rule is None:
+                rule = parse_rule(value)
+            elif name == "EXDATE":
+                exdates.extend(parse_utc(moment) for moment in value.split(","))
+            else:
+                raise ValueError(f"Unsupported recurrence line: {line.strip()}")
+        if rule is None:
+            raise ValueError("An RRULE line is required.")
+        return cls(exdates=exdates, **rule)
+
+
+def parse_rule(value):
+    parts = {}
+    for part in value.split(";"):
+        name, _, part_value = part.partition("=")
+        if name in parts or not part_value:
+            raise ValueError(f"Invalid rule part: {part}")
+        parts[name] = part_value
+
+    freq = parts.pop("FREQ", None)
+    if freq not in [DAILY, WEEKLY, MONTHLY, YEARLY]:
+        raise ValueError(f"Unsupported frequency: {freq}")
+    rule = {"freq": freq}
+    try:
+        if "INTERVAL" in parts:
+            rule["interval"] = int(parts.pop("INTERVAL"))
+        if "COUNT" in parts:
+            rule["count"] = int(parts.pop("COUNT"))
+        if "UNTIL" in parts:
+            rule["until"] = parse_utc(parts.pop("UNTIL"))
+        if "BYDAY" in parts and freq == WEEKLY:
+            rule["byday"] = [
+                WEEKDAYS.index(day) for day in parts.pop("BYDAY").split(",")
+            ]
+    except ValueError:
+        raise ValueError(f"Invalid rule: {value}")
+    if parts:
+        raise ValueError(f"Unsupported rule parts: {', '.join(parts)}")
+    if "count" in rule and "until" in rule:
+        raise ValueError("COUNT and UNTIL can't be combined.")
+    if not 1 <= rule.get("interval", 1) <= 1000:
+        raise ValueError("INTERVAL must be between 1 and 1000.")
+    if not 1 <= rule.get("count", 1) <= MAX_COUNT:
+        raise ValueError(f"COUNT must be between 1 and {MAX_COUNT}.")
+    return rule
+
+
+def parse_utc(value):
+    return datetime.strptime(value, UTC_FORMAT).replace(tzinfo=pytz.utc)
+
+
+def occurrences(start, end, recurrence, timezone_name, window_start, window_end):
+    """
+    Yield `(start, end)` of series occurrences overlapping `[window_start, window_end)`.
+
+    `start` and `end` are those of the first occurrence; a meeting without
+    `recurrence` has just that one.
+    """
+    if not recurrence:
+        if start < window_end and end > window_start:
+            yield start, end
+        return
+
+    rule = RecurrenceRule.parse(recurrence)
+    tz = pytz.timezone(timezone_name)
+    duration = end - start
+    local_start = start.astimezone(tz).replace(tzinfo=None)
+    # Daily and weekly candidates are evenly spaced, so the ones ending before
+    # the window are skipped without generating them; a day of slack covers
+    # DST shifts between wall-clock and absolute time.
+    try:
+        earliest = window_start - duration - timedelta(days=1)
+        earliest = earliest.astimezone(tz).replace(tzinfo=None)
+    except OverflowError:
+        earliest = datetime.min
+    for number, candidate in candidates(rule, local_start, earliest):
+        if rule.count is not None and number >= rule.count:
+            return
+        occurrence_start = tz.normalize(tz.localize(candidate)).astimezone(pytz.utc)
+        if rule.until is not None and occurrence_start > rule.until:
+            return
+        if occurrence_start >= window_end:
+            return
+        if occurrence_start + duration > window_start:
+            if occurrence_start not in rule.exdates:
+                yield occurrence_start, occurrence_start + duration
+
+
+def candidates(rule, local_start, earliest):
+    """Yield `(number, local start)` of the rule's occurrences, skipping to `earliest`."""
+    if rule.freq in [DAILY, WEEKLY] and not rule.byday:
+        step = timedelta(days=rule.interval * (7 if rule.freq == WEEKLY else 1))
+        number = max((earliest - local_start) // step, 0)
+        while True:
+            yield number, local_start + number * step
+            number += 1
+
+    elif rule.freq == WEEKLY:
+        step = timedelta(weeks=rule.interval)
+        monday = local_start - timedelta(days=local_start.weekday())
+        # Weekdays of the first week before the first occurrence are not part of it.
+        missed = sum(1 for day in rule.byday if day < local_start.weekday())
+        period = max((earliest - monday) // step, 0)
+        number = period * len(rule.byday) - (missed if period else 0)
+        while True:
+            week = monday + period * step
+            for day in rule.byday:
+                candidate = week + timedelta(days=day)
+                if candidate >= local_start:
+                    yield number, candidate
+                    number += 1
+            period += 1
+
+    else:
+        months = rule.interval * (12 if rule.freq == YEARLY else 1)
+        number, period = 0, 0
+        while True:
+            month = local_start.month - 1 + period * months
+            year = local_start.year + month // 12
+            if year > MAXYEAR:
+                return
+            period += 1
+            try:
+                candidate = local_start.replace(year=year, month=month % 12 + 1)
+            except ValueError:
+                # Months without the day of the first occurrence are skipped.
+                continue
+            yield number, candidate
+            number += 1
+
+
+def series_end(start, end, recurrence, timezone_name):
+    """Return the end of the last occurrence, `FOREVER` if the series never ends."""
+    if not recurrence:
+        return end
+    rule = RecurrenceRule.parse(recurrence)
+    if rule.until is not None:
+        # An upper bound; the last occurrence may end earlier.
+        return rule.until + (end - start)
+    if rule.count is None:
+        return FOREVER
+    last = end
+    for _start, last in occurrences(
+        start, end, recurrence, timezone_name, start, FOREVER
+    ):
+        pass
+    return last
+
+
+def expand(rows, window_start, window_end):
+    """
+    Yield rows of meetings once per occurrence in the window.
+
+    Rows are `(start, end, recurrence, timezone name, *values)` tuples, the
+    yielded ones `(start, end, *values)`.
+    """
+    for start, end, recurrence, timezone_name, *values in rows:
+        for occurrence in occurrences(
+            start, end, recurrence, timezone_name, window_start, window_end
+        ):
+            yield (*occurrence, *values)
+
+
+def conflict_window(start, end, recurrence, recurrence_end):
+    """Window in which a booking's occurrences are checked for conflicts."""
+    if not recurrence:
+        return start, end
+    horizon = start + CONFLICT_HORIZON
+    return start, min(recurrence_end, horizon)
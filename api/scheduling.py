@@ -0,0 +1,164 @@
+"""Busy time lookups and common free slot search."""
+
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+import pytz
+from api.archive import meeting_models
+from api.intervals import gaps, merge
+from api.recurrence import expand, occurrences
+
+EPOCH = datetime(1970, 1, 1, tzinfo=pytz.utc)
+
+# Columns of meeting rows expanded into occurrences, see `api.recurrence.expand`.
+SERIES_COLUMNS = ["start", "end", "recurrence", "owner__timezone"]
+
+# Windows spanning at least this many grid cells are searched with bitmaps.
+BITMAP_MIN_CELLS = 96
+
+
+def busy_intervals(tenant_id, user_ids, start, end):
+    """Map user ids to sorted, merged intervals they are busy in `[start, end)`."""
+    busy = defaultdict(list)
+    for model in meeting_models(tenant_id, start):
+        meetings = model.objects.filter(tenant_id=tenant_id).overlapping(start, end)
+        rows = [
+            meetings.filter(participant_list__in=user_ids).values_list(
+                *SERIES_COLUMNS, "participant_list"
+            ),
+            meetings.filter(owner__in=user_ids).values_list(
+                *SERIES_COLUMNS, "owner_id"
+            ),
+        ]
+        for meeting_rows in rows:
+            for meeting_start, meeting_end, user_id in expand(meeting_rows, start, end):
+                busy[user_id].append((meeting_start, meeting_end))
+    return {user_id: merge(busy[user_id]) for user_id in user_ids}
+
+
+def location_busy_intervals(location, start, end):
+    busy = []
+    for model in meeting_models(location.tenant_id, start):
+        meetings = model.objects.filter(location=location).overlapping(start, end)
+        busy.extend(expand(meetings.values_list(*SERIES_COLUMNS), start, end))
+    return merge(busy)
+
+
+def rooms_busy_intervals(tenant_id, rooms, start, end):
+    """Map ids of the `rooms` queryset to their bookings within `[start, end)`."""
+    busy = defaultdict(list)
+    for model in meeting_models(tenant_id, start):
+        meetings = model.objects.filter(location__in=rooms.values("id"))
+        # Series are few, and read from their own index.
+        first_occurrences = Counter()
+        series = meetings.series_overlapping(start, end).values_list(
+            *SERIES_COLUMNS, "location_id"
+        )
+        for meeting_start, meeting_end, *rule, location_id in series:
+            first_occurrences[location_id, meeting_start, meeting_end] += 1
+            busy[location_id].extend(
+                occurrences(meeting_start, meeting_end, *rule, start, end)
+            )
+        # Everything else is read in (location, start) order from the covering
+        # (location, start, end) index, which has no `recurrence` to tell series
+        # apart: their first occurrences, already expanded above, are skipped.
+        for location_id, meeting_start, meeting_end in (
+            meetings.first_overlapping(start, end)
+            .order_by("location_id", "start")
+            .location_intervals()
+        ):
+            key = location_id, meeting_start, meeting_end
+            if first_occurrences and first_occurrences[key]:
+                first_occurrences[key] -= 1
+            else:
+                busy[location_id].append((meeting_start, meeting_end))
+    return busy
+
+
+def off_hours(timezone_name, start, end, work_start, work_end):
+    """Intervals outside daily working hours of the timezone within `[start, end)`."""
+    tz = pytz.timezone(timezone_name)
+    day = start.astimezone(tz).date() - timedelta(days=1)
+    busy = []
+    while True:
+        day_start = tz.localize(datetime.combine(day, datetime.min.time()))
+        if day_start >= end:
+            break
+        next_day = tz.localize(
+            datetime.combine(day + timedelta(days=1), datetime.min.time())
+        )
+        busy.append((day_start, tz.localize(datetime.combine(day, work_start))))
+        busy.append((tz.localize(datetime.combine(day, work_end)), next_day))
+        day += timedelta(days=1)
+    return busy
+
+
+class SlotGrid:
+    """Cells of `granularity` aligned to the epoch and covering `[start, end)`."""
+
+    def __init__(self, start, end, granularity):
+        self.granularity = granularity
+        self.origin = start + (EPOCH - start) % granularity
+        self.size = max((end - self.origin) // granularity, 0)
+
+    def floor(self, moment):
+        return max(min((moment - self.origin) // self.granularity, self.size), 0)
+
+    def ceil(self, moment):
+        return max(min(-((self.origin - moment) // self.granularity), self.size), 0)
+
+    def moment(self, cell):
+        return self.origin + cell * self.granularity
+
+
+def find_common_slots(busy, start, end, duration, count, granularity):
+    """
+    Return up to `count` earliest slots of `duration` free in every busy list.
+
+    Slots start on a grid of `granularity`; a grid cell touched by any busy
+    interval is unavailable. Wide windows are searched on a bitmap of busy
+    cells, narrow ones by merging the intervals.
+    """
+    grid = SlotGrid(start, end, granularity)
+    cells = -(-duration // granularity)
+    if grid.size >= BITMAP_MIN_CELLS:
+        found = _bitmap_slots(grid, busy, cells, count)
+    else:
+        found = _interval_slots(grid, busy, cells, count)
+    return [(grid.moment(cell), grid.moment(cell) + duration) for cell in found]
+
+
+def _interval_slots(grid, busy, cells, count):
+    snapped = [
+        (grid.floor(busy_start), grid.ceil(busy_end))
+        for intervals in busy
+        for busy_start, busy_end in intervals
+    ]
+    found = []
+    for free_start, free_end in gaps(snapped, 0, grid.size, cells):
+        for cell in range(free_start, free_end - cells + 1, cells):
+            found.append(cell)
+            if len(found) == count:
+                return found
+    return found
+
+
+def _bitmap_slots(grid, busy, cells, count):
+    # Bit `i` is set when cell `i` is busy; integers give word-parallel OR/AND.
+    occupied = 0
+    for intervals in busy:
+        for busy_start, busy_end in intervals:
+            first, last = grid.floor(busy_start), grid.ceil(busy_end)
+            if last > first:
+                occupied |= ((1 << (last - first)) - 1) << first
+    free = ~occupied & ((1 << grid.size) - 1)
+    # Bit `i` stays set when cells `i .. i + cells - 1` are all free.
+    starts = free
+    for shift in range(1, cells):
+        starts &= free >> shift
+
+    found = []
+    while starts and len(found) < count:
+        cell = (starts & -starts).bit_length() - 1
+        found.append(cell)
+        starts &= ~((1 << (cell + cells)) - 1)
+    return found
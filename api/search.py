@@ -0,0 +1,163 @@
+"""
+Full-text search of events.
+
+SQLite uses an FTS5 index kept in sync by triggers, PostgreSQL a generated
+``tsvector`` column with a GIN index. Other databases, and SQLite builds
+without FTS5, fall back to ``icontains`` lookups.
+"""
+
+import re
+from django.db import OperationalError, connections
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+from api.models import Meeting
+
+SQLITE_TABLE = "api_meeting_fts"
+
+SQLITE_SETUP = [
+    f"""
+    CREATE VIRTUAL TABLE {SQLITE_TABLE} USING fts5(
+        event_name, meeting_agenda, content='api_meeting', content_rowid='rowid'
+    )
+    """,
+    f"""
+    CREATE TRIGGER {SQLITE_TABLE}_insert AFTER INSERT ON api_meeting BEGIN
+        INSERT INTO {SQLITE_TABLE}(rowid, event_name, meeting_agenda)
+        VALUES (new.rowid, new.event_name, new.meeting_agenda);
+    END
+    """,
+    f"""
+    CREATE TRIGGER {SQLITE_TABLE}_delete AFTER DELETE ON api_meeting BEGIN
+        INSERT INTO {SQLITE_TABLE}({SQLITE_TABLE}, rowid, event_name, meeting_agenda)
+        VALUES ('delete', old.rowid, old.event_name, old.meeting_agenda);
+    END
+    """,
+    f"""
+    CREATE TRIGGER {SQLITE_TABLE}_update
+    AFTER UPDATE OF event_name, meeting_agenda ON api_meeting BEGIN
+        INSERT INTO {SQLITE_TABLE}({SQLITE_TABLE}, rowid, event_name, meeting_agenda)
+        VALUES ('delete', old.rowid, old.event_name, old.meeting_agenda);
+        INSERT INTO {SQLITE_TABLE}(rowid, event_name, meeting_agenda)
+        VALUES (new.rowid, new.event_name, new.meeting_agenda);
+    END
+    """,
+    f"INSERT INTO {SQLITE_TABLE}({SQLITE_TABLE}) VALUES ('rebuild')",
+]
+
+SQLITE_TEARDOWN = [f"DROP TABLE IF EXISTS {SQLITE_TABLE}"] + [
+    f"DROP TRIGGER IF EXISTS {SQLITE_TABLE}_{event}"
+    for event in ["insert", "delete", "update"]
+]
+
+POSTGRESQL_SETUP = [
+    """
+    ALTER TABLE api_meeting ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', event_name), 'A')
+        || setweight(to_tsvector('simple', meeting_agenda), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX api_meeting_search_idx ON api_meeting USING GIN (search_vector)",
+]
+
+POSTGRESQL_TEARDOWN = [
+    "DROP INDEX IF EXISTS api_meeting_search_idx",
+    "ALTER TABLE api_meeting DROP COLUMN IF EXISTS search_vector",
+]
+
+# Databases whose search index was found, by connection alias and name.
+available = {}
+
+
+def install(schema_editor):
+    """
+    Create the search index of the database and index existing meetings.
+
+    SQLite drops the triggers whenever a migration rebuilds ``api_meeting``,
+    and row ids are not stable across VACUUM, so run it again after either.
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        uninstall(schema_editor)
+        try:
+            for statement in SQLITE_SETUP:
+                schema_editor.execute(statement)
+        except OperationalError:
+            # SQLite compiled without FTS5.
+            uninstall(schema_editor)
+    elif vendor == "postgresql":
+        for statement in POSTGRESQL_SETUP:
+            schema_editor.execute(statement)
+    available.clear()
+
+
+def uninstall(schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {"sqlite": SQLITE_TEARDOWN, "postgresql": POSTGRESQL_TEARDOWN}
+    for statement in statements.get(vendor, []):
+        schema_editor.execute(statement)
+    available.clear()
+
+
+def has_index(connection):
+    key = (connection.alias, connection.settings_dict["NAME"])
+    if key not in available:
+        if connection.vendor == "sqlite":
+            available[key] = SQLITE_TABLE in connection.introspection.table_names()
+        else:
+            available[key] = connection.vendor == "postgresql"
+    return available[key]
+
+
+def search_words(terms):
+    return [word for term in terms for word in re.findall(r"\w+", term)]
+
+
+class FullTextSearchFilter(filters.SearchFilter):
+    """
+    `SearchFilter` matching word prefixes with the database full-text index.
+
+    Matches are ordered by relevance, event names weighing more than agendas.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        connection = connections[queryset.db]
+        # Archived meetings are not indexed and are matched with LIKE.
+        if not terms or queryset.model is not Meeting or not has_index(connection):
+            return super().filter_queryset(request, queryset, view)
+
+        words = search_words(terms)
+        if not words:
+            return queryset.none()
+        if connection.vendor == "sqlite":
+            # Quoted words can't be read as FTS5 operators; `*` matches prefixes.
+            match = " ".join(f'"{word}"*' for word in words)
+            matches = RawSQL(
+                f"SELECT id FROM api_meeting WHERE rowid IN "
+                f"(SELECT rowid FROM {SQLITE_TABLE} WHERE {SQLITE_TABLE} MATCH %s)",
+                [match],
+            )
+            rank = RawSQL(
+                f"SELECT bm25({SQLITE_TABLE}, 10.0, 1.0) FROM {SQLITE_TABLE} "
+                f"WHERE {SQLITE_TABLE} MATCH %s AND rowid = api_meeting.rowid",
+                [match],
+            )
+            ordering = "search_rank"
+        else:
+            match = " & ".join(f"{word}:*" for word in words)
+            matches = RawSQL(
+                "SELECT id FROM api_meeting "
+                "WHERE search_vector @@ to_tsquery('simple', %s)",
+                [match],
+            )
+            rank = RawSQL(
+                "ts_rank(api_meeting.search_vector, to_tsquery('simple', %s))",
+                [match],
+            )
+            ordering = "-search_rank"
+        return (
+            queryset.filter(id__in=matches)
+            .annotate(search_rank=rank)
+            .order_by(ordering, "start", "id")
+        )
@@ -1,10 +1,92 @@
-from collections import OrderedDict
-from rest_framework import serializers
+from collections import OrderedDict, defaultdict
+from datetime import timedelta
+from django.db import router, transaction
+from django.utils.encoding import smart_str
+from rest_framework import ISO_8601, serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
+from rest_framework.settings import api_settings
+from api.archive import meeting_models
+from api.instrumentation import TimedDataMixin, TimedListSerializer, timed
 from api.models import Meeting, Location, APIUser
-from api.validators import validate_meeting_length
+from api.intervals import intersects, merge
+from api.recurrence import conflict_window, expand, occurrences, series_end
+from api.validators import (
+    validate_first_occurrence,
+    validate_meeting_length,
+    validate_recurrence,
+)
 
 
-class RoomSerializer(serializers.ModelSerializer):
+class EagerLoadingMixin:
+    """Plan `select_related`/`prefetch_related` from the fields being rendered."""
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        select_related, prefetch_related = get_related_paths(cls())
+        return queryset.select_related(*select_related).prefetch_related(
+            *prefetch_related
+        )
+
+
+def get_related_paths(serializer, prefix="", prefetch=False):
+    """Return relation paths to join and to prefetch for `serializer` output."""
+    select_related, prefetch_related = [], []
+    for field in serializer.fields.values():
+        if field.write_only or field.source == "*":
+            continue
+        path = prefix + field.source.replace(".", "__")
+        nested = None
+        if isinstance(field, serializers.ManyRelatedField):
+            prefetch_related.append(path)
+            nested, nested_prefetch = field.child_relation, True
+        elif isinstance(field, serializers.ListSerializer):
+            prefetch_related.append(path)
+            nested, nested_prefetch = field.child, True
+        elif isinstance(field, serializers.BaseSerializer):
+            (prefetch_related if prefetch else select_related).append(path)
+            nested, nested_prefetch = field, prefetch
+        elif isinstance(field, serializers.RelatedField):
+            if field.use_pk_only_optimization():
+                continue
+            (prefetch_related if prefetch else select_related).append(path)
+            nested, nested_prefetch = field, prefetch
+
+        nested = getattr(nested, "serializer", nested)
+        if isinstance(nested, type):
+            nested = nested()
+        if isinstance(nested, serializers.BaseSerializer):
+            paths = get_related_paths(nested, f"{path}__", nested_prefetch)
+            select_related.extend(paths[0])
+            prefetch_related.extend(paths[1])
+    return select_related, prefetch_related
+
+
+def datetime_formatter():
+    """Return `DateTimeField.to_representation` specialized for the current timezone."""
+    field = serializers.DateTimeField()
+    field_timezone = field.default_timezone()
+    if field_timezone is None or api_settings.DATETIME_FORMAT.lower() != ISO_8601:
+        return field.to_representation
+
+    resolved = None
+
+    def to_representation(value):
+        nonlocal resolved
+        if value is None:
+            return None
+        if resolved is None:
+            # Converting with the timezone a `LazyTimezone` resolves to skips
+            # its delegation on every value.
+            resolved = getattr(field_timezone, "timezone", field_timezone)
+        value = value.astimezone(resolved).isoformat()
+        if value.endswith("+00:00"):
+            value = value[:-6] + "Z"
+        return value
+
+    return to_representation
+
+
+class RoomSerializer(TimedDataMixin, EagerLoadingMixin, serializers.ModelSerializer):
     manager = serializers.SlugRelatedField(
         slug_field="email", queryset=APIUser.objects.all()
     )
@@ -12,6 +94,40 @@ class RoomSerializer(serializers.ModelSerializer):
     class Meta:
         model = Location
         fields = ["id", "manager", "name", "address"]
+        list_serializer_class = TimedListSerializer
+
+
+class ManySlugRelatedField(serializers.ManyRelatedField):
+    """Many related field resolving all slugs with a single query."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, "__iter__"):
+            self.fail("not_a_list", input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail("empty")
+
+        child = self.child_relation
+        slugs = [smart_str(item) for item in data]
+        found = {
+            getattr(obj, child.slug_field): obj
+            for obj in child.get_queryset().filter(**{f"{child.slug_field}__in": slugs})
+        }
+        for slug in slugs:
+            if slug not in found:
+                child.fail("does_not_exist", slug_name=child.slug_field, value=slug)
+        return [found[slug] for slug in slugs]
+
+
+class BatchSlugRelatedField(serializers.SlugRelatedField):
+    """Slug related field whose `many=True` variant uses one query per list."""
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {"child_relation": cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return ManySlugRelatedField(**list_kwargs)
 
 
 class RelatedFieldAlternative(serializers.PrimaryKeyRelatedField):
@@ -60,9 +176,12 @@ class RelatedFieldAlternative(serializers.PrimaryKeyRelatedField):
         )
 
 
-class EventSerializer(serializers.ModelSerializer):
+LOCATION_BOOKED = "Location is already booked at this time."
+
+
+class EventSerializer(TimedDataMixin, EagerLoadingMixin, serializers.ModelSerializer):
     owner = serializers.SlugRelatedField(slug_field="email", read_only=True)
-    participant_list = serializers.SlugRelatedField(
+    participant_list = BatchSlugRelatedField(
         many=True, slug_field="email", queryset=APIUser.objects.all()
     )
     location = RelatedFieldAlternative(
@@ -80,10 +199,251 @@ class EventSerializer(serializers.ModelSerializer):
             "end",
             "participant_list",
             "location",
+            "recurrence",
         ]
-        validators = [validate_meeting_length]
+        extra_kwargs = {"recurrence": {"validators": [validate_recurrence]}}
+        validators = [validate_meeting_length, validate_first_occurrence]
+        list_serializer_class = TimedListSerializer
 
     def save(self, **kwargs):
         """Set owner from current request."""
         request = self._context["request"]
         super().save(owner=request.user, **kwargs)
+
+    def validate_participant_list(self, participants):
+        # Other companies' users may be stored on another shard.
+        tenant_id = str(self._context["request"].user.company_id)
+        for user in participants:
+            if str(user.company_id) != tenant_id:
+                self.fields["participant_list"].child_relation.fail(
+                    "does_not_exist", slug_name="email", value=user.email
+                )
+        return participants
+
+    def validate_location(self, location):
+        tenant_id = str(self._context["request"].user.company_id)
+        if location is not None and str(location.tenant_id) != tenant_id:
+            self.fields["location"].fail("does_not_exist", pk_value=location.pk)
+        return location
+
+    def create(self, validated_data):
+        with transaction.atomic(using=router.db_for_write(Meeting)):
+            self.check_location_available(validated_data)
+            return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        with transaction.atomic(using=router.db_for_write(Meeting, instance=instance)):
+            self.check_location_available(validated_data, instance)
+            return super().update(instance, validated_data)
+
+    def check_location_available(self, validated_data, instance=None):
+        """Reject bookings overlapping another meeting in the same location."""
+        data = {
+            name: validated_data.get(name, getattr(instance, name, None))
+            for name in ["location", "start", "end", "recurrence"]
+        }
+        if data["location"] is None:
+            return
+
+        # Concurrent bookings of the location wait here, so check and insert
+        # happen atomically.
+        data["location"].lock()
+        timezone_name = self._context["request"].user.timezone
+        recurrence = data["recurrence"] or ""
+        window = conflict_window(
+            data["start"],
+            data["end"],
+            recurrence,
+            series_end(data["start"], data["end"], recurrence, timezone_name),
+        )
+        booked = []
+        for model in meeting_models(data["location"].tenant_id, window[0]):
+            conflicts = model.objects.filter(location=data["location"]).overlapping(
+                *window
+            )
+            if instance is not None:
+                conflicts = conflicts.exclude(pk=instance.pk)
+            booked.extend(
+                expand(
+                    conflicts.values_list(
+                        "start", "end", "recurrence", "owner__timezone"
+                    ),
+                    *window,
+                )
+            )
+        booked = merge(booked)
+        if any(
+            intersects(booked, start, end)
+            for start, end in occurrences(
+                data["start"], data["end"], recurrence, timezone_name, *window
+            )
+        ):
+            raise serializers.ValidationError({"location": [LOCATION_BOOKED]})
+
+
+class BulkEventSerializer(EventSerializer):
+    """Validate one bulk item; relations are resolved for the whole batch."""
+
+    id = serializers.UUIDField(required=False)
+    participant_list = serializers.ListField(child=serializers.CharField())
+    location = serializers.UUIDField(allow_null=True)
+
+    def validate_participant_list(self, emails):
+        # Resolved within the company by `api.bulk`.
+        return emails
+
+    validate_location = validate_participant_list
+
+
+class TimeWindowSerializer(serializers.Serializer):
+    """Validate a `from`/`to` window passed as query parameters."""
+
+    max_window = timedelta(days=31)
+
+    def get_fields(self):
+        # `from` is a keyword, so the fields cannot be declared as attributes.
+        fields = super().get_fields()
+        fields["from"] = serializers.DateTimeField()
+        fields["to"] = serializers.DateTimeField()
+        return fields
+
+    def validate(self, attrs):
+        if attrs["to"] <= attrs["from"]:
+            raise serializers.ValidationError("`to` must be later than `from`.")
+        if attrs["to"] - attrs["from"] > self.max_window:
+            raise serializers.ValidationError(
+                f"Window can't be longer than {self.max_window.days} days."
+            )
+        return attrs
+
+
+class AvailabilitySerializer(TimeWindowSerializer):
+    duration = serializers.DurationField(min_value=timedelta(minutes=1))
+    room = serializers.ListField(child=serializers.UUIDField(), required=False)
+
+
+class SchedulingSerializer(TimeWindowSerializer):
+    participant_list = BatchSlugRelatedField(
+        many=True, slug_field="email", queryset=APIUser.objects.all(), allow_empty=False
+    )
+    location = serializers.PrimaryKeyRelatedField(
+        queryset=Location.objects.all(), required=False, allow_null=True
+    )
+    duration = serializers.DurationField(min_value=timedelta(minutes=1))
+    granularity = serializers.DurationField(
+        default=timedelta(minutes=15), min_value=timedelta(minutes=1)
+    )
+    count = serializers.IntegerField(default=5, min_value=1, max_value=50)
+    working_hours_start = serializers.TimeField(required=False)
+    working_hours_end = serializers.TimeField(required=False)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        tenant_id = self.context["request"].user.company_id
+        self.fields["participant_list"].child_relation.queryset = (
+            APIUser.objects.filter(company_id=tenant_id)
+        )
+        self.fields["location"].queryset = Location.objects.filter(tenant_id=tenant_id)
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        hours = [attrs.get("working_hours_start"), attrs.get("working_hours_end")]
+        if hours.count(None) == 1:
+            raise serializers.ValidationError(
+                "Provide both `working_hours_start` and `working_hours_end`."
+            )
+        if None not in hours and hours[0] >= hours[1]:
+            raise serializers.ValidationError(
+                "`working_hours_start` must be earlier than `working_hours_end`."
+            )
+        return attrs
+
+
+class FreeBusySerializer(TimeWindowSerializer):
+    user = BatchSlugRelatedField(
+        many=True, slug_field="email", queryset=APIUser.objects.all(), required=False
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["user"].child_relation.queryset = APIUser.objects.filter(
+            company_id=self.context["request"].user.company_id
+        )
+
+
+class EventRowSerializer:
+    """
+    Read-only `EventSerializer` representation built from `values()` rows.
+
+    Lists skip model instances, field objects and the nested room serializer;
+    participants are fetched with a single query for all rows.
+    """
+
+    columns = [
+        "id",
+        "owner__email",
+        "event_name",
+        "meeting_agenda",
+        "start",
+        "end",
+        "location_id",
+        "location__manager__email",
+        "location__name",
+        "location__address",
+        "recurrence",
+    ]
+
+    def __init__(self, rows):
+        self.rows = list(rows)
+
+    @classmethod
+    def setup_queryset(cls, queryset):
+        return queryset.prefetch_related(None).values(*cls.columns)
+
+    @property
+    @timed("serialize")
+    def data(self):
+        participants = defaultdict(list)
+        ids = [row["id"] for row in self.rows if not row.get("archived")]
+        # Rows of archived meetings, see `api.archive.ArchiveUnion`.
+        archived_ids = [row["id"] for row in self.rows if row.get("archived")]
+        for related_name, meeting_ids in [
+            ("participate", ids),
+            ("archived_participations", archived_ids),
+        ]:
+            if not meeting_ids:
+                continue
+            # Queried like `participant_list.all()` prefetches them, from users
+            # joined to the through table, so emails come in the same order.
+            for meeting_id, email in APIUser.objects.filter(
+                **{f"{related_name}__in": meeting_ids}
+            ).values_list(related_name, "email"):
+                participants[meeting_id].append(email)
+
+        to_representation = datetime_formatter()
+        data = []
+        for row in self.rows:
+            location_id = row["location_id"]
+            data.append(
+                {
+                    "id": str(row["id"]),
+                    "owner": row["owner__email"],
+                    "event_name": row["event_name"],
+                    "meeting_agenda": row["meeting_agenda"],
+                    "start": to_representation(row["start"]),
+                    "end": to_representation(row["end"]),
+                    "participant_list": participants[row["id"]],
+                    "location": (
+                        None
+                        if location_id is None
+                        else {
+                            "id": str(location_id),
+                            "manager": row["location__manager__email"],
+                            "name": row["location__name"],
+                            "address": row["location__address"],
+                        }
+                    ),
+                    "recurrence": row["recurrence"],
+                }
+            )
+        return data
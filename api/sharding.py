@@ -0,0 +1,201 @@
+"""
+Tenant-sharded storage.
+
+Every company's users, rooms, meetings and participations live together on one
+of the database aliases in ``DATABASE_SHARDS``. A tenant's shard is the one
+recorded in the `TenantShard` directory on ``default``, or else chosen by a
+stable hash of its id. `ShardMiddleware` pins the shard of the logged in
+user's company for each request, `ShardBasicAuthentication` that of users
+authenticated by the API, and `ShardRouter` sends that request's queries to
+it; saving an instance routes by the instance's own tenant. With a single
+shard (the default) none of this runs.
+"""
+
+import hashlib
+from contextlib import contextmanager
+from asgiref.local import Local
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework import exceptions, status
+from rest_framework.authentication import BasicAuthentication
+from rest_framework.permissions import SAFE_METHODS
+
+# Session key holding the company of the logged in user.
+TENANT_SESSION_KEY = "_tenant_id"
+
+# Shard of the current request or command.
+state = Local()
+
+
+def get_shards():
+    return getattr(settings, "DATABASE_SHARDS", [DEFAULT_DB_ALIAS])
+
+
+def sharding_enabled():
+    return len(get_shards()) > 1
+
+
+def hashed_shard(tenant_id):
+    """Shard a tenant is placed on unless the directory says otherwise."""
+    shards = get_shards()
+    digest = hashlib.sha256(str(tenant_id).encode()).digest()
+    return shards[int.from_bytes(digest[:8], "big") % len(shards)]
+
+
+def lookup(tenant_id):
+    """Return the directory entry of the tenant, `None` if it has none."""
+    from api.models import TenantShard
+
+    return (
+        TenantShard.objects.using(DEFAULT_DB_ALIAS).filter(tenant_id=tenant_id).first()
+    )
+
+
+def shard_for(tenant_id):
+    """Return the database alias holding the tenant's rows."""
+    if not sharding_enabled():
+        return DEFAULT_DB_ALIAS
+    entry = lookup(tenant_id)
+    return entry.alias if entry is not None else hashed_shard(tenant_id)
+
+
+def pin_tenant(tenant_id):
+    """
+    Route the rest of the request to the tenant's shard; return its directory
+    entry, `None` if it has none.
+    """
+    entry = lookup(tenant_id)
+    state.shard = entry.alias if entry is not None else hashed_shard(tenant_id)
+    return entry
+
+
+def current_shard():
+    return getattr(state, "shard", None)
+
+
+@contextmanager
+def use_shard(alias):
+    """Route unhinted queries of sharded models to `alias` within the block."""
+    previous = current_shard()
+    state.shard = alias
+    try:
+        yield alias
+    finally:
+        state.shard = previous
+
+
+def is_sharded(model):
+    return model._meta.app_label == "api" and model._meta.model_name != "tenantshard"
+
+
+def instance_tenant(instance):
+    for name in ["tenant_id", "company_id"]:
+        tenant_id = getattr(instance, name, None)
+        if tenant_id is not None:
+            return tenant_id
+    return None
+
+
+def shard_of(instance):
+    """Alias to query the instance's tenant on outside the request, if sharded."""
+    return instance._state.db if sharding_enabled() else None
+
+
+def find_user(**filters):
+    """Return the first user matching `filters` on any shard, `None` if there is none."""
+    from api.models import APIUser
+
+    if not sharding_enabled():
+        return APIUser.objects.filter(**filters).first()
+    for alias in get_shards():
+        user = APIUser.objects.using(alias).filter(**filters).first()
+        if user is not None:
+            return user
+    return None
+
+
+class ShardRouter:
+    def db_for_read(self, model, **hints):
+        if not sharding_enabled() or not is_sharded(model):
+            return None
+        instance = hints.get("instance")
+        if instance is not None:
+            if instance._state.db is not None:
+                return instance._state.db
+            tenant_id = instance_tenant(instance)
+            if tenant_id is not None:
+                return shard_for(tenant_id)
+        return current_shard()
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # `_meta` rather than `type()`, as the request user is a lazy proxy.
+        models = [obj1._meta.model, obj2._meta.model]
+        if sharding_enabled() and all(is_sharded(model) for model in models):
+            return obj1._state.db == obj2._state.db
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if app_label == "api" and model_name == "tenantshard":
+            return db == DEFAULT_DB_ALIAS
+        return None
+
+
+class ShardModelBackend(ModelBackend):
+    """
+    Authenticate users of every shard.
+
+    Logging in looks the username up on each shard in turn; later requests
+    load the user from the shard pinned from the session.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if not sharding_enabled() or current_shard() is not None:
+            return super().authenticate(request, username, password, **kwargs)
+        for alias in get_shards():
+            with use_shard(alias):
+                user = super().authenticate(request, username, password, **kwargs)
+            if user is not None:
+                return user
+        return None
+
+    def get_user(self, user_id):
+        if not sharding_enabled() or current_shard() is not None:
+            return super().get_user(user_id)
+        user = find_user(pk=user_id)
+        return user if self.user_can_authenticate(user) else None
+
+
+class TenantMoving(exceptions.APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "The calendar is being moved, retry shortly."
+    default_code = "tenant_moving"
+
+    @property
+    def wait(self):
+        # Sent as ``Retry-After`` by DRF's exception handler.
+        return settings.SHARD_MOVE_GRACE
+
+
+class ShardBasicAuthentication(BasicAuthentication):
+    """
+    Basic authentication routing the request to the shard of the user's
+    company, as `ShardMiddleware` does for sessions.
+
+    Unsafe requests of a tenant being moved between shards are refused.
+    """
+
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is None or not sharding_enabled() or current_shard() is not None:
+            return result
+        user, auth = result
+        entry = pin_tenant(user.company_id)
+        if entry is not None and entry.frozen and request.method not in SAFE_METHODS:
+            raise TenantMoving()
+        if user._state.db != current_shard():
+            # Found on the shard it is being moved away from.
+            user = type(user)._default_manager.get(pk=user.pk)
+        return user, auth
@@ -0,0 +1,58 @@
+"""Invalidate validators and cached lists on every write to calendar data."""
+
+from django.contrib.auth.signals import user_logged_in
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from api.caching import EVENTS, tenant_changed
+from api.instrumentation import install_query_timer
+from api.models import APIUser, Location, Meeting
+from api.sharding import TENANT_SESSION_KEY
+
+USER_FIELDS = {"email", "company_id", "timezone"}
+
+
+@receiver(post_save, sender=Meeting)
+@receiver(post_delete, sender=Meeting)
+def meeting_changed(sender, instance, **kwargs):
+    tenant_changed(instance.tenant_id, [EVENTS])
+
+
+@receiver(post_save, sender=Location)
+@receiver(post_delete, sender=Location)
+def location_changed(sender, instance, **kwargs):
+    # Events embed their location.
+    tenant_changed(instance.tenant_id)
+
+
+@receiver(post_save, sender=APIUser)
+@receiver(post_delete, sender=APIUser)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    # Logins only touch `last_login`, which is never rendered.
+    if update_fields is None or set(update_fields) & USER_FIELDS:
+        tenant_changed(instance.company_id)
+        # A user moving to another company leaves the old one's lists too.
+        previous = getattr(instance, "_loaded_company_id", None)
+        if previous is not None and str(previous) != str(instance.company_id):
+            tenant_changed(previous)
+
+
+@receiver(m2m_changed, sender=Meeting.participant_list.through)
+def participants_changed(sender, instance, action, **kwargs):
+    if not action.startswith("post_"):
+        return
+    if isinstance(instance, Meeting):
+        tenant_changed(instance.tenant_id, [EVENTS])
+    else:
+        tenant_changed(instance.company_id, [EVENTS])
+
+
+@receiver(user_logged_in)
+def remember_tenant(sender, request, user, **kwargs):
+    # Later requests are routed to the company's shard before the user is loaded.
+    request.session[TENANT_SESSION_KEY] = str(user.company_id)
+
+
+@receiver(connection_created)
+def time_queries(sender, connection, **kwargs):
+    install_query_timer(connection)
@@ -1,11 +1,87 @@
+import asyncio
+import base64
+import csv
+import io
+import json
+import tempfile
+import uuid
+from decimal import Decimal
+import threading
+import time
 from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest import mock
+from urllib.parse import urlsplit
 import pytz
 from freezegun import freeze_time
-from django.test import TestCase
+from django.conf import settings
+from django.core import exceptions
+from django.core.handlers import asgi
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import (
+    IntegrityError,
+    OperationalError,
+    connection,
+    connections,
+    transaction,
+)
+from django.http import HttpResponse
+from django.db import router as db_router
+from django.db.models import F
+from django.test import (
+    AsyncClient,
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils.functional import SimpleLazyObject
+from django.utils.timezone import (
+    get_current_timezone,
+    get_current_timezone_name,
+    make_aware,
+)
+from rest_framework.exceptions import ParseError, ValidationError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
 import factory
-from api.models import APIUser, Location, Meeting
-from api.serializers import RoomSerializer, EventSerializer
+from api.asynchronous import ASGIHandler
+from api.intervals import clip, gaps, merge
+from api.parsers import FastJSONParser
+from api.renderers import FastJSONRenderer
+from api.models import (
+    APIUser,
+    ArchivedMeeting,
+    Location,
+    Meeting,
+    TenantArchive,
+    TenantShard,
+    TenantVersion,
+)
+from api import (
+    caching,
+    export,
+    ical,
+    instrumentation,
+    recurrence,
+    scheduling,
+    sharding,
+)
+from api.serializers import LOCATION_BOOKED, RoomSerializer, EventSerializer
+from tango_calendar import routers
+from tango_calendar.middleware import (
+    LazyTimezone,
+    ReplicaMiddleware,
+    ShardMiddleware,
+    TimezoneAwareMiddleware,
+    get_timezone,
+)
 
 
 class UserFactory(factory.django.DjangoModelFactory):
@@ -82,6 +158,52 @@ class TestEventsView(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.json()), 1)
 
+    def test_partial_update_keeps_dates(self):
+        meeting = MeetingFactory.create(owner=self.user, location=self.location)
+        url = f"{self.events_url}{meeting.id}/"
+        response = self.client.patch(url, {"event_name": "Renamed"}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["event_name"], "Renamed")
+
+        # The length is checked against the saved start.
+        response = self.client.patch(
+            url, {"end": "2020-11-27T07:00:00Z"}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        meeting.refresh_from_db()
+        self.assertEqual(meeting.start, datetime(2020, 11, 27, tzinfo=pytz.utc))
+        self.assertEqual(meeting.end, datetime(2020, 11, 27, 7, tzinfo=pytz.utc))
+        response = self.client.patch(
+            url, {"end": "2020-11-27T09:00:00Z"}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+        meeting.refresh_from_db()
+        self.assertEqual(meeting.end, datetime(2020, 11, 27, 7, tzinfo=pytz.utc))
+
+    def test_events_reject_other_tenants(self):
+        other_tenant_user = UserFactory.create(
+            company_id="029cf390-4234-494d-b464-0000deadbeef"
+        )
+        other_tenant_location = LocationFactory.create(manager=other_tenant_user)
+        data = {
+            "event_name": "Event",
+            "meeting_agenda": "Agenda",
+            "start": "2020-11-27T10:00:00Z",
+            "end": "2020-11-27T11:00:00Z",
+            "participant_list": [self.user.email, other_tenant_user.email],
+            "location": str(self.location.id),
+        }
+        response = self.client.post(self.events_url, data, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(other_tenant_user.email, response.json()["participant_list"][0])
+
+        data["participant_list"] = [self.user.email]
+        data["location"] = str(other_tenant_location.id)
+        response = self.client.post(self.events_url, data, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("location", response.json())
+        self.assertFalse(Meeting.objects.exists())
+
     def test_events_access_location_manager(self):
         another_user = UserFactory.create(company_id=self.user.company_id)
         location = LocationFactory(manager=another_user)
@@ -119,6 +241,25 @@ class TestEventsView(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.json()), 1)
 
+    def test_events_visibility_without_distinct(self):
+        query = str(Meeting.objects.visible_to(self.user).query)
+        self.assertNotIn("DISTINCT", query)
+        self.assertIn("EXISTS", query)
+        self.assertNotIn("api_apiuser", query)
+
+    def test_tenant_denormalized(self):
+        event = MeetingFactory.create(owner=self.user)
+        self.assertEqual(str(event.tenant_id), str(self.user.company_id))
+        self.assertEqual(str(self.location.tenant_id), str(self.user.company_id))
+
+        self.user.company_id = "029cf390-4234-494d-b464-0000deadbeef"
+        self.user.save()
+
+        event.refresh_from_db()
+        self.location.refresh_from_db()
+        self.assertEqual(str(event.tenant_id), self.user.company_id)
+        self.assertEqual(str(self.location.tenant_id), self.user.company_id)
+
     def test_events_empty(self):
         response = self.client.get(self.events_url)
         self.assertEqual(response.status_code, 200)
@@ -144,6 +285,57 @@ class TestEventsView(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.json()), 1)
 
+    def test_events_day_filtering_timezone(self):
+        MeetingFactory.create(
+            start=datetime(2020, 11, 26, 23, 30, tzinfo=pytz.utc),
+            end=datetime(2020, 11, 27, 1, tzinfo=pytz.utc),
+            location=self.location,
+        )
+
+        response = self.client.get(self.events_url, data={"day": "2020-11-27"})
+        self.assertEqual(len(response.json()), 0)
+
+        self.user.timezone = "Europe/Warsaw"
+        self.user.save()
+        response = self.client.get(self.events_url, data={"day": "2020-11-27"})
+        self.assertEqual(len(response.json()), 1)
+
+    def test_events_window_filtering(self):
+        day = datetime(2020, 11, 27, tzinfo=pytz.utc)
+        for start_hour, end_hour in [(1, 2), (3, 5), (4, 6), (6, 7)]:
+            MeetingFactory.create(
+                start=day + timedelta(hours=start_hour),
+                end=day + timedelta(hours=end_hour),
+                location=self.location,
+            )
+
+        for params, expected in [
+            ({"from": "2020-11-27T04:00:00", "to": "2020-11-27T06:00:00"}, 2),
+            ({"from": "2020-11-27T02:00:00"}, 3),
+            ({"to": "2020-11-27T03:00:00"}, 1),
+            ({"from": "2020-11-27T06:00:00+01:00", "to": "2020-11-27T07:00"}, 2),
+        ]:
+            with self.subTest(params=params):
+                response = self.client.get(self.events_url, data=params)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.json()), expected)
+
+    def test_events_window_user_timezone(self):
+        MeetingFactory.create(
+            start=datetime(2020, 11, 27, 8, tzinfo=pytz.utc),
+            end=datetime(2020, 11, 27, 9, tzinfo=pytz.utc),
+            location=self.location,
+        )
+        params = {"from": "2020-11-27T09:30:00", "to": "2020-11-27T10:00:00"}
+
+        response = self.client.get(self.events_url, data=params)
+        self.assertEqual(len(response.json()), 0)
+
+        self.user.timezone = "Europe/Warsaw"
+        self.user.save()
+        response = self.client.get(self.events_url, data=params)
+        self.assertEqual(len(response.json()), 1)
+
     @freeze_time("2020-11-30")
     def test_events_timezones(self):
         warsaw_user = UserFactory.create(timezone="Europe/Warsaw")
@@ -248,3 +440,2313 @@ class TestEventsView(TestCase):
             response.json(),
             {"non_field_errors": ["Meetings shouldn’t be longer than 8 hours."]},
         )
+
+    def test_length_limit_on_models(self):
+        start = datetime(2020, 11, 23, 21, 37, tzinfo=pytz.utc)
+        overtime = start + timedelta(hours=8, microseconds=1)
+        meeting = MeetingFactory.build(owner=self.user, start=start, end=overtime)
+        with self.assertRaises(exceptions.ValidationError):
+            meeting.clean()
+
+        # Writes bypassing validation, e.g. bulk ones, are refused too.
+        for model in [Meeting, ArchivedMeeting]:
+            with self.subTest(model=model.__name__):
+                row = model(
+                    id=uuid.uuid4(),
+                    owner=self.user,
+                    tenant_id=self.user.company_id,
+                    event_name="Event",
+                    meeting_agenda="",
+                    start=start,
+                    end=start + timedelta(hours=8),
+                )
+                model.objects.bulk_create([row])
+                row.end = overtime
+                with self.assertRaises(IntegrityError), transaction.atomic():
+                    model.objects.bulk_update([row], ["end"])
+
+
+class TestKeysetPagination(TestCase):
+    def setUp(self):
+        self.user = UserFactory.create()
+        self.client = APIClient()
+        self.client.force_login(self.user)
+        self.location = LocationFactory.create(manager=self.user)
+        self.events_url = "/api/events/"
+        self.rooms_url = "/api/rooms/"
+
+    def create_events(self, count):
+        start = datetime(2020, 11, 27, tzinfo=pytz.utc)
+        return [
+            MeetingFactory.create(
+                start=start + timedelta(hours=index % 3),
+                end=start + timedelta(hours=index % 3 + 1),
+                location=self.location,
+            )
+            for index in range(count)
+        ]
+
+    def collect_pages(self, url, data):
+        items, pages = [], 0
+        while url:
+            response = self.client.get(url, data=data)
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            items.extend(page["results"])
+            url, data, pages = page["next"], None, pages + 1
+        return items, pages
+
+    def test_pagination_opt_in(self):
+        self.create_events(3)
+        response = self.client.get(self.events_url)
+        self.assertEqual(len(response.json()), 3)
+
+    def test_events_pages_ordered_by_start_and_id(self):
+        events = self.create_events(7)
+        expected = sorted(events, key=lambda event: (event.start, str(event.id)))
+
+        items, pages = self.collect_pages(self.events_url, {"page_size": 3})
+
+        self.assertEqual(pages, 3)
+        self.assertEqual([item["id"] for item in items], [str(e.id) for e in expected])
+
+    def test_events_cursor_stable_under_inserts(self):
+        self.create_events(4)
+        response = self.client.get(self.events_url, data={"page_size": 2})
+        first_page = response.json()
+
+        # Rows inserted before the cursor position must not shift later pages.
+        MeetingFactory.create(
+            start=datetime(2020, 11, 26, tzinfo=pytz.utc),
+            end=datetime(2020, 11, 26, 1, tzinfo=pytz.utc),
+            location=self.location,
+        )
+        items, _pages = self.collect_pages(first_page["next"], None)
+
+        seen = [item["id"] for item in first_page["results"] + items]
+        self.assertEqual(len(seen), 4)
+        self.assertEqual(len(set(seen)), 4)
+
+    def test_events_previous_link(self):
+        self.create_events(5)
+        first_page = self.client.get(self.events_url, data={"page_size": 2}).json()
+        self.assertIsNone(first_page["previous"])
+
+        second_page = self.client.get(first_page["next"]).json()
+        previous_page = self.client.get(second_page["previous"]).json()
+        self.assertEqual(previous_page["results"], first_page["results"])
+
+    def test_rooms_pages_ordered_by_name(self):
+        for name in ["C", "A", "B"]:
+            LocationFactory.create(manager=self.user, name=name)
+        self.location.delete()
+
+        items, pages = self.collect_pages(self.rooms_url, {"page_size": 2})
+
+        self.assertEqual(pages, 2)
+        self.assertEqual([item["name"] for item in items], ["A", "B", "C"])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.events_url, data={"cursor": "invalid"})
+        self.assertEqual(response.status_code, 404)
+
+
+class TestEagerLoading(TestCase):
+    def setUp(self):
+        self.user = UserFactory.create()
+        self.client = APIClient()
+        self.client.force_login(self.user)
+        self.location = LocationFactory.create(manager=self.user)
+        self.events_url = "/api/events/"
+        self.rooms_url = "/api/rooms/"
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def create_event(self):
+        event = MeetingFactory.create(
+            location=LocationFactory.create(manager=self.user)
+        )
+        event.participant_list.set(UserFactory.create_batch(3))
+        return event
+
+    def test_events_list_constant_queries(self):
+        self.create_event()
+        single = self.count_queries(self.events_url)
+
+        for _ in range(5):
+            self.create_event()
+        self.assertEqual(self.count_queries(self.events_url), single)
+
+    def test_events_detail_constant_queries(self):
+        event = self.create_event()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f"{self.events_url}{event.id}/")
+        self.assertEqual(response.status_code, 200)
+        # Session, user, meeting with joined relations, participants.
+        self.assertEqual(len(queries), 4)
+
+    def test_rooms_list_constant_queries(self):
+        single = self.count_queries(self.rooms_url)
+
+        LocationFactory.create_batch(5, manager=UserFactory.create())
+        self.assertEqual(self.count_queries(self.rooms_url), single)
+
+
+class TestDoubleBooking(TestCase):
+    def setUp(self):
+        self.user = UserFactory.create()
+        self.client = APIClient()
+        self.client.force_login(self.user)
+        self.location = LocationFactory.create(manager=self.user)
+        self.events_url = "/api/events/"
+        self.event = MeetingFactory.create(
+            start=datetime(2020, 11, 27, 10, tzinfo=pytz.utc),
+            end=datetime(2020, 11, 27, 11, tzinfo=pytz.utc),
+            location=self.location,
+        )
+
+    def book(self, start, end, location=None):
+        return self.client.post(
+            self.events_url,
+            data={
+                "event_name": "Booking",
+                "meeting_agenda": "Agenda",
+                "start": start,
+                "end": end,
+                "participant_list": [self.user.email],
+                "location": (location or self.location).id,
+            },
+            format="json",
+        )
+
+    def test_overlapping_booking_rejected(self):
+        response = self.book("2020-11-27T10:30:00Z", "2020-11-27T12:00:00Z")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(), {"location": ["Location is already booked at this time."]}
+        )
+
+    def test_adjacent_and_other_location_bookings_allowed(self):
+        response = self.book("2020-11-27T11:00:00Z", "2020-11-27T12:00:00Z")
+        self.assertEqual(response.status_code, 201)
+
+        other_location = LocationFactory.create(manager=self.user)
+        response = self.book(
+            "2020-11-27T10:00:00Z", "2020-11-27T11:00:00Z", location=other_location
+        )
+        self.assertEqual(response.status_code, 201)
+
+    def test_update_does_not_conflict_with_itself(self):
+        self.event.participant_list.set([self.user])
+        response = self.client.patch(
+            f"{self.events_url}{self.event.id}/",
+            data={"start": "2020-11-27T10:15:00Z", "end": "2020-11-27T11:15:00Z"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+
+        other = MeetingFactory.create(
+            start=datetime(2020, 11, 27, 12, tzinfo=pytz.utc),
+            end=datetime(2020, 11, 27, 13, tzinfo=pytz.utc),
+            location=self.location,
+        )
+        other.participant_list.set([self.user])
+        response = self.client.patch(
+            f"{self.events_url}{other.id}/",
+            data={"start": "2020-11-27T11:00:00Z", "end": "2020-11-27T12:00:00Z"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class TestConcurrentBooking(TransactionTestCase):
+    writers = 8
+    attempts = 50
+
+    def book(self, user, location, barrier, outcomes):
+        data = {
+            "event_name": "Booking",
+            "meeting_agenda": "Agenda",
+            "start": "2020-11-27T10:00:00Z",
+            "end": "2020-11-27T11:00:00Z",
+            "participant_list": [user.email],
+            "location": location.id,
+        }
+        request = SimpleNamespace(user=user)
+        barrier.wait()
+        for _attempt in range(self.attempts):
+            serializer = EventSerializer(data=data, context={"request": request})
+            try:
+                serializer.is_valid(raise_exception=True)
+                serializer.save()
+            except OperationalError:
+                # In-memory SQLite reports a held lock instead of waiting; retry.
+                time.sleep(0.01)
+                continue
+            except ValidationError:
+                outcomes.append("conflict")
+            else:
+                outcomes.append("created")
+            break
+        else:
+            outcomes.append("locked")
+        connection.close()
+
+    def test_concurrent_writers_single_booking(self):
+        user = UserFactory.create()
+        location = LocationFactory.create(manager=user)
+        barrier = threading.Barrier(self.writers)
+        outcomes = []
+        threads = [
+            threading.Thread(target=self.book, args=(user, location, barrier, outcomes))
+            for _ in range(self.writers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(outcomes.count("locked"), 0, "A writer ran out of retries.")
+        self.assertEqual(outcomes.count("created"), 1)
+        self.assertEqual(outcomes.count("conflict"), self.writers - 1)
+        self.assertEqual(Meeting.objects.filter(location=location).count(), 1)
+
+
+class TestIntervals(TestCase):
+    def test_merge(self):
+        self.assertEqual(merge([(5, 7), (1, 3), (2, 4), (7, 8)]), [(1, 4), (5, 8)])
+        self.assertEqual(merge([(1, 10), (2, 3)]), [(1, 10)])
+        self.assertEqual(merge([]), [])
+
+    def test_gaps(self):
+        busy = [(2, 3), (5, 6), (6, 7)]
+        self.assertEqual(gaps(busy, 0, 10, 1), [(0, 2), (3, 5), (7, 10)])
+        self.assertEqual(gaps(busy, 0, 10, 3), [(7, 10)])
+        self.assertEqual(gaps(busy, 2, 6, 1), [(3, 5)])
+        self.assertEqual(gaps([(0, 10)], 2, 6, 1), [])
+
+    def test_clip(self):
+        self.assertEqual(clip([(0, 3), (4, 6), (8, 9)], 2, 5), [(2, 3), (4, 5)])
+
+
+class TestRoomAvailability(TestCase):
+    def setUp(self):
+        self.user = UserFactory.create()
+        self.client = APIClient()
+        self.client.force_login(self.user)
+        self.availability_url = "/api/rooms/availability/"
+        self.day = datetime(2020, 11, 27, tzinfo=pytz.utc)
+        self.room_a = LocationFactory.create(manager=self.user, name="A")
+        self.room_b = LocationFactory.create(manager=self.user, name="B")
+
+    def book(self, location, start_hour, end_hour):
+        MeetingFactory.create(
+            location=location,
+            start=self.day + timedelta(hours=start_hour),
+            end=self.day + timedelta(hours=end_hour),
+        )
+
+    def test_free_slots_per_room(self):
+        self.book(self.room_a, 9, 10)
+        self.book(self.room_a, 10, 11)
+        self.book(self.room_a, 12, 13)
+        self.book(self.room_b, 7, 12)
+        self.book(self.room_b, 12, 17)
+        other_tenant_room = LocationFactory.create(
+            manager=UserFactory.create(
+                company_id="029cf390-4234-494d-b464-0000deadbeef"
+            )
+        )
+        self.book(other_tenant_room, 9, 10)
+
+        response = self.client.get(
+            self.availability_url,
+            data={
+                "from": "2020-11-27T08:00:00",
+                "to": "2020-11-27T16:00:00",
+                "duration": "01:00:00",
+            },
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(),
+            [
+                {
+                    "id": str(self.room_a.id),
+                    "name": "A",
+                    "free": [
+                        {
+                            "start": "2020-11-27T08:00:00Z",
+                            "end": "2020-11-27T09:00:00Z",
+                        },
+                        {
+                            "start": "2020-11-27T11:00:00Z",
+                            "end": "2020-11-27T12:00:00Z",
+                        },
+                        {
+                            "start": "2020-11-27T13:00:00Z",
+                            "end": "2020-11-27T16:00:00Z",
+                        },
+                    ],
+                },
+                {"id": str(self.room_b.id), "name": "B", "free": []},
+            ],
+        )
+
+    def test_room_filter_and_duration(self):
+        self.book(self.room_a, 9, 10)
+
+        response = self.client.get(
+            self.availability_url,
+            data={
+                "from": "2020-11-27T08:30:00",
+                "to": "2020-11-27T12:00:00",
+                "duration": "01:00:00",
+                "room": [self.room_a.id],
+            },
+        )
+
+        (room,) = response.json()
+        self.assertEqual(room["id"], str(self.room_a.id))
+        self.assertEqual(
+            room["free"],
+            [{"start": "2020-11-27T10:00:00Z", "end": "2020-11-27T12:00:00Z"}],
+        )
+
+    def test_series_and_single_meetings(self):
+        self.book(self.room_a, 9, 10)
+        # Daily at 12:00 from the day before, except on the day itself.
+        MeetingFactory.create(
+            location=self.room_a,
+            start=self.day - timedelta(hours=12),
+            end=self.day - timedelta(hours=11),
+            recurrence="RRULE:FREQ=DAILY\nEXDATE:20201127T120000Z",
+        )
+        # Daily at 14:00 from the day itself.
+        MeetingFactory.create(
+            location=self.room_a,
+            start=self.day + timedelta(hours=14),
+            end=self.day + timedelta(hours=15),
+            recurrence="RRULE:FREQ=DAILY",
+        )
+
+        response = self.client.get(
+            self.availability_url,
+            data={
+                "from": "2020-11-27T08:00:00",
+                "to": "2020-11-28T16:00:00",
+                "duration": "01:00:00",
+                "room": [self.room_a.id],
+            },
+        )
+
+        (room,) = response.json()
+        self.assertEqual(
+            room["free"],
+            [
+                {"start": "2020-11-27T08:00:00Z", "end": "2020-11-27T09:00:00Z"},
+                {"start": "2020-11-27T10:00:00Z", "end": "2020-11-27T14:00:00Z"},
+                {"start": "2020-11-27T15:00:00Z", "end": "2020-11-28T12:00:00Z"},
+                {"start": "2020-11-28T13:00:00Z", "end": "2020-11-28T14:00:00Z"},
+                {"start": "2020-11-28T15:00:00Z", "end": "2020-11-28T16:00:00Z"},
+            ],
+        )
+
+    def test_invalid_window(self):
+        response = self.client.get(
+            self.availability_url,
+            data={
+                "from": "2020-11-27T12:00:00",
+                "to": "2020-11-27T08:00:00",
+                "duration": "01:00:00",
+            },
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class TestScheduling(TestCase):
+    def setUp(self):
+        self.user = UserFactory.create()
+        self.client = APIClient()
+        self.client.force_login(self.user)
+        self.schedule_url = "/api/events/schedule/"
+        self.day = datetime(2020, 11, 27, tzinfo=pytz.utc)
+        self.location = LocationFactory.create(manager=self.user)
+        self.participant = UserFactory.create(timezone="Europe/Warsaw")
+
+    def meeting(self, start_hour, end_hour, **kwargs):
+        return MeetingFactory.create(
+            start=self.day + timedelta(hours=start_hour),
+            end=self.day + timedelta(hours=end_hour),
+            **kwargs,
+        )
+
+    def schedule(self, **data):
+        payload = {
+            "participant_list": [self.user.email, self.participant.email],
+            "from": "2020-11-27T08:00:00Z",
+            "to": "2020-11-27T14:00:00Z",
+            "duration": "01:00:00",
+            "count": 3,
+        }
+        payload.update(data)
+        return self.client.post(self.schedule_url, data=payload, format="json")
+
+    def test_common_free_slots(self):
+        self.meeting(8, 9, owner=self.user, location=None)
+        self.meeting(9, 10, location=None).participant_list.set([self.participant])
+        self.meeting(10, 11, location=self.location)
+
+        response = self.schedule(location=str(self.location.id))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(),
+            [
+                {"start": "2020-11-27T11:00:00Z", "end": "2020-11-27T12:00:00Z"},
+                {"start": "2020-11-27T12:00:00Z", "end": "2020-11-27T13:00:00Z"},
+                {"start": "2020-11-27T13:00:00Z", "end": "2020-11-27T14:00:00Z"},
+            ],
+        )
+
+    def test_working_hours_in_participant_timezone(self):
+        response = self.schedule(
+            working_hours_start="09:00", working_hours_end="13:00", count=10
+        )
+
+        # 09:00-13:00 UTC for the UTC user, 08:00-12:00 UTC for the Warsaw one.
+        self.assertEqual(
+            response.json(),
+            [
+                {"start": "2020-11-27T09:00:00Z", "end": "2020-11-27T10:00:00Z"},
+                {"start": "2020-11-27T10:00:00Z", "end": "2020-11-27T11:00:00Z"},
+                {"start": "2020-11-27T11:00:00Z", "end": "2020-11-27T12:00:00Z"},
+            ],
+        )
+
+    def test_participants_restricted_to_tenant(self):
+        other_tenant_user = UserFactory.create(
+            company_id="029cf390-4234-494d-b464-0000deadbeef"
+        )
+        response = self.schedule(participant_list=[other_tenant_user.email])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("participant_list", response.json())
+
+    def test_bitmap_and_interval_paths_agree(self):
+        start = self.day + timedelta(minutes=7)
+        end = start + timedelta(days=3)
+        busy = [
+            [
+                (
+                    start + timedelta(minutes=50 * i),
+                    start + timedelta(minutes=50 * i + 35),
+                )
+            ]
+            for i in range(0, 80, 3)
+        ] + [[(start + timedelta(hours=20), start + timedelta(hours=22, minutes=1))]]
+        grid = scheduling.SlotGrid(start, end, timedelta(minutes=15))
+
+        for cells in [1, 3, 5]:
+            with self.subTest(cells=cells):
+                self.assertEqual(
+                    scheduling._bitmap_slots(grid, busy, cells, 40),
+                    scheduling._interval_slots(grid, busy, cells, 40),
+                )
+
+
+class TestFreeBusy(TestCase):
+    def setUp(self):
+        self.user = UserFactory.create()
+        self.client = APIClient()
+        self.client.force_login(self.user)
+        self.freebusy_url = "/api/events/freebusy/"
+        self.day = datetime(2020, 11, 27, tzinfo=pytz.utc)
+        self.window = {"from": "2020-11-27T08:00:00Z", "to": "2020-11-27T18:00:00Z"}
+
+    def meeting(self, start_hour, end_hour, **kwargs):
+        return MeetingFactory.create(
+            start=self.day + timedelta(hours=start_hour),
+            end=self.day + timedelta(hours=end_hour),
+            location=None,
+            **kwargs,
+        )
+
+    def test_merged_busy_intervals(self):
+        self.meeting(7, 9, owner=self.user)
+        self.meeting(8, 10).participant_list.set([self.user])
+        self.meeting(12, 13).participant_list.set([self.user])
+        self.meeting(14, 15)
+
+        response = self.client.get(self.freebusy_url, data=self.window)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(),
+            [
+                {
+                    "user": self.user.email,
+                    "busy": [
+                        {
+                            "start": "2020-11-27T08:00:00Z",
+                            "end": "2020-11-27T10:00:00Z",
+                        },
+                        {
+                            "start": "2020-11-27T12:00:00Z",
+                            "end": "2020-11-27T13:00:00Z",
+                        },
+                    ],
+                }
+            ],
+        )
+
+    def test_several_users_single_query_per_source(self):
+        colleague = UserFactory.create()
+        self.meeting(9, 10).participant_list.set([self.user, colleague])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                self.freebusy_url,
+                data={**self.window, "user": [self.user.email, colleague.email]},
+            )
+
+        self.assertEqual(
+            [item["user"] for item in response.json()],
+            [
+                self.user.email,
+                colleague.email,
+            ],
+        )
+        self.assertEqual(response.json()[0]["busy"], response.json()[1]["busy"])
+        # Session, user, email resolution, archive cutoff, participation and
+        # ownership queries.
+        self.assertEqual(len(queries), 6)
+
+    def test_tenant_boundaries(self):
+        other_tenant = "029cf390-4234-494d-b464-0000deadbeef"
+        other_tenant_user = UserFactory.create(company_id=other_tenant)
+        self.meeting(9, 10, owner=UserFactory.create(company_id=other_tenant))
+        Meeting.objects.get().participant_list.set([self.user])
+
+        response = self.client.get(self.freebusy_url, data=self.window)
+        self.assertEqual(response.json()[0]["busy"], [])
+
+        response = self.client.get(
+            self.freebusy_url, data={**self.window, "user": other_tenant_user.email}
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class TestBulkEvents(TestCase):
+    def setUp(self):
+        self.user = UserFactory.create()
+        self.client = APIClient()
+        self.client.force_login(self.user)
+        self.location = LocationFactory.create(manager=self.user)
+        self.bulk_url = "/api/events/bulk/"
+
+    def item(self, hour, **kwargs):
+        return {
+            "event_name": f"Imported {hour}",
+            "meeting_agenda": "Agenda",
+            "start": f"2020-11-27T{hour:02}:00:00Z",
+            "end": f"2020-11-27T{hour + 1:02}:00:00Z",
+            "participant_list": [self.user.email],
+            "location": str(self.location.id),
+            **kwargs,
+        }
+
+    def test_create_batch_with_constant_queries(self):
+        colleagues = UserFactory.create_batch(3)
+        emails = [self.user.email] + [colleague.email for colleague in colleagues]
+        for size in [1, 20]:
+            items = [
+                self.item(hour % 20, location=None, participant_list=emails)
+                for hour in range(size)
+            ]
+            items[0]["location"] = str(self.location.id)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(self.bulk_url, data=items, format="json")
+            self.assertEqual(response.status_code, 200)
+            Meeting.objects.filter(location=self.location).delete()
+            # Session, user, users, locations, savepoints, lock, archive cutoff,
+            # bookings, inserts and the tenant version bump.
+            self.assertEqual(len(queries), 12, msg=size)
+
+        meeting = Meeting.objects.get(id=response.json()[-1]["id"])
+        self.assertEqual(meeting.owner, self.user)
+        self.assertEqual(str(meeting.tenant_id), self.user.company_id)
+        self.assertEqual(
+            set(meeting.participant_list.values_list("email", flat=True)), set(emails)
+        )
+
+    def test_per_item_errors(self):
+        MeetingFactory.create(
+            start=datetime(2020, 11, 27, 10, tzinfo=pytz.utc),
+            end=datetime(2020, 11, 27, 11, tzinfo=pytz.utc),
+            location=self.location,
+        )
+        other_tenant_user = UserFactory.create(
+            company_id="029cf390-4234-494d-b464-0000deadbeef"
+        )
+        items = [
+            self.item(8),
+            self.item(10),
+            self.item(12, end="2020-11-27T22:00:00Z"),
+            self.item(14, participant_list=[other_tenant_user.email]),
+            self.item(8),
+            self.item(16),
+        ]
+
+        response = self.client.post(self.bulk_url, data=items, format="json")
+
+        self.assertEqual(response.status_code, 207)
+        results = response.json()
+        self.assertEqual(
+            [result["status"] for result in results], [201, 400, 400, 400, 400, 201]
+        )
+        booked = {"location": ["Location is already booked at this time."]}
+        self.assertEqual(results[1]["errors"], booked)
+        self.assertEqual(
+            results[2]["errors"],
+            {"non_field_errors": ["Meetings shouldn’t be longer than 8 hours."]},
+        )
+        self.assertEqual(
+            results[3]["errors"],
+            {
+                "participant_list": [
+                    f"Object with email={other_tenant_user.email} does not exist."
+                ]
+            },
+        )
+        self.assertEqual(results[4]["errors"], booked)
+        self.assertEqual(
+            Meeting.objects.filter(event_name__startswith="Imported").count(), 2
+        )
+
+    def test_replace_existing_events(self):
+        event = MeetingFactory.create(
+            start=datetime(2020, 11, 27, 10, tzinfo=pytz.utc),
+            end=datetime(2020, 11, 27, 11, tzinfo=pytz.utc),
+            location=self.location,
+        )
+        event.participant_list.set([self.user])
+        colleague = UserFactory.create()
+
+        response = self.client.post(
+            self.bulk_url,
+            data=[
+                self.item(11, id=str(event.id), participant_list=[colleague.email]),
+                self.item(10),
+                self.item(11),
+            ],
+            format="json",
+        )
+
+        self.assertEqual(
+            [result["status"] for result in response.json()], [200, 201, 400]
+        )
+        event.refresh_from_db()
+        self.assertEqual(event.start, datetime(2020, 11, 27, 11, tzinfo=pytz.utc))
+        self.assertEqual(event.owner, self.user)
+        self.assertEqual(list(event.participant_list.all()), [colleague])
+
+    def test_invalid_batch(self):
+        for data in [{}, []]:
+            with self.subTest(data=data):
+                response = self.client.post(self.bulk_url, data=data, format="json")
+                self.assertEqual(response.status_code, 400)
+
+
+class TestExport(TestCase):
+    def setUp(self):
+        self.user = UserFactory.create(timezone="Europe/Warsaw")
+        self.client = APIClient()
+        self.client.force_login(self.user)
+        self.export_url = "/api/events/export/"
+        self.location = LocationFactory.create(manager=self.user, name="Room, 1")
+        self.guest = UserFactory.create(email="guest@example.com")
+        for day in range(5):
+            meeting = MeetingFactory.create(
+                start=datetime(2020, 11, 27 - day, 8, tzinfo=pytz.utc),
+                end=datetime(2020, 11, 27 - day, 9, tzinfo=pytz.utc),
+                location=self.location if day % 2 else None,
+            )
+            meeting.participant_list.set([self.user])
+        meeting.participant_list.add(self.guest)
+
+    def test_ndjson_matches_list(self):
+        expected = sorted(
+            self.client.get("/api/events/").json(), key=lambda event: event["start"]
+        )
+
+        with mock.patch.object(export, "CHUNK_SIZE", 2):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(self.export_url)
+                self.assertEqual(response["Content-Type"], "application/x-ndjson")
+                content = b"".join(response.streaming_content).decode()
+
+        self.assertEqual([json.loads(line) for line in content.splitlines()], expected)
+        self.assertEqual(expected[0]["start"], "2020-11-23T09:00:00+01:00")
+        # Session, user and archive cutoff, then meetings and participants for
+        # each of 3 chunks.
+        self.assertEqual(len(queries), 3 + 3 * 2)
+
+    def test_csv(self):
+        response = self.client.get(
+            self.export_url, data={"output": "csv", "query": "Event"}
+        )
+
+        self.assertEqual(response["Content-Type"], "text/csv")
+        rows = list(
+            csv.reader(b"".join(response.streaming_content).decode().splitlines())
+        )
+        self.assertEqual(rows[0], export.CSV_COLUMNS)
+        self.assertEqual(len(rows), 6)
+        # Rows are in start order: the first is of the meeting with the guest.
+        participants = Meeting.objects.get(
+            start=datetime(2020, 11, 23, 8, tzinfo=pytz.utc)
+        ).participant_list.all()
+        self.assertCountEqual(participants, [self.user, self.guest])
+        self.assertEqual(
+            rows[1][6:],
+            [" ".join(user.email for user in participants), "", "", ""],
+        )
+        self.assertEqual(
+            rows[2][6:], [self.user.email, str(self.location.id), "Room, 1", ""]
+        )
+
+    def test_invalid_output(self):
+        response = self.client.get(self.export_url, data={"output": "xml"})
+        self.assertEqual(response.status_code, 400)
+
+
+class TestCalendarFeed(TestCase):
+    def setUp(self):
+        self.user = UserFactory.create()
+        self.client = APIClient()
+        self.client.force_login(self.user)
+        self.location = LocationFactory.create(
+            manager=self.user, name="Room; 1", address="Main St, 1"
+        )
+        self.meeting = MeetingFactory.create(
+            location=self.location, meeting_agenda="Line 1\nLine 2, " + "x" * 80
+        )
+        self.meeting.participant_list.set([self.user])
+        self.feed_url = self.client.get("/api/events/feed/").json()["url"]
+        self.client.logout()
+
+    def test_feed(self):
+        response = self.client.get(self.feed_url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/calendar; charset=utf-8")
+        content = b"".join(response.streaming_content).decode()
+        self.assertTrue(content.startswith("BEGIN:VCALENDAR\r\nVERSION:2.0\r\n"))
+        self.assertTrue(content.endswith("END:VCALENDAR\r\n"))
+        self.assertTrue(all(len(line) <= 75 for line in content.split("\r\n")))
+        unfolded = content.replace("\r\n ", "")
+        self.assertIn(f"UID:{self.meeting.id}@tango-calendar\r\n", unfolded)
+        self.assertIn("DTSTART:20201127T000000Z\r\n", unfolded)
+        self.assertIn("LOCATION:Room\\; 1\\, Main St\\, 1\r\n", unfolded)
+        self.assertIn("DESCRIPTION:Line 1\\nLine 2\\, " + "x" * 80, unfolded)
+        self.assertIn(f"ATTENDEE:mailto:{self.user.email}\r\n", unfolded)
+
+    def test_not_modified_without_meeting_queries(self):
+        response = self.client.get(self.feed_url)
+        etag, last_modified = response["ETag"], response["Last-Modified"]
+
+        for headers in [
+            {"HTTP_IF_NONE_MATCH": etag},
+            {"HTTP_IF_MODIFIED_SINCE": last_modified},
+        ]:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(self.feed_url, **headers)
+            self.assertEqual(response.status_code, 304)
+            self.assertFalse(
+                any("api_meeting" in query["sql"] for query in queries.captured_queries)
+            )
+
+        self.meeting.participant_list.remove(self.user)
+        response = self.client.get(self.feed_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_writes_bump_tenant_version(self):
+        def version():
+            return TenantVersion.objects.current(self.user.company_id).version
+
+        for write in [
+            lambda: MeetingFactory.create(location=None, owner=self.user),
+            lambda: self.meeting.participant_list.clear(),
+            lambda: self.location.delete(),
+            lambda: self.user.participate.add(self.meeting),
+        ]:
+            before = version()
+            write()
+            self.assertGreater(version(), before)
+
+        before = version()
+        self.client.force_login(self.user)
+        self.assertEqual(version(), before)
+
+    def test_invalid_token(self):
+        token = ical.feed_token(self.user)
+        response = self.client.get(f"/api/feeds/{token}x.ics")
+        self.assertEqual(response.status_code, 404)
+
+    def test_rotating_revokes_url(self):
+        self.client.force_login(self.user)
+        self.assertEqual(
+            self.client.get("/api/events/feed/").json()["url"], self.feed_url
+        )
+        response = self.client.post("/api/events/feed/")
+        self.assertEqual(response.status_code, 200)
+        new_url = response.json()["url"]
+        self.assertNotEqual(new_url, self.feed_url)
+        self.client.logout()
+
+        self.assertEqual(self.client.get(self.feed_url).status_code, 404)
+        self.assertEqual(self.client.get(new_url).status_code, 200)
+        # Other users' secrets are unchanged.
+        colleague = UserFactory.create(company_id=self.user.company_id)
+        token = ical.feed_token(APIUser.objects.get(pk=colleague.pk))
+        self.assertEqual(self.client.get(f"/api/feeds/{token}.ics").status_code, 200)
+
+
+class TestListETags(TestCase):
+    def setUp(self):
+        self.user = UserFactory.create()
+        self.client = APIClient()
+        self.client.force_login(self.user)
+        self.location = LocationFactory.create(manager=self.user)
+        self.meeting = MeetingFactory.create(location=self.location)
+        self.meeting.participant_list.set([self.user])
+
+    def test_not_modified_skips_queryset(self):
+        for url in ["/api/events/", "/api/rooms/"]:
+            with self.subTest(url=url):
+                etag = self.client.get(url)["ETag"]
+
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response["ETag"], etag)
+                tables = " ".join(query["sql"] for query in queries.captured_queries)
+                self.assertNotIn("api_meeting", tables)
+                self.assertNotIn("api_location", tables)
+
+    def test_writes_change_etag(self):
+        etags = {
+            url: self.client.get(url)["ETag"] for url in ["/api/events/", "/api/rooms/"]
+        }
+
+        LocationFactory.create(manager=self.user)
+        self.meeting.participant_list.clear()
+
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response["ETag"], etag)
+
+    def test_etag_scope(self):
+        events_etag = self.client.get("/api/events/")["ETag"]
+        self.assertNotEqual(
+            self.client.get("/api/events/", data={"query": "x"})["ETag"], events_etag
+        )
+
+        colleague = UserFactory.create()
+        self.client.force_login(colleague)
+        rooms_etag = self.client.get("/api/rooms/")["ETag"]
+        self.assertNotEqual(self.client.get("/api/events/")["ETag"], events_etag)
+        # Rooms are listed per tenant, so colleagues share the validator.
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get("/api/rooms/")["ETag"], rooms_etag)
+
+
+@override_settings(API_LIST_CACHE="default")
+class TestListCache(TestCase):
+    def setUp(self):
+        caching.get_cache().clear()
+        self.user = UserFactory.create()
+        self.client = APIClient()
+        self.client.force_login(self.user)
+        self.location = LocationFactory.create(manager=self.user)
+        self.meeting = MeetingFactory.create(location=self.location)
+        self.meeting.participant_list.set([self.user])
+
+    def test_hit_skips_queryset(self):
+        for url in ["/api/events/", "/api/rooms/"]:
+            with self.subTest(url=url):
+                first = self.client.get(url, data={"query": "Event", "page_size": 5})
+                self.assertEqual(first["X-Cache"], "MISS")
+
+                with CaptureQueriesContext(connection) as queries:
+                    # Same parameters in another order share the entry.
+                    second = self.client.get(f"{url}?page_size=5&query=Event")
+
+                self.assertEqual(second["X-Cache"], "HIT")
+                self.assertEqual(second.content, first.content)
+                self.assertEqual(second["Content-Type"], first["Content-Type"])
+                tables = " ".join(query["sql"] for query in queries.captured_queries)
+                self.assertNotIn("api_meeting", tables)
+                self.assertNotIn("api_location", tables)
+        self.assertEqual(
+            caching.cache_stats(),
+            {"events": {"hits": 1, "misses": 1}, "rooms": {"hits": 1, "misses": 1}},
+        )
+
+    def test_writes_invalidate(self):
+        self.client.get("/api/events/")
+        self.client.get("/api/rooms/")
+
+        self.meeting.participant_list.remove(self.user)
+        response = self.client.get("/api/events/")
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.json()[0]["participant_list"], [])
+        # Meetings don't change the rooms list.
+        self.assertEqual(self.client.get("/api/rooms/")["X-Cache"], "HIT")
+
+        self.location.name = "Renamed"
+        self.location.save()
+        self.assertEqual(self.client.get("/api/rooms/")["X-Cache"], "MISS")
+
+    def test_scoped_by_user(self):
+        colleague = UserFactory.create()
+        self.client.get("/api/events/")
+        self.client.get("/api/rooms/")
+
+        self.client.force_login(colleague)
+        response = self.client.get("/api/events/")
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.json(), [])
+        # Rooms are listed per tenant, so colleagues share the entry.
+        self.assertEqual(self.client.get("/api/rooms/")["X-Cache"], "HIT")
+
+    def test_user_changing_company_invalidates_both(self):
+        colleague = UserFactory.create()
+        self.client.force_login(colleague)
+        self.assertEqual(len(self.client.get("/api/rooms/").json()), 1)
+
+        self.user.company_id = uuid.uuid4()
+        self.user.save()
+        response = self.client.get("/api/rooms/")
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.json(), [])
+
+    @override_settings(DATABASE_REPLICAS=["default"])
+    def test_replica_reads_after_write_not_cached(self):
+        self.location.name = "Renamed"
+        self.location.save()
+        # Read from the replica, which may not have the new name yet.
+        for _ in range(2):
+            self.assertEqual(self.client.get("/api/rooms/")["X-Cache"], "MISS")
+
+        caching.get_cache().delete(caching.written_key(self.user.company_id))
+        self.assertEqual(self.client.get("/api/rooms/")["X-Cache"], "MISS")
+        self.assertEqual(self.client.get("/api/rooms/")["X-Cache"], "HIT")
+
+    @override_settings(API_LIST_CACHE=None)
+    def test_disabled_by_default(self):
+        for _ in range(2):
+            response = self.client.get("/api/events/")
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn("X-Cache", response)
+        self.assertEqual(
+            caching.cache_stats(),
+            {"events": {"hits": 0, "misses": 0}, "rooms": {"hits": 0, "misses": 0}},
+        )
+
+
+class TestEventRowSerializer(TestCase):
+    def setUp(self):
+        self.user = UserFactory.create(
+            id="e3f1c2d4-5b6a-4c7d-8e9f-0a1b2c3d4e02",
+            email="owner@example.org",
+            timezone="America/New_York",
+        )
+        self.client = APIClient()
+        self.client.force_login(self.user)
+        location = LocationFactory.create(
+            id="5a3b2a45-6bd4-4b8e-9e55-3f7b0d0c2f10",
+            manager=self.user,
+            name="Room 1",
+            address="Main St",
+        )
+        with_location = MeetingFactory.create(
+            id="0b1d6f6e-3d7e-4f5b-8f1a-8c3e5f2d9a01",
+            owner=self.user,
+            event_name="Planning",
+            meeting_agenda="Agenda",
+            start=datetime(2020, 11, 27, 15, 30, 0, 250000, tzinfo=pytz.utc),
+            end=datetime(2020, 11, 27, 16, tzinfo=pytz.utc),
+            location=location,
+        )
+        # Participants come in the order of the relation, here by user id.
+        with_location.participant_list.set(
+            [
+                self.user,
+                UserFactory.create(
+                    id="e3f1c2d4-5b6a-4c7d-8e9f-0a1b2c3d4e01", email="b@example.org"
+                ),
+            ]
+        )
+        MeetingFactory.create(
+            id="0b1d6f6e-3d7e-4f5b-8f1a-8c3e5f2d9a02",
+            owner=self.user,
+            event_name="Remote",
+            meeting_agenda="",
+            start=datetime(2020, 6, 1, 12, tzinfo=pytz.utc),
+            end=datetime(2020, 6, 1, 13, tzinfo=pytz.utc),
+            location=None,
+        ).participant_list.set([self.user])
+
+    def test_golden_output(self):
+        response = self.client.get("/api/events/", data={"page_size": 10})
+
+        self.assertEqual(
+            response.json()["results"],
+            [
+                {
+                    "id": "0b1d6f6e-3d7e-4f5b-8f1a-8c3e5f2d9a02",
+                    "owner": "owner@example.org",
+                    "event_name": "Remote",
+                    "meeting_agenda": "",
+                    "start": "2020-06-01T08:00:00-04:00",
+                    "end": "2020-06-01T09:00:00-04:00",
+                    "participant_list": ["owner@example.org"],
+                    "location": None,
+                    "recurrence": "",
+                },
+                {
+                    "id": "0b1d6f6e-3d7e-4f5b-8f1a-8c3e5f2d9a01",
+                    "owner": "owner@example.org",
+                    "event_name": "Planning",
+                    "meeting_agenda": "Agenda",
+                    "start": "2020-11-27T10:30:00.250000-05:00",
+                    "end": "2020-11-27T11:00:00-05:00",
+                    "participant_list": ["b@example.org", "owner@example.org"],
+                    "location": {
+                        "id": "5a3b2a45-6bd4-4b8e-9e55-3f7b0d0c2f10",
+                        "manager": "owner@example.org",
+                        "name": "Room 1",
+                        "address": "Main St",
+                    },
+                    "recurrence": "",
+                },
+            ],
+        )
+
+    def test_matches_event_serializer(self):
+        events = self.client.get("/api/events/").json()
+
+        self.assertEqual(len(events), 2)
+        for event in events:
+            with self.subTest(id=event["id"]):
+                # Details are rendered by `EventSerializer`.
+                response = self.client.get(f"/api/events/{event['id']}/")
+                self.assertEqual(event, response.json())
+
+
+class TestFastJSON(TestCase):
+    def payload(self):
+        warsaw = pytz.timezone("Europe/Warsaw")
+        return {
+            "id": uuid.UUID(int=42),
+            "start": datetime(2020, 11, 27, 10, 30, 0, 5, tzinfo=pytz.utc),
+            "local": warsaw.localize(datetime(2020, 11, 27, 10)),
+            "london": pytz.timezone("Europe/London").localize(datetime(2020, 1, 1)),
+            "day": datetime(2020, 11, 27).date(),
+            "price": Decimal("1.50"),
+            "text": "Zażółć\u2028gęślą\u2029jaźń",
+            "nested": [{"empty": None, "flag": True, "count": 3}],
+        }
+
+    def test_renders_like_stdlib_renderer(self):
+        payload = self.payload()
+        self.assertEqual(
+            FastJSONRenderer().render(payload), JSONRenderer().render(payload)
+        )
+        self.assertEqual(
+            FastJSONRenderer().render(payload, "application/json; indent=2"),
+            JSONRenderer().render(payload, "application/json; indent=2"),
+        )
+        self.assertEqual(
+            FastJSONRenderer().render([2**70]), b"[1180591620717411303424]"
+        )
+        self.assertEqual(FastJSONRenderer().render(None), b"")
+
+    def test_parses_like_stdlib_parser(self):
+        content = JSONRenderer().render(self.payload())
+        self.assertEqual(
+            FastJSONParser().parse(io.BytesIO(content)),
+            JSONParser().parse(io.BytesIO(content)),
+        )
+        for invalid in [b"{", b'{"value": NaN}']:
+            with self.subTest(content=invalid):
+                with self.assertRaises(ParseError):
+                    FastJSONParser().parse(io.BytesIO(invalid))
+
+    def test_events_in_user_timezone(self):
+        user = UserFactory.create(timezone="Asia/Kolkata")
+        client = APIClient()
+        client.force_login(user)
+
+        response = client.post(
+            "/api/events/",
+            data=json.dumps(
+                {
+                    "event_name": "Call",
+                    "meeting_agenda": "First\u2028second",
+                    "start": "2020-11-27T10:00:00Z",
+                    "end": "2020-11-27T11:00:00Z",
+                    "participant_list": [user.email],
+                    "location": None,
+                }
+            ),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(b'"First\\u2028second"', response.content)
+        self.assertIn(b'"start":"2020-11-27T15:30:00+05:30"', response.content)
+
+
+class TestFullTextSearch(TestCase):
+    def setUp(self):
+        self.user = UserFactory.create()
+        self.client = APIClient()
+        self.client.force_login(self.user)
+        self.location = LocationFactory.create(manager=self.user)
+
+    def meeting(self, event_name, meeting_agenda):
+        return MeetingFactory.create(
+            event_name=event_name, meeting_agenda=meeting_agenda, location=self.location
+        )
+
+    def search(self, query):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/events/", data={"query": query})
+        self.assertTrue(
+            any("api_meeting_fts" in query["sql"] for query in queries.captured_queries)
+        )
+        return [event["event_name"] for event in response.json()]
+
+    def test_prefix_match_ranked_by_field(self):
+        self.meeting("Weekly sync", "Roadmap planning")
+        self.meeting("Planning session", "Quarterly goals")
+        self.meeting("Retro", "What went well")
+
+        self.assertEqual(self.search("plan"), ["Planning session", "Weekly sync"])
+        self.assertEqual(self.search("plan roadm"), ["Weekly sync"])
+        self.assertEqual(self.search("zażółć"), [])
+        self.assertEqual(self.search('"plan" OR'), [])
+
+    def test_index_follows_writes(self):
+        meeting = self.meeting("Kickoff", "Agenda")
+        self.assertEqual(self.search("kick"), ["Kickoff"])
+
+        meeting.event_name = "Handover"
+        meeting.save()
+        self.assertEqual(self.search("kick"), [])
+        self.assertEqual(self.search("hand"), ["Handover"])
+
+        Meeting.objects.filter(pk=meeting.pk).update(meeting_agenda="Offboarding")
+        self.assertEqual(self.search("offboard"), ["Handover"])
+
+        meeting.delete()
+        self.assertEqual(self.search("hand"), [])
+
+
+class TestTimezoneMiddleware(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.loads = 0
+
+    def request(self, timezone_name="Asia/Tokyo"):
+        def load():
+            self.loads += 1
+            return SimpleNamespace(timezone=timezone_name)
+
+        request = self.factory.get("/api/events/")
+        request.user = SimpleLazyObject(load)
+        return request
+
+    def test_user_loaded_only_when_timezone_used(self):
+        middleware = TimezoneAwareMiddleware(lambda request: HttpResponse())
+        middleware(self.request())
+        self.assertEqual(self.loads, 0)
+
+        def view(request):
+            value = datetime(2020, 11, 27, 12, tzinfo=pytz.utc)
+            return HttpResponse(value.astimezone(get_current_timezone()).isoformat())
+
+        response = TimezoneAwareMiddleware(view)(self.request())
+        self.assertEqual(response.content, b"2020-11-27T21:00:00+09:00")
+        self.assertEqual(self.loads, 1)
+
+    def test_lazy_timezone_matches_pytz(self):
+        for name in ["Europe/Warsaw", "America/New_York", "UTC"]:
+            with self.subTest(name):
+                lazy, tz = LazyTimezone(lambda: name), pytz.timezone(name)
+                self.assertIs(get_timezone(name), tz)
+                for value in [datetime(2020, 3, 29, 1), datetime(2020, 7, 1, 12)]:
+                    aware = value.replace(tzinfo=pytz.utc)
+                    self.assertEqual(
+                        aware.astimezone(lazy).isoformat(),
+                        aware.astimezone(tz).isoformat(),
+                    )
+                    self.assertEqual(make_aware(value, lazy), make_aware(value, tz))
+                    self.assertEqual(lazy.utcoffset(value), tz.utcoffset(value))
+                self.assertEqual(lazy.tzname(None), name)
+
+    def test_async(self):
+        async def view(request):
+            return HttpResponse(get_current_timezone_name())
+
+        middleware = TimezoneAwareMiddleware(view)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        response = asyncio.run(middleware(self.request("Europe/Lisbon")))
+        self.assertEqual(response.content, b"Europe/Lisbon")
+
+
+class TestAsyncViews(TransactionTestCase):
+    def setUp(self):
+        self.user = UserFactory(timezone="Asia/Tokyo")
+        self.location = LocationFactory(manager=self.user)
+        self.meeting = MeetingFactory(location=self.location)
+        self.meeting.participant_list.add(self.user)
+        self.client = APIClient()
+        self.client.force_login(self.user)
+        self.async_client = AsyncClient()
+        self.async_client.force_login(self.user)
+
+    def test_views_are_coroutines(self):
+        for path in ["/api/async/events/", f"/api/async/rooms/{self.location.id}/"]:
+            with self.subTest(path):
+                self.assertTrue(asyncio.iscoroutinefunction(resolve(path).func))
+
+    def test_same_responses_as_sync_views(self):
+        for resource, pk in [("events", self.meeting.id), ("rooms", self.location.id)]:
+            for path in [
+                f"{resource}/",
+                f"{resource}/{pk}/",
+                f"{resource}/?page_size=1",
+            ]:
+                with self.subTest(path):
+                    expected = self.client.get(f"/api/{path}")
+                    response = asyncio.run(self.async_client.get(f"/api/async/{path}"))
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(response.json(), expected.json())
+
+        event = asyncio.run(
+            self.async_client.get(f"/api/async/events/{self.meeting.id}/")
+        ).json()
+        self.assertEqual(event["start"], "2020-11-27T09:00:00+09:00")
+
+    def test_visibility(self):
+        other = MeetingFactory(owner=self.user)
+        response = asyncio.run(self.async_client.get(f"/api/async/events/{other.id}/"))
+        self.assertEqual(response.status_code, 404)
+
+        response = asyncio.run(AsyncClient().get("/api/async/events/"))
+        self.assertEqual(response.status_code, 403)
+
+    def asgi_get(self, application, url):
+        """Serve a GET of `url` with the ASGI `application`; return status and body."""
+        url = urlsplit(url)
+        session = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "path": url.path,
+            "query_string": url.query.encode(),
+            "headers": [
+                (b"host", b"testserver"),
+                (b"cookie", f"{settings.SESSION_COOKIE_NAME}={session}".encode()),
+            ],
+        }
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": b""}
+
+        async def send(message):
+            messages.append(message)
+
+        asyncio.run(application(scope, receive, send))
+        body = b"".join(message.get("body", b"") for message in messages[1:])
+        return messages[0]["status"], body.decode()
+
+    def test_streamed_bodies(self):
+        application = ASGIHandler()
+        status, body = self.asgi_get(application, "/api/events/export/")
+        self.assertEqual(status, 200)
+        self.assertEqual(
+            [json.loads(line)["id"] for line in body.splitlines()],
+            [str(self.meeting.id)],
+        )
+
+        feed_url = self.client.get("/api/events/feed/").json()["url"]
+        status, body = self.asgi_get(application, feed_url)
+        self.assertEqual(status, 200)
+        self.assertIn(f"UID:{self.meeting.id}", body)
+
+        # Django's handler iterates streamed bodies in the event loop.
+        with self.assertRaises(exceptions.SynchronousOnlyOperation):
+            self.asgi_get(asgi.ASGIHandler(), "/api/events/export/")
+
+    def test_queries_in_thread_pool_are_timed(self):
+        instrumentation.metrics.reset()
+        response = asyncio.run(self.async_client.get("/api/async/events/"))
+        self.assertNotIn('desc="0 queries"', response["Server-Timing"])
+        self.assertIn(
+            'api_request_queries_count{view="EventsView.list"} 1',
+            instrumentation.metrics.exposition(),
+        )
+
+
+class TestRecurrence(TestCase):
+    def setUp(self):
+        self.user = UserFactory.create(timezone="Europe/Warsaw")
+        self.location = LocationFactory.create(manager=self.user)
+        self.client = APIClient()
+        self.client.force_login(self.user)
+        # Monday 09:00 in Warsaw, a week before the switch to winter time.
+        self.start = datetime(2020, 10, 19, 7, tzinfo=pytz.utc)
+
+    def occurrences(self, rule, start=None, end=None, hours=1):
+        return list(
+            recurrence.occurrences(
+                self.start,
+                self.start + timedelta(hours=hours),
+                rule,
+                "Europe/Warsaw",
+                start or self.start,
+                end or self.start + timedelta(days=400),
+            )
+        )
+
+    def event(self, start, rule="", **kwargs):
+        return {
+            "event_name": "Standup",
+            "meeting_agenda": "Agenda",
+            "start": start.isoformat(),
+            "end": (start + timedelta(minutes=15)).isoformat(),
+            "participant_list": [self.user.email],
+            "location": self.location.id,
+            "recurrence": rule,
+            **kwargs,
+        }
+
+    def test_wall_clock_time_kept(self):
+        starts = [
+            start
+            for start, _ in self.occurrences("RRULE:FREQ=WEEKLY;BYDAY=MO,WE;COUNT=5")
+        ]
+        self.assertEqual(
+            starts,
+            [
+                datetime(2020, 10, 19, 7, tzinfo=pytz.utc),
+                datetime(2020, 10, 21, 7, tzinfo=pytz.utc),
+                datetime(2020, 10, 26, 8, tzinfo=pytz.utc),
+                datetime(2020, 10, 28, 8, tzinfo=pytz.utc),
+                datetime(2020, 11, 2, 8, tzinfo=pytz.utc),
+            ],
+        )
+
+    def test_window_expansion_matches_full_expansion(self):
+        rules = [
+            "RRULE:FREQ=DAILY;INTERVAL=3",
+            "RRULE:FREQ=WEEKLY;INTERVAL=2;BYDAY=SU,TU,SA;COUNT=40",
+            "RRULE:FREQ=WEEKLY;UNTIL=20210301T000000Z\nEXDATE:20201102T080000Z",
+            "RRULE:FREQ=MONTHLY;COUNT=6",
+        ]
+        for rule in rules:
+            everything = self.occurrences(rule, hours=8)
+            for days in [0, 5, 17, 45, 150]:
+                window_start = self.start + timedelta(days=days, hours=3)
+                window_end = window_start + timedelta(days=9)
+                with self.subTest(rule=rule, days=days):
+                    self.assertEqual(
+                        self.occurrences(rule, window_start, window_end, hours=8),
+                        [
+                            (start, end)
+                            for start, end in everything
+                            if start < window_end and end > window_start
+                        ],
+                    )
+
+    def test_missing_days_skipped(self):
+        self.start = datetime(2021, 1, 31, 8, tzinfo=pytz.utc)
+        starts = [
+            start.date() for start, _ in self.occurrences("RRULE:FREQ=MONTHLY;COUNT=3")
+        ]
+        self.assertEqual(
+            starts,
+            [datetime(2021, month, 31).date() for month in [1, 3, 5]],
+        )
+
+    def test_series_end(self):
+        end = self.start + timedelta(hours=1)
+        cases = [
+            ("RRULE:FREQ=DAILY;COUNT=3", datetime(2020, 10, 21, 8, tzinfo=pytz.utc)),
+            (
+                "RRULE:FREQ=DAILY;UNTIL=20201101T000000Z",
+                datetime(2020, 11, 1, 1, tzinfo=pytz.utc),
+            ),
+            ("RRULE:FREQ=DAILY", recurrence.FOREVER),
+        ]
+        for rule, expected in cases:
+            with self.subTest(rule):
+                self.assertEqual(
+                    recurrence.series_end(self.start, end, rule, "UTC"),
+                    expected,
+                )
+
+    def test_unsupported_rules(self):
+        for rule in [
+            "FREQ=DAILY",
+            "RRULE:FREQ=HOURLY",
+            "RRULE:FREQ=DAILY;COUNT=2;UNTIL=20201101T000000Z",
+            "RRULE:FREQ=DAILY;BYMONTH=1",
+            "RRULE:FREQ=WEEKLY;BYDAY=XX",
+            "RRULE:FREQ=DAILY;COUNT=0",
+            "RRULE:FREQ=DAILY\nEXDATE:2020-11-01",
+        ]:
+            with self.subTest(rule):
+                with self.assertRaises(ValueError):
+                    recurrence.RecurrenceRule.parse(rule)
+
+        response = self.client.post(
+            "/api/events/",
+            data=self.event(self.start, "RRULE:FREQ=HOURLY"),
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("recurrence", response.json())
+
+    def test_weekly_rule_includes_start(self):
+        rule = "RRULE:FREQ=WEEKLY;BYDAY=TU,WE"
+        response = self.client.post(
+            "/api/events/", data=self.event(self.start, rule), format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(),
+            {"recurrence": ["BYDAY must include the weekday of the start."]},
+        )
+
+        # Late on Monday in UTC, already Tuesday in Warsaw.
+        tuesday = datetime(2020, 10, 19, 23, 30, tzinfo=pytz.utc)
+        response = self.client.post(
+            "/api/events/", data=self.event(tuesday, rule), format="json"
+        )
+        self.assertEqual(response.status_code, 201)
+
+        # Moving the start off the rule's weekdays is refused too.
+        url = f"/api/events/{response.json()['id']}/"
+        response = self.client.patch(
+            url, {"start": "2020-10-22T23:30:00Z", "end": "2020-10-22T23:45:00Z"}
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_series_stored_once_and_expanded(self):
+        response = self.client.post(
+            "/api/events/",
+            data=self.event(self.start, "RRULE:FREQ=WEEKLY;BYDAY=MO,TH"),
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Meeting.objects.count(), 1)
+
+        window = {"from": "2022-03-01T00:00:00Z", "to": "2022-03-15T00:00:00Z"}
+        response = self.client.get("/api/events/occurrences/", data=window)
+        self.assertEqual(
+            [event["start"] for event in response.json()],
+            [
+                "2022-03-03T09:00:00+01:00",
+                "2022-03-07T09:00:00+01:00",
+                "2022-03-10T09:00:00+01:00",
+                "2022-03-14T09:00:00+01:00",
+            ],
+        )
+        self.assertTrue(all(event["recurring"] for event in response.json()))
+
+        response = self.client.get("/api/events/", data=window)
+        self.assertEqual(len(response.json()), 1)
+
+        response = self.client.get(
+            "/api/events/freebusy/",
+            data={"from": "2022-03-03T00:00:00Z", "to": "2022-03-04T00:00:00Z"},
+        )
+        self.assertEqual(
+            response.json()[0]["busy"],
+            [
+                {
+                    "start": "2022-03-03T09:00:00+01:00",
+                    "end": "2022-03-03T09:15:00+01:00",
+                }
+            ],
+        )
+
+    def test_window_between_occurrences(self):
+        response = self.client.post(
+            "/api/events/",
+            data=self.event(self.start, "RRULE:FREQ=WEEKLY;COUNT=10"),
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        for params, listed in [
+            # Tuesday to Wednesday of the second week.
+            ({"from": "2020-10-27T00:00:00Z", "to": "2020-10-29T00:00:00Z"}, False),
+            ({"from": "2020-10-27T00:00:00Z"}, True),
+            ({"from": "2020-10-27T00:00:00Z", "to": "2020-11-03T00:00:00Z"}, True),
+            ({"day": "2020-10-27"}, False),
+            ({"day": "2020-11-02"}, True),
+            # After the tenth and last occurrence.
+            ({"day": "2020-12-28"}, False),
+            ({"from": "2020-12-22T00:00:00Z"}, False),
+        ]:
+            with self.subTest(**params):
+                response = self.client.get("/api/events/", data=params)
+                self.assertEqual(len(response.json()), int(listed))
+
+    def test_endless_series_from(self):
+        response = self.client.post(
+            "/api/events/",
+            data=self.event(self.start, "RRULE:FREQ=DAILY"),
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        generated = []
+
+        def counted(*args):
+            for occurrence in recurrence.occurrences(*args):
+                generated.append(occurrence)
+                yield occurrence
+
+        with mock.patch("api.models.occurrences", counted):
+            response = self.client.get(
+                "/api/events/", data={"from": "2021-10-27T00:00:00Z"}
+            )
+        self.assertEqual(len(response.json()), 1)
+        # Expanded up to the first occurrence in the window, not until `FOREVER`.
+        self.assertEqual(len(generated), 1)
+
+    def test_location_conflicts_with_occurrences(self):
+        response = self.client.post(
+            "/api/events/",
+            data=self.event(self.start, "RRULE:FREQ=WEEKLY;COUNT=10"),
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+
+        # 09:00 in Warsaw on the third Monday, after the switch to winter time.
+        third = datetime(2020, 11, 2, 8, tzinfo=pytz.utc)
+        response = self.client.post(
+            "/api/events/", data=self.event(third), format="json"
+        )
+        self.assertEqual(response.json(), {"location": [LOCATION_BOOKED]})
+        response = self.client.post(
+            "/api/events/",
+            data=self.event(self.start + timedelta(days=1), "RRULE:FREQ=DAILY"),
+            format="json",
+        )
+        self.assertEqual(response.json(), {"location": [LOCATION_BOOKED]})
+
+        items = [
+            self.event(third),
+            self.event(third + timedelta(days=1)),
+            self.event(third + timedelta(days=2), "RRULE:FREQ=WEEKLY;BYDAY=WE,FR"),
+            self.event(third + timedelta(days=4)),
+        ]
+        response = self.client.post("/api/events/bulk/", data=items, format="json")
+        self.assertEqual(
+            [result["status"] for result in response.json()], [400, 201, 201, 400]
+        )
+
+    def test_calendar_lines(self):
+        meeting = MeetingFactory.create(
+            owner=self.user,
+            start=self.start,
+            end=self.start + timedelta(hours=1),
+            recurrence="RRULE:FREQ=WEEKLY;COUNT=3\nEXDATE:20201026T080000Z",
+        )
+        lines = list(ical.event_lines(meeting, "20201018T000000Z"))
+        self.assertIn("DTSTART;TZID=Europe/Warsaw:20201019T090000", lines)
+        self.assertIn("DTEND;TZID=Europe/Warsaw:20201019T100000", lines)
+        self.assertIn("RRULE:FREQ=WEEKLY;COUNT=3", lines)
+        self.assertIn("EXDATE:20201026T080000Z", lines)
+        self.assertEqual(
+            meeting.recurrence_end, datetime(2020, 11, 2, 9, tzinfo=pytz.utc)
+        )
+
+        content = "".join(ical.calendar_lines(Meeting.objects.all(), "Calendar"))
+        timezone_start = content.index("BEGIN:VTIMEZONE\r\nTZID:Europe/Warsaw\r\n")
+        self.assertLess(timezone_start, content.index("BEGIN:VEVENT"))
+        self.assertEqual(content.count("BEGIN:VTIMEZONE"), 1)
+        # The switch to winter time within the series.
+        self.assertIn(
+            "BEGIN:STANDARD\r\nDTSTART:20201025T030000\r\n"
+            "TZOFFSETFROM:+0200\r\nTZOFFSETTO:+0100\r\nTZNAME:CET\r\n",
+            content,
+        )
+
+    def test_series_end_follows_owner_timezone(self):
+        meeting = MeetingFactory.create(
+            owner=self.user,
+            start=self.start,
+            end=self.start + timedelta(hours=1),
+            recurrence="RRULE:FREQ=WEEKLY;COUNT=3",
+        )
+        # Without winter time, the last occurrence stays at 07:00 UTC.
+        self.user.timezone = "Asia/Tokyo"
+        self.user.save()
+        meeting.refresh_from_db()
+        self.assertEqual(
+            meeting.recurrence_end, datetime(2020, 11, 2, 8, tzinfo=pytz.utc)
+        )
+
+
+@override_settings(DATABASE_REPLICAS=["replica"])
+class TestReplicaRouting(SimpleTestCase):
+    def request(self, method="get", pinned=False):
+        request = getattr(RequestFactory(), method)("/api/events/")
+        if pinned:
+            request.COOKIES[routers.PIN_COOKIE] = "1"
+        return request
+
+    def route(self, request, write=False):
+        routes = {}
+
+        def view(request):
+            routes["read"] = db_router.db_for_read(Meeting)
+            if write:
+                routes["write"] = db_router.db_for_write(Meeting)
+            return HttpResponse()
+
+        response = ReplicaMiddleware(view)(request)
+        return routes, routers.PIN_COOKIE in response.cookies
+
+    def test_safe_requests_read_from_replica(self):
+        self.assertEqual(self.route(self.request()), ({"read": "replica"}, False))
+        self.assertEqual(self.route(self.request("post")), ({"read": "default"}, False))
+
+    def test_writes_pin_client_to_primary(self):
+        routes, pinned = self.route(self.request("post"), write=True)
+        self.assertEqual(routes, {"read": "default", "write": "default"})
+        self.assertTrue(pinned)
+
+        routes, _ = self.route(self.request(pinned=True))
+        self.assertEqual(routes, {"read": "default"})
+        self.assertEqual(db_router.db_for_read(Meeting), "default")
+
+    def test_without_replicas(self):
+        with override_settings(DATABASE_REPLICAS=[]):
+            self.assertEqual(
+                self.route(self.request(), write=True),
+                ({"read": "default", "write": "default"}, False),
+            )
+
+
+@override_settings(DATABASE_SHARDS=["default", "shard"])
+class TestSharding(TestCase):
+    def setUp(self):
+        self.user = UserFactory()
+        self.tenant_id = self.user.company_id
+
+    def route(self, method="get", tenant_id=None):
+        request = getattr(RequestFactory(), method)("/api/events/")
+        request.session = {}
+        if tenant_id is not None:
+            request.session[sharding.TENANT_SESSION_KEY] = str(tenant_id)
+        routes = {}
+
+        def view(request):
+            routes["read"] = db_router.db_for_read(Meeting)
+            routes["write"] = db_router.db_for_write(Meeting)
+            return HttpResponse()
+
+        response = ShardMiddleware(view)(request)
+        return routes, response.status_code
+
+    def test_tenants_are_spread_by_stable_hash(self):
+        tenants = [uuid.UUID(int=number) for number in range(100)]
+        placement = [sharding.hashed_shard(tenant_id) for tenant_id in tenants]
+        self.assertEqual(set(placement), {"default", "shard"})
+        self.assertEqual(placement, [sharding.hashed_shard(t) for t in tenants])
+
+    def test_directory_overrides_hash(self):
+        TenantShard.objects.create(tenant_id=self.tenant_id, alias="shard")
+        self.assertEqual(sharding.shard_for(self.tenant_id), "shard")
+        other = uuid.uuid4()
+        self.assertEqual(sharding.shard_for(other), sharding.hashed_shard(other))
+
+    def test_router(self):
+        TenantShard.objects.create(tenant_id=self.tenant_id, alias="shard")
+        meeting = Meeting(tenant_id=self.tenant_id)
+        self.assertEqual(db_router.db_for_write(Meeting, instance=meeting), "shard")
+        self.assertEqual(db_router.db_for_read(Meeting, instance=self.user), "default")
+        self.assertEqual(db_router.db_for_read(Meeting), "default")
+        with sharding.use_shard("shard"):
+            self.assertEqual(db_router.db_for_read(Meeting), "shard")
+            self.assertEqual(db_router.db_for_read(APIUser), "shard")
+            self.assertEqual(db_router.db_for_write(TenantShard), "default")
+        self.assertFalse(
+            db_router.allow_migrate("shard", "api", model_name="tenantshard")
+        )
+        self.assertTrue(db_router.allow_migrate("shard", "api", model_name="meeting"))
+
+    def test_requests_are_pinned_to_tenant_shard(self):
+        expected = sharding.hashed_shard(self.tenant_id)
+        self.assertEqual(
+            self.route(tenant_id=self.tenant_id),
+            ({"read": expected, "write": expected}, 200),
+        )
+        TenantShard.objects.create(tenant_id=self.tenant_id, alias="shard")
+        self.assertEqual(
+            self.route(tenant_id=self.tenant_id),
+            ({"read": "shard", "write": "shard"}, 200),
+        )
+        self.assertEqual(db_router.db_for_read(Meeting), "default")
+        self.assertEqual(self.route(), ({"read": "default", "write": "default"}, 200))
+
+    def test_writes_refused_while_tenant_moves(self):
+        TenantShard.objects.create(
+            tenant_id=self.tenant_id, alias="default", frozen=True
+        )
+        client = APIClient()
+        client.force_login(self.user)
+        self.assertEqual(
+            client.session[sharding.TENANT_SESSION_KEY], str(self.tenant_id)
+        )
+        self.assertEqual(client.get("/api/events/").status_code, 200)
+        response = client.post("/api/events/", {}, format="json")
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("Retry-After", response)
+
+    def test_login_looks_up_every_shard(self):
+        self.user.set_password("secret")
+        self.user.save()
+        TenantShard.objects.create(tenant_id=self.tenant_id, alias="default")
+        client = APIClient()
+        self.assertTrue(client.login(username=self.user.username, password="secret"))
+        self.assertEqual(client.get("/api/events/").status_code, 200)
+
+
+@override_settings(DATABASE_SHARDS=["default", "shard"], SHARD_MOVE_GRACE=0)
+class TestMoveTenant(TransactionTestCase):
+    # Includes the shard added by `setUpClass`.
+    databases = "__all__"
+
+    @classmethod
+    def setUpClass(cls):
+        # A second SQLite database, migrated like a new shard would be.
+        cls.directory = tempfile.TemporaryDirectory()
+        connections.databases["shard"] = {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": f"{cls.directory.name}/shard.sqlite3",
+        }
+        super().setUpClass()
+        call_command("migrate", database="shard", verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections["shard"].close()
+        del connections.databases["shard"]
+        cls.directory.cleanup()
+
+    def setUp(self):
+        self.tenant_id = uuid.uuid4()
+        TenantShard.objects.create(tenant_id=self.tenant_id, alias="default")
+        self.user = UserFactory(company_id=self.tenant_id)
+        self.location = LocationFactory(manager=self.user)
+        for day in range(3):
+            MeetingFactory(
+                owner=self.user,
+                location=self.location,
+                start=datetime(2020, 11, 27 + day, tzinfo=pytz.utc),
+                end=datetime(2020, 11, 27 + day, 1, tzinfo=pytz.utc),
+            ).participant_list.set([self.user])
+        ArchivedMeeting.objects.create(
+            id=uuid.uuid4(),
+            tenant_id=self.tenant_id,
+            owner=self.user,
+            event_name="Archived",
+            meeting_agenda="Agenda",
+            start=datetime(2019, 1, 1, tzinfo=pytz.utc),
+            end=datetime(2019, 1, 1, 1, tzinfo=pytz.utc),
+        ).participant_list.set([self.user])
+        TenantVersion.objects.current(self.tenant_id)
+        other = uuid.uuid4()
+        TenantShard.objects.create(tenant_id=other, alias="default")
+        self.other = MeetingFactory(
+            owner=UserFactory(company_id=other),
+            location=LocationFactory(manager=UserFactory(company_id=other)),
+        )
+
+    def counts(self, alias):
+        through = Meeting.participant_list.through
+        return {
+            "users": APIUser.objects.using(alias)
+            .filter(company_id=self.tenant_id)
+            .count(),
+            "rooms": Location.objects.using(alias)
+            .filter(tenant_id=self.tenant_id)
+            .count(),
+            "meetings": Meeting.objects.using(alias)
+            .filter(tenant_id=self.tenant_id)
+            .count(),
+            "participations": through.objects.using(alias)
+            .filter(meeting__tenant_id=self.tenant_id)
+            .count(),
+            "archived": ArchivedMeeting.objects.using(alias)
+            .filter(tenant_id=self.tenant_id)
+            .count(),
+            "versions": TenantVersion.objects.using(alias)
+            .filter(tenant_id=self.tenant_id)
+            .count(),
+        }
+
+    def move(self, target="shard"):
+        call_command(
+            "movetenant",
+            str(self.tenant_id),
+            target,
+            "--batch-size=2",
+            stdout=io.StringIO(),
+        )
+
+    def test_moves_rows_and_routing(self):
+        before = self.counts("default")
+        self.assertEqual(
+            before,
+            {
+                "users": 1,
+                "rooms": 1,
+                "meetings": 3,
+                "participations": 3,
+                "archived": 1,
+                "versions": 1,
+            },
+        )
+        self.move()
+
+        self.assertEqual(self.counts("shard"), before)
+        self.assertEqual(set(self.counts("default").values()), {0})
+        self.assertEqual(Meeting.objects.using("default").get(), self.other)
+        self.assertEqual(
+            TenantShard.objects.get(tenant_id=self.tenant_id).alias, "shard"
+        )
+
+        client = APIClient()
+        client.force_login(APIUser.objects.using("shard").get(pk=self.user.pk))
+        response = client.get("/api/events/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 3)
+        response = client.post(
+            "/api/events/",
+            {
+                "event_name": "After the move",
+                "meeting_agenda": "Agenda",
+                "start": "2020-12-01T10:00:00Z",
+                "end": "2020-12-01T11:00:00Z",
+                "participant_list": [self.user.email],
+                "location": str(self.location.id),
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.counts("shard")["meetings"], 4)
+        self.assertEqual(self.counts("default")["meetings"], 0)
+
+    def test_routing_without_tenant_in_session(self):
+        self.user.set_password("secret")
+        self.user.save()
+        self.move()
+
+        basic = APIClient()
+        credentials = base64.b64encode(f"{self.user.username}:secret".encode())
+        basic.credentials(HTTP_AUTHORIZATION=f"Basic {credentials.decode()}")
+        # Logged in before sharding was enabled.
+        legacy = APIClient()
+        legacy.force_login(APIUser.objects.using("shard").get(pk=self.user.pk))
+        session = legacy.session
+        del session[sharding.TENANT_SESSION_KEY]
+        session.save()
+        for name, client in [("basic", basic), ("session", legacy)]:
+            with self.subTest(name):
+                response = client.get("/api/events/")
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.json()), 3)
+        self.assertEqual(
+            legacy.session[sharding.TENANT_SESSION_KEY], str(self.tenant_id)
+        )
+
+        TenantShard.objects.filter(tenant_id=self.tenant_id).update(frozen=True)
+        self.assertEqual(basic.get("/api/events/").status_code, 200)
+        response = basic.post("/api/events/", {}, format="json")
+        self.assertEqual(response.status_code, 503)
+
+    def test_refuses_tenant_sharing_meetings(self):
+        Meeting.objects.get(pk=self.other.pk).participant_list.add(self.user)
+        with self.assertRaisesMessage(
+            CommandError, "1 in api_meeting_participant_list"
+        ):
+            self.move()
+        self.assertEqual(set(self.counts("shard").values()), {0})
+        self.assertEqual(self.counts("default")["meetings"], 3)
+
+
+class TestArchive(TestCase):
+    def setUp(self):
+        self.user = UserFactory.create()
+        self.client = APIClient()
+        self.client.force_login(self.user)
+        location = LocationFactory.create(manager=self.user)
+        old = datetime(2020, 1, 6, 9, tzinfo=pytz.utc)
+        self.meetings = [
+            MeetingFactory.create(
+                owner=self.user,
+                location=location,
+                start=old + timedelta(days=index),
+                end=old + timedelta(days=index, hours=1),
+            )
+            for index in range(3)
+        ]
+        self.meetings += [
+            MeetingFactory.create(
+                owner=self.user,
+                location=None,
+                start=old,
+                end=old + timedelta(hours=1),
+                recurrence="RRULE:FREQ=WEEKLY;COUNT=4",
+            ),
+            MeetingFactory.create(
+                owner=self.user,
+                location=None,
+                start=old,
+                end=old + timedelta(hours=1),
+                recurrence="RRULE:FREQ=WEEKLY",
+            ),
+            MeetingFactory.create(owner=self.user, location=location),
+        ]
+        for meeting in self.meetings:
+            meeting.participant_list.add(self.user, UserFactory.create())
+
+    def archive(self):
+        output = io.StringIO()
+        call_command(
+            "archivemeetings",
+            "--before=2020-06-01T00:00:00Z",
+            "--batch-size=2",
+            stdout=output,
+        )
+        return output.getvalue()
+
+    def test_past_meetings_are_moved_with_participants(self):
+        self.assertIn("Archived 4 meetings", self.archive())
+        self.assertEqual(
+            set(Meeting.objects.values_list("id", flat=True)),
+            {self.meetings[4].id, self.meetings[5].id},
+        )
+        self.assertEqual(ArchivedMeeting.objects.count(), 4)
+        self.assertEqual(ArchivedMeeting.participant_list.through.objects.count(), 8)
+        self.assertEqual(
+            TenantArchive.objects.get(tenant_id=self.user.company_id).cutoff,
+            datetime(2020, 6, 1, tzinfo=pytz.utc),
+        )
+        # Resumed or repeated runs find nothing left to move.
+        self.assertIn("Archived 0 meetings", self.archive())
+
+    def collect_pages(self):
+        ids, url, data = [], "/api/events/", {"page_size": 2}
+        while url:
+            page = self.client.get(url, data=data).json()
+            ids.extend(event["id"] for event in page["results"])
+            url, data = page["next"], None
+        return ids
+
+    def test_lists_include_archive(self):
+        before = self.client.get("/api/events/").json()
+        pages_before = self.collect_pages()
+        self.archive()
+        after = self.client.get("/api/events/").json()
+        self.assertEqual(
+            sorted(before, key=lambda event: event["id"]),
+            sorted(after, key=lambda event: event["id"]),
+        )
+        # Pages merge both tables in `(start, id)` order.
+        self.assertEqual(self.collect_pages(), pages_before)
+
+        response = self.client.get(
+            "/api/events/", data={"query": self.meetings[1].event_name}
+        )
+        self.assertEqual(
+            [event["id"] for event in response.json()], [str(self.meetings[1].id)]
+        )
+
+    def test_reads_of_past_windows_include_archive(self):
+        window = {"from": "2020-01-01T00:00:00Z", "to": "2020-01-31T00:00:00Z"}
+        feed_url = f"/api/feeds/{ical.feed_token(self.user)}.ics"
+
+        def read():
+            feed = b"".join(self.client.get(feed_url).streaming_content).decode()
+            return [
+                b"".join(
+                    self.client.get(
+                        "/api/events/export/", data={**window, "output": output}
+                    ).streaming_content
+                )
+                for output in ["ndjson", "csv"]
+            ] + [
+                self.client.get("/api/events/occurrences/", data=window).json(),
+                self.client.get("/api/events/freebusy/", data=window).json(),
+                self.client.get(
+                    "/api/rooms/availability/", data={**window, "duration": "01:00"}
+                ).json(),
+                # Stamped with the time it is generated.
+                [line for line in feed.splitlines() if not line.startswith("DTSTAMP")],
+            ]
+
+        before = read()
+        self.assertEqual(len(before[2]), 11)
+        self.archive()
+        self.assertEqual(read(), before)
+
+    def test_archived_events_read_and_changed(self):
+        urls = [f"/api/events/{meeting.id}/" for meeting in self.meetings[:3]]
+        before = self.client.get(urls[0]).json()
+        self.archive()
+
+        self.assertEqual(self.client.get(urls[0]).json(), before)
+        event = self.client.get(urls[1]).json()
+        event.update(event_name="Renamed", location=event["location"]["id"])
+        response = self.client.put(urls[1], event, format="json")
+        self.assertEqual(response.status_code, 200)
+        meeting = Meeting.objects.get(id=self.meetings[1].id)
+        self.assertEqual(meeting.event_name, "Renamed")
+        self.assertEqual(meeting.participant_list.count(), 2)
+        self.assertEqual(self.client.delete(urls[2]).status_code, 204)
+        self.assertFalse(Meeting.objects.filter(id=self.meetings[2].id).exists())
+        self.assertEqual(
+            set(ArchivedMeeting.objects.values_list("id", flat=True)),
+            {self.meetings[0].id, self.meetings[3].id},
+        )
+        self.assertEqual(ArchivedMeeting.participant_list.through.objects.count(), 4)
+
+        self.client.force_login(UserFactory.create())
+        self.assertEqual(self.client.get(urls[0]).status_code, 404)
+
+    def test_recent_windows_skip_archive(self):
+        self.archive()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                "/api/events/", data={"from": "2020-11-01T00:00:00Z"}
+            )
+        self.assertEqual(len(response.json()), 2)
+        self.assertFalse(
+            any("api_archivedmeeting" in query["sql"] for query in queries)
+        )
+
+        response = self.client.get("/api/events/", data={"day": "2020-01-07"})
+        self.assertEqual(
+            [event["id"] for event in response.json()], [str(self.meetings[1].id)]
+        )
+
+
+class TestInstrumentation(TestCase):
+    def setUp(self):
+        caches["default"].clear()
+        instrumentation.metrics.reset()
+        self.user = UserFactory.create()
+        self.client = APIClient()
+        self.client.force_login(self.user)
+        self.meeting = MeetingFactory.create(owner=self.user)
+        self.meeting.participant_list.set([self.user])
+
+    def server_timing(self, response):
+        entries = response["Server-Timing"].split(", ")
+        return {entry.split(";")[0]: entry for entry in entries}
+
+    @override_settings(API_LIST_CACHE="default")
+    def test_server_timing(self):
+        queries = []
+
+        def count(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            response = self.client.get("/api/events/")
+        timing = self.server_timing(response)
+        self.assertEqual(list(timing), ["db", "serialize", "render", "total"])
+        self.assertIn(f'desc="{len(queries)} queries"', timing["db"])
+
+        # Cached lists are neither serialized nor rendered again.
+        response = self.client.get("/api/events/")
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(list(self.server_timing(response)), ["db", "total"])
+
+    def test_metrics_per_view(self):
+        self.client.get("/api/events/")
+        self.client.get(f"/api/events/{self.meeting.id}/")
+        self.client.get(f"/api/events/{self.meeting.id}/")
+        self.client.get(f"/api/rooms/{uuid.uuid4()}/")
+
+        self.client.force_login(UserFactory.create(is_staff=True))
+        response = self.client.get("/metrics")
+        self.assertEqual(
+            response["Content-Type"], "text/plain; version=0.0.4; charset=utf-8"
+        )
+        metrics = response.content.decode()
+        self.assertIn("# TYPE api_request_duration_seconds histogram", metrics)
+        for line in [
+            'api_request_duration_seconds_count{view="EventsView.retrieve"} 2',
+            'api_request_duration_seconds_bucket{view="EventsView.retrieve",le="+Inf"} 2',
+            'api_request_duration_seconds_count{view="RoomsView.retrieve"} 1',
+            'api_request_phase_duration_seconds_count{view="EventsView.list",phase="render"} 1',
+            'api_request_queries_count{view="EventsView.list"} 1',
+        ]:
+            self.assertIn(line, metrics)
+
+    def test_histogram_buckets(self):
+        histogram = instrumentation.Histogram([1, 5])
+        for value in [0, 1, 3, 7]:
+            histogram.observe(value)
+        self.assertEqual(list(histogram.samples()), [(1, 2), (5, 3), ("+Inf", 4)])
+        self.assertEqual((histogram.sum, histogram.count), (11, 4))
+
+    def test_nested_serializers_timed_once(self):
+        timings = instrumentation.state.timings = instrumentation.Timings()
+        try:
+            with mock.patch("time.perf_counter", side_effect=[0, 1, 10, 20]):
+                with instrumentation.phase("serialize"):
+                    with instrumentation.phase("serialize"):
+                        pass
+                with instrumentation.phase("render"):
+                    pass
+        finally:
+            instrumentation.state.timings = None
+        self.assertEqual(timings.phases, {"db": 0, "serialize": 1, "render": 10})
+
+    def test_phases_exclude_queries(self):
+        timings = instrumentation.state.timings = instrumentation.Timings()
+        try:
+            with mock.patch("time.perf_counter", side_effect=[0, 10]):
+                with instrumentation.phase("serialize"):
+                    timings.add("db", 4)
+        finally:
+            instrumentation.state.timings = None
+        self.assertEqual(timings.phases, {"db": 4, "serialize": 6, "render": 0})
+
+    def test_streamed_body_observed_once_sent(self):
+        response = self.client.get("/api/events/export/")
+        self.assertNotIn("EventsView.export", instrumentation.metrics.exposition())
+        before = int(self.server_timing(response)["db"].split('desc="')[1].split()[0])
+
+        queries = []
+
+        def count(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            b"".join(response.streaming_content)
+        self.assertTrue(queries)
+        self.assertIn(
+            'api_request_queries_sum{view="EventsView.export"} '
+            f"{before + len(queries)}\n",
+            instrumentation.metrics.exposition(),
+        )
+
+    def test_metrics_for_staff_only(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        self.client.logout()
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        self.client.force_login(UserFactory.create(is_staff=True))
+        self.assertEqual(self.client.get("/metrics").status_code, 200)
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_metrics_token(self):
+        client = APIClient()
+        self.assertEqual(client.get("/metrics").status_code, 401)
+        response = client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, 200)
+
+
+class TestBenchmarkCommands(TransactionTestCase):
+    # The async views read committed data from thread pool connections.
+    def test_generated_data_is_consistent(self):
+        output = io.StringIO()
+        call_command(
+            "generatedata",
+            "--tenants=2",
+            "--users=20",
+            "--rooms=4",
+            "--meetings=200",
+            "--start=2020-11-02",
+            stdout=output,
+        )
+        self.assertIn("Generated 2 companies", output.getvalue())
+        self.assertEqual(APIUser.objects.values("company_id").distinct().count(), 2)
+        self.assertFalse(
+            Meeting.objects.exclude(tenant_id=F("owner__company_id")).exists()
+        )
+        self.assertFalse(
+            Meeting.objects.exclude(location=None)
+            .exclude(location__tenant_id=F("tenant_id"))
+            .exists()
+        )
+        self.assertFalse(
+            Meeting.participant_list.through.objects.exclude(
+                apiuser__company_id=F("meeting__tenant_id")
+            ).exists()
+        )
+
+    def test_benchmark_needs_a_visible_meeting(self):
+        owner = UserFactory.create()
+        MeetingFactory.create(owner=owner, location=LocationFactory(manager=owner))
+        # The busiest user only takes part in another company's meeting.
+        busiest = UserFactory.create()
+        MeetingFactory.create(
+            owner=UserFactory(company_id=uuid.uuid4())
+        ).participant_list.set([busiest])
+        with self.assertRaisesMessage(CommandError, "sees no meetings"):
+            call_command(
+                "benchmarkapi", f"--tenant={owner.company_id}", stdout=io.StringIO()
+            )
+        idle = UserFactory.create(company_id=uuid.uuid4())
+        with self.assertRaisesMessage(CommandError, "has no meetings"):
+            call_command(
+                "benchmarkapi", f"--tenant={idle.company_id}", stdout=io.StringIO()
+            )
+
+    def test_benchmark_compares_with_baseline(self):
+        call_command(
+            "generatedata", "--tenants=1", "--meetings=100", stdout=io.StringIO()
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            results = f"{directory}/results.json"
+            output = io.StringIO()
+            call_command(
+                "benchmarkapi", "--repeat=1", f"--save={results}", stdout=output
+            )
+            with open(results) as results_file:
+                self.assertIn("events week", json.load(results_file)["cases"])
+            call_command(
+                "benchmarkapi",
+                "--repeat=1",
+                "--only=rooms",
+                f"--baseline={results}",
+                "--tolerance=100",
+                stdout=output,
+            )
+            self.assertIn("rooms availability week", output.getvalue())
@@ -1,8 +1,47 @@
 from datetime import timedelta
+import pytz
 from rest_framework.serializers import ValidationError
+from api.recurrence import WEEKLY, RecurrenceRule
 
+MAX_MEETING_LENGTH = timedelta(hours=8)
 
-def validate_meeting_length(meeting):
-    meeting_length = meeting["end"] - meeting["start"]
-    if meeting_length > timedelta(hours=8):
+
+def validate_meeting_length(meeting, serializer):
+    # Partial updates keep the saved value of the fields they omit.
+    start = meeting.get("start", getattr(serializer.instance, "start", None))
+    end = meeting.get("end", getattr(serializer.instance, "end", None))
+    meeting_length = end - start
+    if meeting_length > MAX_MEETING_LENGTH:
         raise ValidationError("Meetings shouldn’t be longer than 8 hours.")
+
+
+validate_meeting_length.requires_context = True
+
+
+def validate_recurrence(recurrence):
+    if recurrence:
+        try:
+            RecurrenceRule.parse(recurrence)
+        except ValueError as exc:
+            raise ValidationError(str(exc))
+
+
+def validate_first_occurrence(meeting, serializer):
+    # iCalendar clients count the start as an occurrence whatever the rule, so
+    # weekly rules must include its weekday in the owner's timezone.
+    recurrence = meeting.get(
+        "recurrence", getattr(serializer.instance, "recurrence", "")
+    )
+    if not recurrence:
+        return
+    start = meeting.get("start", getattr(serializer.instance, "start", None))
+    rule = RecurrenceRule.parse(recurrence)
+    owner = serializer.context["request"].user
+    weekday = start.astimezone(pytz.timezone(owner.timezone)).weekday()
+    if rule.freq == WEEKLY and rule.byday and weekday not in rule.byday:
+        raise ValidationError(
+            {"recurrence": ["BYDAY must include the weekday of the start."]}
+        )
+
+
+validate_first_occurrence.requires_context = True
@@ -1,41 +1,426 @@
-from rest_framework import viewsets, filters
-from django_filters.rest_framework import DjangoFilterBackend, FilterSet, DateFilter
-from api.serializers import EventSerializer, RoomSerializer
-from api.models import Meeting, Location
+from datetime import datetime, time, timedelta
+from itertools import chain
+from django.conf import settings
+from django.db.models import BooleanField, Value
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.crypto import constant_time_compare
+from django.utils.http import http_date
+from django.utils.timezone import make_aware
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.generics import get_object_or_404
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from django_filters.rest_framework import (
+    DjangoFilterBackend,
+    FilterSet,
+    DateFilter,
+    IsoDateTimeFilter,
+)
+from api.archive import ArchiveUnion, reaches_archive, restore
+from api.bulk import save_events
+from api.caching import EVENTS, ROOMS, ListCacheMixin, TenantETagMixin
+from api.export import EXPORT_FORMATS, export_rows
+from api.ical import calendar_lines, feed_token, feed_user
+from api.instrumentation import RenderTimingMixin, metrics
+from api.intervals import clip, gaps
+from api.search import FullTextSearchFilter
+from api.sharding import shard_of
+from api.recurrence import expand
+from api.scheduling import (
+    SERIES_COLUMNS,
+    busy_intervals,
+    find_common_slots,
+    location_busy_intervals,
+    off_hours,
+    rooms_busy_intervals,
+)
+from api.serializers import (
+    AvailabilitySerializer,
+    EventRowSerializer,
+    EventSerializer,
+    FreeBusySerializer,
+    RoomSerializer,
+    SchedulingSerializer,
+    TimeWindowSerializer,
+    datetime_formatter,
+)
+from api.models import ArchivedMeeting, Meeting, Location, TenantVersion
+from api.pagination import MeetingPagination, LocationPagination
 
 
 class EventFilter(FilterSet):
-    day = DateFilter(field_name="start", lookup_expr="exact", label="Day")
+    day = DateFilter(method="filter_day", label="Day")
+    from_ = IsoDateTimeFilter(method="filter_from", label="From")
+    to = IsoDateTimeFilter(method="filter_to", label="To")
 
     class Meta:
         model = Meeting
         fields = ["location_id", "day"]
 
+    def filter_day(self, queryset, name, value):
+        """Meetings starting on the day in the current timezone, series expanded."""
+        day_start = make_aware(datetime.combine(value, time.min))
+        day_end = make_aware(datetime.combine(value + timedelta(days=1), time.min))
+        return queryset.occurring(day_start, day_end, starting=True)
 
-class EventsView(viewsets.ModelViewSet):
+    def filter_from(self, queryset, name, value):
+        # Bounded windows are filtered at once, see `MeetingQuerySet.occurring`.
+        return queryset.occurring(value, self.form.cleaned_data.get("to"))
+
+    def filter_to(self, queryset, name, value):
+        if self.form.cleaned_data.get("from") is not None:
+            return queryset
+        return queryset.starts_before(value)
+
+    def window_start(self):
+        """Moment listed meetings end after, `None` if the window is unbounded."""
+        data = self.form.cleaned_data
+        if data.get("from") is not None:
+            return data["from"]
+        if data.get("day") is not None:
+            return make_aware(datetime.combine(data["day"], time.min))
+        return None
+
+
+# `from` is a keyword, so the filter is declared as `from_` and renamed here.
+EventFilter.base_filters["from"] = EventFilter.base_filters.pop("from_")
+
+
+class EventsView(
+    TenantETagMixin, ListCacheMixin, RenderTimingMixin, viewsets.ModelViewSet
+):
     serializer_class = EventSerializer
-    filter_backends = [filters.SearchFilter, DjangoFilterBackend]
+    filter_backends = [FullTextSearchFilter, DjangoFilterBackend]
     search_fields = ["event_name", "meeting_agenda"]
     filterset_class = EventFilter
+    pagination_class = MeetingPagination
+    cache_scope = EVENTS
+    visibility_per_user = True
 
     def get_queryset(self):
         """Restrict view to tenants, participants and location owners."""
-        tenant_meetings = Meeting.objects.filter(
-            owner__company_id=self.request.user.company_id
+        visible = Meeting.objects.visible_to(self.request.user)
+        return self.get_serializer_class().setup_eager_loading(visible)
+
+    def get_object(self):
+        """Fall back to archived meetings, moved back before they are changed."""
+        try:
+            return super().get_object()
+        except Http404:
+            if not reaches_archive(self.request.user.company_id, None):
+                raise
+            archived = self.get_serializer_class().setup_eager_loading(
+                ArchivedMeeting.objects.visible_to(self.request.user)
+            )
+            meeting = get_object_or_404(archived, pk=self.kwargs["pk"])
+            if self.action == "retrieve":
+                return meeting
+        restore(meeting.pk)
+        return super().get_object()
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action == "list":
+            # Lists are rendered from `values()` rows, see `get_serializer`.
+            queryset = EventRowSerializer.setup_queryset(queryset)
+        if self.action in ["list", "export"]:
+            archived = self.get_archived_meetings()
+            if archived is not None:
+                queryset = ArchiveUnion(queryset, archived)
+        return queryset
+
+    def get_archived_meetings(self):
+        """Matching archived meetings, `None` if the window doesn't reach them."""
+        filterset = self.filterset_class(
+            self.request.query_params,
+            queryset=self.get_serializer_class().setup_eager_loading(
+                ArchivedMeeting.objects.visible_to(self.request.user)
+            ),
+            request=self.request,
+        )
+        # Checked first: filtering the window already queries series.
+        window_start = filterset.is_valid() and filterset.window_start()
+        if not reaches_archive(self.request.user.company_id, window_start or None):
+            return None
+        archived = filterset.qs
+        for backend in self.filter_backends:
+            if backend is not DjangoFilterBackend:
+                archived = backend().filter_queryset(self.request, archived, self)
+        if self.action == "list":
+            return EventRowSerializer.setup_queryset(archived).annotate(
+                archived=Value(True, output_field=BooleanField())
+            )
+        return archived
+
+    def get_serializer(self, *args, **kwargs):
+        if self.action == "list" and kwargs.get("many"):
+            return EventRowSerializer(*args)
+        return super().get_serializer(*args, **kwargs)
+
+    @action(detail=False, methods=["post"])
+    def bulk(self, request):
+        """Create or replace many events, reporting errors per item."""
+        results = save_events(request, request.data)
+        failed = any(result["status"] == 400 for result in results)
+        return Response(
+            results,
+            status=status.HTTP_207_MULTI_STATUS if failed else status.HTTP_200_OK,
+        )
+
+    @action(detail=False)
+    def export(self, request):
+        """Stream filtered events as NDJSON or CSV (`output` parameter)."""
+        # `format` is taken by DRF's format suffixes.
+        output = request.query_params.get("output", "ndjson")
+        if output not in EXPORT_FORMATS:
+            raise ValidationError(
+                {"output": [f"Choose one of: {', '.join(EXPORT_FORMATS)}."]}
+            )
+        content_type, render = EXPORT_FORMATS[output]
+        rows = export_rows(
+            self.filter_queryset(self.get_queryset()), self.get_serializer_context()
+        )
+        response = StreamingHttpResponse(render(rows), content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="events.{output}"'
+        return response
+
+    @action(detail=False, methods=["get", "post"])
+    def feed(self, request):
+        """
+        URL of the requester's iCalendar subscription feed. POST replaces it,
+        revoking the previous URL.
+        """
+        if request.method == "POST":
+            request.user.rotate_feed_secret()
+        url = reverse("calendar-feed", args=[feed_token(request.user)])
+        return Response({"url": request.build_absolute_uri(url)})
+
+    @action(detail=False)
+    def freebusy(self, request):
+        """Merged busy intervals of tenant users (by default the requester)."""
+        params = FreeBusySerializer(
+            data=request.query_params, context={"request": request}
+        )
+        params.is_valid(raise_exception=True)
+        data = params.validated_data
+        users = data.get("user") or [request.user]
+
+        by_user = busy_intervals(
+            request.user.company_id,
+            [user.id for user in users],
+            data["from"],
+            data["to"],
+        )
+        to_representation = datetime_formatter()
+        return Response(
+            [
+                {
+                    "user": user.email,
+                    "busy": [
+                        {
+                            "start": to_representation(start),
+                            "end": to_representation(end),
+                        }
+                        for start, end in clip(
+                            by_user[user.id], data["from"], data["to"]
+                        )
+                    ],
+                }
+                for user in users
+            ]
+        )
+
+    @action(detail=False)
+    def occurrences(self, request):
+        """Filtered events within `from`/`to`, series expanded, by start."""
+        params = TimeWindowSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        window_start, window_end = (
+            params.validated_data["from"],
+            params.validated_data["to"],
         )
-        participate_in = tenant_meetings.filter(
-            participant_list__in=[self.request.user]
+        columns = [*SERIES_COLUMNS, "id", "event_name", "recurrence"]
+        meetings = (
+            self.filter_queryset(self.get_queryset())
+            .prefetch_related(None)
+            .values_list(*columns)
         )
-        is_location_manager = tenant_meetings.filter(
-            location__manager=self.request.user
+        archived = self.get_archived_meetings()
+        if archived is not None:
+            meetings = chain(
+                meetings, archived.prefetch_related(None).values_list(*columns)
+            )
+        to_representation = datetime_formatter()
+        return Response(
+            [
+                {
+                    "id": str(meeting_id),
+                    "event_name": event_name,
+                    "start": to_representation(start),
+                    "end": to_representation(end),
+                    "recurring": bool(recurrence),
+                }
+                for start, end, meeting_id, event_name, recurrence in sorted(
+                    expand(meetings, window_start, window_end),
+                    key=lambda row: (row[0], row[2]),
+                )
+            ]
         )
-        filtered = participate_in | is_location_manager
-        return filtered.distinct()
 
+    @action(detail=False, methods=["post"])
+    def schedule(self, request):
+        """Earliest slots in which all participants and the location are free."""
+        params = SchedulingSerializer(data=request.data, context={"request": request})
+        params.is_valid(raise_exception=True)
+        data = params.validated_data
+        window_start, window_end = data["from"], data["to"]
 
-class RoomsView(viewsets.ModelViewSet):
+        participants = data["participant_list"]
+        by_user = busy_intervals(
+            request.user.company_id,
+            [participant.id for participant in participants],
+            window_start,
+            window_end,
+        )
+        busy = list(by_user.values())
+        if "working_hours_start" in data:
+            busy.extend(
+                off_hours(
+                    participant.timezone,
+                    window_start,
+                    window_end,
+                    data["working_hours_start"],
+                    data["working_hours_end"],
+                )
+                for participant in participants
+            )
+        if data.get("location") is not None:
+            busy.append(
+                location_busy_intervals(data["location"], window_start, window_end)
+            )
+
+        slots = find_common_slots(
+            busy,
+            window_start,
+            window_end,
+            data["duration"],
+            data["count"],
+            data["granularity"],
+        )
+        to_representation = datetime_formatter()
+        return Response(
+            [
+                {"start": to_representation(start), "end": to_representation(end)}
+                for start, end in slots
+            ]
+        )
+
+
+class RoomsView(
+    TenantETagMixin, ListCacheMixin, RenderTimingMixin, viewsets.ModelViewSet
+):
     serializer_class = RoomSerializer
+    pagination_class = LocationPagination
+    cache_scope = ROOMS
 
     def get_queryset(self):
         """Restrict view to tenants."""
-        return Location.objects.filter(manager__company_id=self.request.user.company_id)
+        tenant_locations = Location.objects.filter(
+            tenant_id=self.request.user.company_id
+        )
+        return self.get_serializer_class().setup_eager_loading(tenant_locations)
+
+    @action(detail=False)
+    def availability(self, request):
+        """Free slots of at least `duration` per room within `from`/`to`."""
+        params = AvailabilitySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        data = params.validated_data
+        window_start, window_end, duration = data["from"], data["to"], data["duration"]
+
+        rooms = self.get_queryset().order_by("name", "id")
+        if "room" in data:
+            rooms = rooms.filter(id__in=data["room"])
+
+        busy = rooms_busy_intervals(
+            request.user.company_id, rooms, window_start, window_end
+        )
+
+        to_representation = datetime_formatter()
+        return Response(
+            [
+                {
+                    "id": str(room_id),
+                    "name": name,
+                    "free": [
+                        {
+                            "start": to_representation(start),
+                            "end": to_representation(end),
+                        }
+                        for start, end in gaps(
+                            busy.get(room_id, []), window_start, window_end, duration
+                        )
+                    ],
+                }
+                for room_id, name in rooms.values_list("id", "name")
+            ]
+        )
+
+
+class CalendarFeedView(RenderTimingMixin, APIView):
+    """iCalendar feed of the events visible to the user owning the token."""
+
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def get(self, request, token):
+        user = feed_user(token)
+        if user is None:
+            raise NotFound()
+
+        # Every write in the tenant bumps its version, so an unchanged version
+        # is answered with 304 before any meeting is read.
+        shard = shard_of(user)
+        version = TenantVersion.objects.db_manager(shard).current(user.company_id)
+        etag = f'"{user.company_id}-{version.version}"'
+        last_modified = int(version.changed_at.timestamp())
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            archived = None
+            if reaches_archive(user.company_id, None, using=shard):
+                archived = ArchivedMeeting.objects.using(shard).visible_to(user)
+            response = StreamingHttpResponse(
+                calendar_lines(
+                    Meeting.objects.using(shard).visible_to(user), user.email, archived
+                ),
+                content_type="text/calendar; charset=utf-8",
+            )
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        response["Cache-Control"] = "private, no-cache"
+        return response
+
+
+def metrics_view(request):
+    """
+    Request metrics of this process in the Prometheus text format, for the
+    bearer of ``METRICS_TOKEN`` or, when none is set, logged in staff.
+    """
+    token = getattr(settings, "METRICS_TOKEN", None)
+    if token is None:
+        if not request.user.is_staff:
+            return HttpResponse(status=403)
+    elif not constant_time_compare(
+        request.headers.get("Authorization", ""), f"Bearer {token}"
+    ):
+        return HttpResponse(status=401)
+    return HttpResponse(
+        metrics.exposition(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -9,7 +9,7 @@ https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+from api.asynchronous import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tango_calendar.settings")
 
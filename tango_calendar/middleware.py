@@ -1,15 +1,275 @@
-from django.utils.timezone import activate, deactivate, get_current_timezone_name
+import asyncio
+from datetime import tzinfo
+from functools import lru_cache
+import uuid
+import pytz
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.http import JsonResponse
+from django.utils.timezone import activate, deactivate
+from api import instrumentation, sharding
+from tango_calendar.routers import PIN_COOKIE, choose_replica, get_replicas, state
+
+
+@lru_cache(maxsize=None)
+def get_timezone(name):
+    """Return the tzinfo of a timezone name, built once per process."""
+    return pytz.timezone(name)
+
+
+class LazyTimezone(tzinfo):
+    """
+    Timezone resolved from `resolve()` the first time it is used.
+
+    Delegates to the resolved pytz timezone, including `localize` and
+    `normalize`, so it can be activated before the user is known.
+    """
+
+    def __init__(self, resolve):
+        self._resolve = resolve
+        self._timezone = None
+
+    @property
+    def timezone(self):
+        if self._timezone is None:
+            self._timezone = get_timezone(self._resolve())
+        return self._timezone
+
+    def utcoffset(self, dt):
+        return self.timezone.utcoffset(dt and dt.replace(tzinfo=None))
+
+    def dst(self, dt):
+        return self.timezone.dst(dt and dt.replace(tzinfo=None))
+
+    def tzname(self, dt):
+        return self.timezone.tzname(dt and dt.replace(tzinfo=None))
+
+    def fromutc(self, dt):
+        return self.timezone.fromutc(dt.replace(tzinfo=self.timezone))
+
+    def __getattr__(self, name):
+        return getattr(self.timezone, name)
+
+    def __repr__(self):
+        return f"<LazyTimezone {self.timezone!r}>"
 
 
 class TimezoneAwareMiddleware:
-    """Activate user timezone"""
+    """
+    Activate user timezone
+
+    The user, and with it the session, is only loaded once a datetime is
+    converted, so requests rendering no datetimes skip it. Under ASGI the
+    middleware runs natively async; the timezone must then be resolved in
+    synchronous code, as it may query the database.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Let Django call this middleware as a coroutine function.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        activate(LazyTimezone(lambda: user_timezone(request)))
+        try:
+            return self.get_response(request)
+        finally:
+            deactivate()
+
+    async def __acall__(self, request):
+        activate(LazyTimezone(lambda: user_timezone(request)))
+        try:
+            return await self.get_response(request)
+        finally:
+            deactivate()
+
+
+def user_timezone(request):
+    return getattr(request.user, "timezone", settings.TIME_ZONE)
+
+
+class ReplicaMiddleware:
+    """
+    Read from a database replica on safe requests.
+
+    A client that wrote to the primary is pinned to it with a cookie for
+    ``DATABASE_REPLICA_STICKINESS`` seconds, so it always reads its own writes.
+    """
+
+    sync_capable = True
+    async_capable = True
+    safe_methods = ["GET", "HEAD", "OPTIONS"]
 
     def __init__(self, get_response):
         self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
 
     def __call__(self, request):
-        tz = getattr(request.user, "timezone", get_current_timezone_name())
-        activate(tz)
-        response = self.get_response(request)
-        deactivate()
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        self.route(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = self.reset()
+        return self.pin(response, wrote)
+
+    async def __acall__(self, request):
+        self.route(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            wrote = self.reset()
+        return self.pin(response, wrote)
+
+    def route(self, request):
+        safe = request.method in self.safe_methods
+        pinned = PIN_COOKIE in request.COOKIES
+        state.replica = choose_replica() if safe and not pinned else None
+        state.wrote = False
+
+    def reset(self):
+        wrote = state.wrote
+        state.replica, state.wrote = None, False
+        return wrote
+
+    def pin(self, response, wrote):
+        if wrote and get_replicas():
+            response.set_cookie(
+                PIN_COOKIE,
+                "1",
+                max_age=getattr(settings, "DATABASE_REPLICA_STICKINESS", 5),
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
+
+
+class ShardMiddleware:
+    """
+    Route the request to the shard of the logged in user's company.
+
+    Unsafe requests of a tenant being moved between shards are refused with
+    ``503 Service Unavailable`` until the move completes.
+    """
+
+    sync_capable = True
+    async_capable = True
+    safe_methods = ["GET", "HEAD", "OPTIONS"]
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        refused = self.route(request)
+        if refused is not None:
+            return refused
+        try:
+            return self.get_response(request)
+        finally:
+            sharding.state.shard = None
+
+    async def __acall__(self, request):
+        # The session and the directory are read from the database.
+        refused = await sync_to_async(self.route)(request)
+        if refused is not None:
+            return refused
+        try:
+            return await self.get_response(request)
+        finally:
+            sharding.state.shard = None
+
+    def route(self, request):
+        sharding.state.shard = None
+        if not sharding.sharding_enabled():
+            return None
+        tenant_id = request.session.get(sharding.TENANT_SESSION_KEY)
+        if tenant_id is None:
+            tenant_id = self.session_tenant(request)
+            if tenant_id is None:
+                return None
+        entry = sharding.pin_tenant(uuid.UUID(tenant_id))
+        if (
+            entry is not None
+            and entry.frozen
+            and request.method not in self.safe_methods
+        ):
+            response = JsonResponse(
+                {"detail": sharding.TenantMoving.default_detail}, status=503
+            )
+            response["Retry-After"] = settings.SHARD_MOVE_GRACE
+            return response
+        return None
+
+    def session_tenant(self, request):
+        """Company of the session's user, for sessions from before sharding."""
+        user_id = request.session.get(SESSION_KEY)
+        if user_id is None:
+            return None
+        user = sharding.find_user(pk=user_id)
+        if user is None:
+            return None
+        request.session[sharding.TENANT_SESSION_KEY] = str(user.company_id)
+        return str(user.company_id)
+
+
+class InstrumentationMiddleware:
+    """
+    Time requests, their queries, serialization and rendering.
+
+    Timings are sent in a ``Server-Timing`` header and added to the histograms
+    of the view exposed on ``/metrics``. Goes first, so the other middleware is
+    timed too.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        timings = instrumentation.state.timings = instrumentation.Timings()
+        try:
+            response = self.get_response(request)
+        finally:
+            instrumentation.state.timings = None
+        return self.report(request, response, timings)
+
+    async def __acall__(self, request):
+        # Queries run in the thread pool see the timings through the context.
+        timings = instrumentation.state.timings = instrumentation.Timings()
+        try:
+            response = await self.get_response(request)
+        finally:
+            instrumentation.state.timings = None
+        return self.report(request, response, timings)
+
+    def report(self, request, response, timings):
+        timings.finish()
+        # Sent before a streamed body, whose generation it leaves out.
+        response["Server-Timing"] = timings.server_timing()
+        view = instrumentation.view_name(request)
+        if response.streaming:
+            response.streaming_content = instrumentation.timed_stream(
+                response.streaming_content, timings, view
+            )
+        else:
+            instrumentation.metrics.observe(view, timings)
         return response
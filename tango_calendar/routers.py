@@ -0,0 +1,51 @@
+"""
+Routing of reads to replicas of the ``default`` database.
+
+`ReplicaMiddleware` picks a replica from ``DATABASE_REPLICAS`` for each safe
+request, and `ReplicaRouter` sends that request's reads to it. Writes, reads
+within transactions and reads of clients that wrote recently go to
+``default``.
+"""
+
+import random
+from asgiref.local import Local
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Cookie pinning a client that wrote to the primary.
+PIN_COOKIE = "primary_pin"
+
+# Replica of the current request, and whether it wrote to the primary.
+state = Local()
+
+
+def get_replicas():
+    return getattr(settings, "DATABASE_REPLICAS", [])
+
+
+def choose_replica():
+    """Return a replica alias, `None` when no replicas are configured."""
+    replicas = get_replicas()
+    return random.choice(replicas) if replicas else None
+
+
+def current_replica():
+    """Alias of the replica serving the current request, `None` if it has none."""
+    return getattr(state, "replica", None)
+
+
+def pinned(request):
+    """Whether the client wrote recently, so it must not see stale data."""
+    return bool(get_replicas()) and PIN_COOKIE in request.COOKIES
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replica = getattr(state, "replica", None)
+        if replica is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return replica
+
+    def db_for_write(self, model, **hints):
+        state.wrote = True
+        return None
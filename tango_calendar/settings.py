@@ -39,12 +39,15 @@ INSTALLED_APPS = [
     "django.contrib.staticfiles",
     "rest_framework",
     "django_filters",
-    "api",
+    "api.apps.ApiConfig",
 ]
 
 MIDDLEWARE = [
+    "tango_calendar.middleware.InstrumentationMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "tango_calendar.middleware.ReplicaMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
+    "tango_calendar.middleware.ShardMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
@@ -84,6 +87,44 @@ DATABASES = {
     }
 }
 
+DATABASE_ROUTERS = [
+    "api.sharding.ShardRouter",
+    "tango_calendar.routers.ReplicaRouter",
+]
+
+# Aliases holding the tenants' calendar data, see `api.sharding`.
+DATABASE_SHARDS = ["default"]
+
+# Seconds a tenant move waits for writes in flight before switching shards.
+SHARD_MOVE_GRACE = 5
+
+# Meetings ended this many days ago are moved to the archive by `archivemeetings`.
+MEETING_ARCHIVE_DAYS = 90
+
+# Aliases of read replicas of `default` serving safe requests.
+DATABASE_REPLICAS = []
+
+# Seconds a client reads from `default` after writing to it.
+DATABASE_REPLICA_STICKINESS = 5
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+
+# Cache alias and timeout (seconds) of rendered list responses. Disabled when
+# `None`; the cache must be shared by every worker, e.g. Redis or Memcached.
+API_LIST_CACHE = None
+API_LIST_CACHE_TIMEOUT = 300
+
+# Bearer token required to read `/metrics`; only staff can read it when `None`.
+METRICS_TOKEN = None
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -105,6 +146,8 @@ AUTH_PASSWORD_VALIDATORS = [
 
 AUTH_USER_MODEL = "api.APIUser"
 
+AUTHENTICATION_BACKENDS = ["api.sharding.ShardModelBackend"]
+
 # Internationalization
 # https://docs.djangoproject.com/en/3.1/topics/i18n/
 
@@ -127,6 +170,21 @@ STATIC_URL = "/static/"
 # Django Rest Framework
 REST_FRAMEWORK = {
     "DEFAULT_FILTER_BACKENDS": ["django_filters.rest_framework.DjangoFilterBackend"],
+    # Basic authentication routes the request to the user's shard.
+    "DEFAULT_AUTHENTICATION_CLASSES": [
+        "rest_framework.authentication.SessionAuthentication",
+        "api.sharding.ShardBasicAuthentication",
+    ],
+    # orjson based, falling back to the stdlib when orjson is not installed.
+    "DEFAULT_RENDERER_CLASSES": [
+        "api.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "api.parsers.FastJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
     "SEARCH_PARAM": "query",
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
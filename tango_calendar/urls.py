@@ -13,10 +13,12 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework import routers
-from api.views import EventsView, RoomsView
+from api.asynchronous import async_view
+from api.views import CalendarFeedView, EventsView, RoomsView, metrics_view
 
 api_router = routers.SimpleRouter()
 api_router.register("api/events", EventsView, basename="event")
@@ -24,5 +26,27 @@ api_router.register("api/rooms", RoomsView, basename="room")
 
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("metrics", metrics_view, name="metrics"),
     path("api/", include("rest_framework.urls")),
+    path("api/feeds/<str:token>.ics", CalendarFeedView.as_view(), name="calendar-feed"),
+    path(
+        "api/async/events/",
+        async_view(EventsView, {"get": "list"}),
+        name="async-event-list",
+    ),
+    path(
+        "api/async/events/<uuid:pk>/",
+        async_view(EventsView, {"get": "retrieve"}),
+        name="async-event-detail",
+    ),
+    path(
+        "api/async/rooms/",
+        async_view(RoomsView, {"get": "list"}),
+        name="async-room-list",
+    ),
+    path(
+        "api/async/rooms/<uuid:pk>/",
+        async_view(RoomsView, {"get": "retrieve"}),
+        name="async-room-detail",
+    ),
 ] + api_router.urls